@@ -0,0 +1,131 @@
+import random
+import sys
+import time
+import tracemalloc
+from array import array
+
+# ユーザーごとの経済データ（所持金・日次報酬の受け取り回数・最終受取日・最終強奪日）を列ごとの配列で持つ表
+# user_id -> 行番号 の辞書を1つだけ持ち、各列は型付きの配列なので、1ユーザーあたりの追加のオブジェクトは
+# 辞書の1エントリ（とuser_idとint）だけで済む（以前は4つの辞書にそれぞれエントリを持っていた）
+# 日付はJSTの日付序数で、未設定はNO_DAY（スナップショットの形式と同じ）
+NO_DAY = 0
+
+# ==============================================================================================
+
+class Accounts:
+    __slots__ = ("rows", "balance", "daily_count", "last_daily", "last_rob")
+
+    def __init__(self):
+        self.rows = {}                 # user_id -> 行番号
+        self.balance = array("q")      # 所持金
+        self.daily_count = array("I")  # 日次報酬の受け取り回数
+        self.last_daily = array("i")   # 日次報酬の最終受取日
+        self.last_rob = array("i")     # 最後に強奪を実行した日
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, user_id):
+        return user_id in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    # 行番号を返す（なければ作る）
+    def row(self, user_id):
+        row = self.rows.get(user_id)
+        if row is None:
+            row = self.rows[user_id] = len(self.balance)
+            self.balance.append(0)
+            self.daily_count.append(0)
+            self.last_daily.append(NO_DAY)
+            self.last_rob.append(NO_DAY)
+        return row
+
+    # (user_id, 所持金, 受け取り回数, 最終受取日, 最終強奪日) で1行を置き換える（日付の未設定はNone）
+    def put(self, record):
+        user_id, balance, daily_count, last_daily, last_rob = record
+        row = self.row(user_id)
+        self.balance[row] = balance
+        self.daily_count[row] = daily_count
+        self.last_daily[row] = NO_DAY if last_daily is None else last_daily
+        self.last_rob[row] = NO_DAY if last_rob is None else last_rob
+
+    def record(self, user_id):
+        row = self.rows.get(user_id)
+        if row is None:
+            return None
+        last_daily = self.last_daily[row]
+        last_rob = self.last_rob[row]
+        return (
+            user_id, self.balance[row], self.daily_count[row],
+            None if last_daily == NO_DAY else last_daily,
+            None if last_rob == NO_DAY else last_rob
+        )
+
+    def records(self):
+        for user_id in self.rows:
+            yield self.record(user_id)
+
+    def balance_of(self, user_id, default=None):
+        row = self.rows.get(user_id)
+        return default if row is None else self.balance[row]
+
+    # (user_id, 所持金) の並び
+    def balances(self):
+        balance = self.balance
+        return ((user_id, balance[row]) for user_id, row in self.rows.items())
+
+# ==============================================================================================
+
+# ベンチマーク: 以前の4つの辞書（所持金・受け取り回数・最終受取日・最終強奪日）と比べた
+# 1ユーザーあたりのメモリ使用量と、/daily・/rob のクールダウン確認（最終日が今日かどうか）の速度
+def benchmark(users=100_000, checks=1_000_000, rng=random.Random(1)):
+    today = 739_000
+    user_ids = [rng.getrandbits(60) for _ in range(users)]
+    records = [
+        (user_id, rng.randint(-500, 50_000), rng.randint(0, 300), today - rng.randint(0, 30), today - rng.randint(0, 30))
+        for user_id in user_ids
+    ]
+
+    # 値のintオブジェクトも辞書ごとに持つ（DBから読み込んだ場合と同じ）ため、計測中に作り直す
+    tracemalloc.start()
+    balances, daily_count, last_daily, last_rob = {}, {}, {}, {}
+    for user_id, balance, count, daily, rob in records:
+        balances[user_id] = -(-balance)
+        daily_count[user_id] = -(-count)
+        last_daily[user_id] = -(-daily)
+        last_rob[user_id] = -(-rob)
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    accounts = Accounts()
+    for record in records:
+        accounts.put(record)
+    array_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    queries = [rng.choice(user_ids) for _ in range(checks)]
+    start = time.perf_counter()
+    dict_hits = sum(1 for user_id in queries if last_daily.get(user_id) == today or last_rob.get(user_id) == today)
+    dict_rate = checks / (time.perf_counter() - start)
+
+    rows, daily_days, rob_days = accounts.rows, accounts.last_daily, accounts.last_rob
+    start = time.perf_counter()
+    array_hits = 0
+    for user_id in queries:
+        row = rows.get(user_id)
+        if row is not None and (daily_days[row] == today or rob_days[row] == today):
+            array_hits += 1
+    array_rate = checks / (time.perf_counter() - start)
+    assert dict_hits == array_hits
+
+    # user_idのintオブジェクトは計測前に作っているため、どちらの計測にも含まれない
+    print(f"{users:,} users")
+    print(f"  four dicts: {dict_bytes / users:6.1f} bytes/user, {dict_rate:,.0f} cooldown checks/sec")
+    print(f"  accounts:   {array_bytes / users:6.1f} bytes/user, {array_rate:,.0f} cooldown checks/sec")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
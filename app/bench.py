@@ -0,0 +1,367 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+from types import SimpleNamespace
+
+# スラッシュコマンドのベンチマーク（Discordに接続せず、fakes.py の代用品でコマンドを直接呼ぶ）
+# サーバーの人数ごとに、コマンドごとの処理速度（コマンド/秒）と処理時間の中央値・99パーセンタイルを測り、
+# 保存しておいた基準値より遅くなったコマンドを報告する（1つでもあれば終了コード1）
+# 使い方: python app/bench.py --sizes 100,1000,10000,100000 --iterations 1000 [--save-baseline]
+# --stress を指定すると、代わりに同時実行の負荷テストを行う（下の stress() を参照）
+# --rest-calls を指定すると、コマンドごとのDiscordへのREST呼び出し数を数える（下の rest_calls() を参照）
+# （リポジトリにpytestのテストはないため、これらの確認はこのスクリプトで実行する）
+
+# main.py を読み込む前に、台帳を一時ディレクトリに向ける（本番のDBを書き換えない）
+_workdir = tempfile.mkdtemp(prefix="bench-")
+os.environ["LEDGER_PATH"] = os.path.join(_workdir, "economy.db")
+for _name in ("LEDGER_SHARED", "SHARD_COUNT", "SHARD_IDS", "HTTP_SERVER"):
+    os.environ.pop(_name, None)
+
+from discord import app_commands
+
+import main
+from cards import Hand
+from fakes import FakeGuild, FakeInteraction, FakeTextChannel, Recorder
+from rng import replay_shoe
+from rules import (
+    BLACKJACK_DRAW_PAYOUT,
+    BLACKJACK_NATURAL_PAYOUT,
+    BLACKJACK_WIN_PAYOUT,
+    DEALER_STAND_VALUE,
+    ROULETTE_COLUMNS,
+    ROULETTE_TABLE,
+)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+COMMANDS = ("daily", "give", "rob", "balance", "balance_all", "roulette", "roulette_bets", "blackjack", "hit", "stand")
+ROULETTE_OPTIONS = [
+    app_commands.Choice(name="Even", value="even"),
+    app_commands.Choice(name="Small (1-12)", value="small"),
+    app_commands.Choice(name="Number", value="number"),
+]
+ROULETTE_BETS = "even 10, number 7 5, large 20, second 10"  # 1回のスピンにまとめる賭け
+NOT_TODAY = 1  # 日次報酬・強奪の制限を解除するために記録する日（日付序数）
+
+# ==============================================================================================
+
+# 1つのサーバーでコマンドを順に呼ぶ
+class Scenario:
+    def __init__(self, size, latency=0.0):
+        self.recorder = Recorder(latency, keep=False)
+        self.guild = FakeGuild(self.recorder, size)
+        self.humans = [member for member in self.guild.members if not member.bot]
+        self.channel = self.guild.channel()
+        self.samples = {command: [] for command in COMMANDS}
+
+    def interaction(self, user, channel=None):
+        return FakeInteraction(self.recorder, user, self.guild, channel or self.channel)
+
+    # sample: 記録する名前（同じコマンドを別の使い方で測る場合）
+    async def call(self, command, interaction, *args, record=True, sample=None, **kwargs):
+        callback = getattr(main, command).callback
+        start = time.perf_counter()
+        await callback(interaction, *args, **kwargs)
+        elapsed = time.perf_counter() - start
+        if not interaction.sent:
+            raise AssertionError(f"/{command} did not respond")
+        if record:
+            self.samples[sample or command].append(elapsed)
+
+    # i回目の呼び出し（ユーザーを順に替え、/daily と /rob は今日の分を使っていない状態にしてから呼ぶ）
+    async def step(self, i, record=True):
+        user = self.humans[i % len(self.humans)]
+        other = self.humans[(i + 1) % len(self.humans)]
+
+        main.ledger.record_daily(user.id, NOT_TODAY)
+        await self.call("daily", self.interaction(user), record=record)
+        await self.call("give", self.interaction(user), other, 1, record=record)
+        main.ledger.record_rob(user.id, NOT_TODAY)
+        await self.call("rob", self.interaction(user), record=record)
+        await self.call("balance", self.interaction(user), None, record=record)
+        await self.call("balance_all", self.interaction(user), i % 5 + 1, record=record)
+        option = ROULETTE_OPTIONS[i % len(ROULETTE_OPTIONS)]
+        await self.call("roulette", self.interaction(user), "10", option, i % 37, record=record)
+        await self.call("roulette", self.interaction(user), bets=ROULETTE_BETS, record=record, sample="roulette_bets")
+
+        # ブラックジャックは毎回新しいチャンネルで始め、ヒットしてからスタンドする
+        table = FakeTextChannel(self.recorder, self.guild)
+        await self.call("blackjack", self.interaction(user, table), "10", record=record)
+        if table.id in main.blackjack_games:
+            await self.call("hit", self.interaction(user, table), record=record)
+        if table.id in main.blackjack_games:
+            await self.call("stand", self.interaction(user, table), record=record)
+
+    async def run(self, iterations):
+        # 初回だけの処理（ランキング・強奪対象の索引の作成など）は計測に含めない
+        await self.step(0, record=False)
+        for i in range(1, iterations + 1):
+            await self.step(i)
+        # まとめて送られるチャンネルへのメッセージを送り終えるまで待つ
+        await asyncio.sleep(main.outbox.window * 2)
+
+
+def percentile(sorted_samples, fraction):
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * fraction))]
+
+
+def summarize(samples):
+    results = {}
+    for command, times in samples.items():
+        if not times:
+            continue
+        times = sorted(times)
+        results[command] = {
+            "rate": len(times) / sum(times),
+            "p50": percentile(times, 0.50),
+            "p99": percentile(times, 0.99),
+        }
+    return results
+
+# ----------------------------------------------------------------------------------------------
+
+# 基準値と比べて、処理速度が (1 - tolerance) 倍未満か、99パーセンタイルが (1 + tolerance) 倍を超えたら遅くなったとみなす
+def compare(result, base, tolerance):
+    if base is None:
+        return ""
+    problems = []
+    if result["rate"] < base["rate"] * (1 - tolerance):
+        problems.append(f"rate {result['rate'] / base['rate'] - 1:+.0%}")
+    if result["p99"] > base["p99"] * (1 + tolerance):
+        problems.append(f"p99 {result['p99'] / base['p99'] - 1:+.0%}")
+    if problems:
+        return "REGRESSION " + ", ".join(problems)
+    return f"ok ({result['rate'] / base['rate'] - 1:+.0%})"
+
+
+def report(size, results, baseline, tolerance):
+    regressions = 0
+    print(f"{size:,} members")
+    print(f"  {'command':<14} {'cmds/sec':>10} {'p50 (us)':>10} {'p99 (us)':>10}  vs baseline")
+    for command, result in results.items():
+        verdict = compare(result, baseline.get(str(size), {}).get(command), tolerance)
+        regressions += verdict.startswith("REGRESSION")
+        print(f"  {command:<14} {result['rate']:>10,.0f} {result['p50'] * 1e6:>10.1f} {result['p99'] * 1e6:>10.1f}  {verdict}")
+    return regressions
+
+
+async def run(sizes, iterations, latency):
+    main.ledger.start()
+    main.blackjack_games.start()
+    results = {}
+    for size in sizes:
+        scenario = Scenario(size, latency)
+        await scenario.run(iterations)
+        results[size] = summarize(scenario.samples)
+    await main.ledger.flush()
+    return results
+
+
+# ==============================================================================================
+
+# 負荷テスト: 少人数のユーザーで実際のコマンド（/give, /rob, /roulette, /blackjack, /hit, /stand, /double_down）を
+# 大量に同時実行し（送信のたびにlatency秒待つので、コマンドの途中で他のコマンドが割り込む）、
+# コインの総量の変化がゲームの結果だけで説明できることを確認する
+# ゲームの結果はコマンドとは別に、乱数の記録（ルーレットのポケット・ブラックジャックのシュー）から計算し直す
+# （送金と強奪はユーザー間の移動なので総量を変えない。日次報酬はコインを増やすので含めない）
+async def stress(commands, users, latency):
+    main.ledger.start()
+    main.blackjack_games.start()
+    recorder = Recorder(latency, keep=False)
+    guild = FakeGuild(recorder, users)
+    humans = [member for member in guild.members if not member.bot]
+    channel = guild.channel()
+    for user in humans:
+        main.provision(user, guild)
+    before = sum(main.ledger.balance(user.id) for user in humans)
+
+    tables = {}  # チャンネルID -> (賭け金, ダブルダウンしたか, ヒットしたか)
+    rng = main.game_rng.stream("stress")
+    main.game_rng.recent = deque()  # 全ゲームの記録を残す
+
+    def interaction(user, target=None):
+        return FakeInteraction(recorder, user, guild, target or channel)
+
+    async def play_blackjack(user, amount, action):
+        table = FakeTextChannel(recorder, guild)
+        await main.blackjack.callback(interaction(user, table), str(amount))
+        doubled = hit = False
+        if action == 0 and table.id in main.blackjack_games:
+            attempt = interaction(user, table)
+            await main.double_down.callback(attempt)
+            doubled = not attempt.sent[-1][1].get("ephemeral")
+        elif action == 1 and table.id in main.blackjack_games:
+            await main.hit.callback(interaction(user, table))
+            hit = True
+        if table.id in main.blackjack_games:
+            await main.stand.callback(interaction(user, table))
+        tables[table.id] = (amount, doubled, hit)
+
+    async def rob(user):
+        main.ledger.record_rob(user.id, NOT_TODAY)
+        await main.rob.callback(interaction(user))
+
+    flows = []
+    for _ in range(commands):
+        user, other = humans[rng.below(len(humans))], humans[rng.below(len(humans))]
+        amount = rng.randint(1, 1500)
+        kind = rng.below(5)
+        if kind == 0:
+            flows.append(main.give.callback(interaction(user), other, amount))
+        elif kind == 1:
+            flows.append(rob(user))
+        elif kind == 2:
+            option = ROULETTE_OPTIONS[rng.below(len(ROULETTE_OPTIONS))]
+            flows.append(main.roulette.callback(interaction(user), str(amount), option, rng.below(37)))
+        elif kind == 3:
+            flows.append(main.roulette.callback(interaction(user), bets=f"even {amount}, {rng.below(37)} {amount // 10 + 1}"))
+        else:
+            flows.append(play_blackjack(user, amount, rng.below(3)))
+
+    start = time.perf_counter()
+    await asyncio.gather(*flows)
+    elapsed = time.perf_counter() - start
+    await main.ledger.flush()
+
+    # 乱数の記録からゲームごとの損益を計算し直す
+    expected = 0
+    for entry in main.game_rng.recent:
+        if entry["game"] == "roulette":
+            row = ROULETTE_TABLE[entry["pocket"]]
+            expected += sum(amount * row[ROULETTE_COLUMNS[bet]] - amount for bet, amount in entry["bets"])
+        elif entry["game"] == "blackjack":
+            expected += referee(entry, *tables[entry["channel_id"]])
+
+    after = sum(main.ledger.balance(user.id) for user in humans)
+    leftover = [table for table in tables if table in main.blackjack_games]
+    print(f"{commands:,} overlapping commands over {len(humans)} users in {elapsed:.2f} s")
+    print(f"total coins: before={before:,} after={after:,} game results={expected:+,}")
+    assert after - before == expected, "total coins changed by more than the game results"
+    assert not leftover, f"blackjack games left open: {leftover}"
+    print("OK: coins conserved across give/rob and every payout matches the recorded game")
+
+
+# REST呼び出し数: 実際のコマンドを呼び、ハンドラーが送ったメッセージの数（1通ずつ送る場合のREST呼び出し数）と、
+# 送信キューでまとめた後の実際のREST呼び出し数（インタラクションへの応答・チャンネルへの送信・リアクションなど）を比べる
+async def rest_calls(repeat=20):
+    main.ledger.start()
+    main.blackjack_games.start()
+    recorder = Recorder(keep=False)
+    guild = FakeGuild(recorder, 20)
+    humans = [member for member in guild.members if not member.bot]
+    channels = {}
+    main.bot.get_channel = channels.get  # 偽のチャンネルをボットのキャッシュの代わりに引く
+
+    def channel():
+        target = FakeTextChannel(recorder, guild)
+        channels[target.id] = target
+        return target
+
+    async def rob(user, target):
+        main.ledger.record_rob(user.id, NOT_TODAY)
+        await main.rob.callback(FakeInteraction(recorder, user, guild, target))
+
+    async def roulette(user, target):
+        for option in ROULETTE_OPTIONS:
+            await main.roulette.callback(FakeInteraction(recorder, user, guild, target), "10", option, 7)
+
+    async def roulette_bets(user, target):
+        await main.roulette.callback(FakeInteraction(recorder, user, guild, target), bets="even 10, small 10, number 7 10")
+
+    # 募集・3人の参加・開始（手番の通知のDMチャンネルは作成済みとする）
+    async def multi_bj(user, target):
+        interaction = FakeInteraction(recorder, user, guild, target)
+        await main.multi_bj.callback(interaction, "10")
+        message = await interaction.original_response()
+        for player in [user] + humans[1:4]:
+            main.dm_channels.setdefault(player.id, FakeTextChannel(recorder))
+        for player in humans[1:4]:
+            payload = SimpleNamespace(member=player, user_id=player.id, message_id=message.id, channel_id=target.id, emoji="🎮")
+            await main.on_raw_reaction_add(payload)
+        game = main.blackjack_games.pop(target.id, None)
+        if game is not None:
+            game.cancel()
+
+    scenarios = {
+        "/rob": rob,
+        f"/roulette x{len(ROULETTE_OPTIONS)}": roulette,
+        "/roulette bets (3 bets)": roulette_bets,
+        "/multi_bj + 3 joins": multi_bj,
+    }
+    print(f"{'command':<26} {'messages':>9} {'REST calls':>11}  (per call, average of {repeat})")
+    for name, scenario in scenarios.items():
+        before = sum(recorder.counts.values()), dict(recorder.counts), main.outbox.counters["queued"]
+        for i in range(repeat):
+            await scenario(humans[i % len(humans)], channel())
+            await asyncio.sleep(main.outbox.window * 2)  # まとめて送られるのを待つ
+        counts = {kind: count - before[1].get(kind, 0) for kind, count in recorder.counts.items()}
+        queued = main.outbox.counters["queued"] - before[2]
+        sends = counts.get("send", 0)
+        calls = sum(recorder.counts.values()) - before[0]
+        messages = calls - sends + queued  # チャンネルへの送信を1通ずつ行った場合
+        print(f"{name:<26} {messages / repeat:>9.1f} {calls / repeat:>11.1f}")
+
+
+# ブラックジャックの記録から配札をやり直し、シングルプレイヤーのルールで損益を求める
+def referee(entry, amount, doubled, hit):
+    shoe = replay_shoe(entry)
+    player = Hand((shoe.deal(), shoe.deal()))
+    dealer = Hand((shoe.deal(), shoe.deal()))
+    if player.value == 21:
+        return amount * BLACKJACK_DRAW_PAYOUT - amount if dealer.value == 21 else int(amount * BLACKJACK_NATURAL_PAYOUT) - amount
+    if doubled:
+        amount *= 2
+    if doubled or hit:
+        player.add(shoe.deal())
+        if player.value > 21:
+            return -amount
+    while dealer.value < DEALER_STAND_VALUE:
+        dealer.add(shoe.deal())
+    if dealer.value > 21 or player.value > dealer.value:
+        return amount * BLACKJACK_WIN_PAYOUT - amount
+    if player.value == dealer.value:
+        return amount * BLACKJACK_DRAW_PAYOUT - amount
+    return -amount
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark slash commands offline against fake Discord objects.")
+    parser.add_argument("--sizes", default="100,1000,10000,100000", help="comma-separated guild sizes")
+    parser.add_argument("--iterations", type=int, default=1000, help="calls per command and guild size")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per Discord REST call")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed slowdown before flagging a regression")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--stress", type=int, metavar="COMMANDS", help="run this many overlapping commands and check coin conservation")
+    parser.add_argument("--users", type=int, default=50, help="guild size for --stress")
+    parser.add_argument("--rest-calls", action="store_true", help="count Discord REST calls per command")
+    args = parser.parse_args()
+
+    if args.rest_calls:
+        asyncio.run(rest_calls())
+        sys.exit(0)
+
+    if args.stress:
+        asyncio.run(stress(args.stress, args.users, args.latency or 0.001))
+        sys.exit(0)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = asyncio.run(run(sizes, args.iterations, args.latency))
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = sum(report(size, results[size], baseline, args.tolerance) for size in sizes)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({str(size): result for size, result in results.items()}, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif not baseline:
+        print("No baseline to compare against (run with --save-baseline to store one)")
+    sys.exit(1 if regressions else 0)
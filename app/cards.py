@@ -0,0 +1,186 @@
+import random
+import time
+
+from rules import SHOE_DECKS, SHOE_PENETRATION
+
+# カードは0～51の整数で表す: スート番号 * 13 + ランク番号
+# （スート: ♠, ♥, ♦, ♣ / ランク: 2～10, J, Q, K, A）
+SUITS = ['♠', '♥', '♦', '♣']
+RANKS = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
+
+# カードごとの点数と表示名をあらかじめ計算しておく
+CARD_VALUES = tuple(min(rank + 2, 10) if rank < 12 else 11 for suit in range(4) for rank in range(13))
+CARD_NAMES = tuple(f"{rank}{suit}" for suit in SUITS for rank in RANKS)
+DECK = bytes(range(52))
+
+# ==============================================================================================
+
+def card_name(card):
+    return CARD_NAMES[card]
+
+# ----------------------------------------------------------------------------------------------
+
+# ブラックジャックの手札
+# カードを1枚加えるごとに合計点と11として数えているAの枚数をO(1)で更新し、毎回の再計算を不要にする
+class Hand:
+    __slots__ = ("cards", "value", "soft_aces")
+
+    def __init__(self, cards=()):
+        self.cards = []
+        self.value = 0       # 手札の点数
+        self.soft_aces = 0   # 11として数えているAの枚数
+        for card in cards:
+            self.add(card)
+
+    def add(self, card):
+        self.cards.append(card)
+        points = CARD_VALUES[card]
+        value = self.value + points
+        soft_aces = self.soft_aces + (points == 11)
+        # Aを1として扱う場合の調整
+        while value > 21 and soft_aces:
+            value -= 10
+            soft_aces -= 1
+        self.value = value
+        self.soft_aces = soft_aces
+        return value
+
+    @property
+    def is_soft(self):
+        return self.soft_aces > 0
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __getitem__(self, index):
+        return self.cards[index]
+
+    def __iter__(self):
+        return iter(self.cards)
+
+    # 表示用の文字列（表示する時だけ作る）
+    def __str__(self):
+        return ", ".join([CARD_NAMES[card] for card in self.cards])
+
+# ----------------------------------------------------------------------------------------------
+
+# 複数デッキをまとめたシュー（チャンネルごとに1つ作り、ゲームをまたいで使い回す）
+# カードは確保済みのバッファに並べたまま位置を進めて配り、ペネトレーションを超えた時だけシャッフルし直す
+class Shoe:
+    __slots__ = ("cards", "cursor", "cut", "round_start", "rng")
+
+    def __init__(self, decks=SHOE_DECKS, penetration=SHOE_PENETRATION, rng=random):
+        self.cards = bytearray(DECK * decks)
+        self.cut = int(len(self.cards) * penetration)  # この位置まで配ったら次のゲームの前にシャッフルする
+        self.rng = rng
+        self.shuffle()
+
+    def shuffle(self):
+        self.rng.shuffle(self.cards)
+        self.cursor = 0
+        self.round_start = 0
+
+    # ゲームの開始時に呼ぶ（ペネトレーションを超えていればシャッフルし直す）
+    def start_round(self):
+        if self.cursor >= self.cut:
+            self.shuffle()
+        self.round_start = self.cursor
+
+    def deal(self):
+        if self.cursor >= len(self.cards):
+            self._reshuffle_discards()
+        card = self.cards[self.cursor]
+        self.cursor += 1
+        return card
+
+    # ゲームの途中で使い切った場合は、場に出ているカードを残して捨て札だけをシャッフルして補充する
+    def _reshuffle_discards(self):
+        if self.round_start == 0:
+            raise RuntimeError("The shoe ran out of cards in a single round.")
+        in_play = self.cards[self.round_start:]
+        discards = self.cards[:self.round_start]
+        self.rng.shuffle(discards)
+        self.cards[:] = in_play + discards
+        self.cursor = len(in_play)
+        self.round_start = 0
+
+    # まだ配られていないカード
+    def remaining(self):
+        return self.cards[self.cursor:]
+
+    def __len__(self):
+        return len(self.cards) - self.cursor
+
+# ==============================================================================================
+
+# ベンチマーク: 文字列のカードで毎回手札全体を計算する方式と比較する
+def _string_hand_value(hand):
+    value = 0
+    aces = 0
+    for card in hand:
+        rank = card[:-1]
+        if rank in ['J', 'Q', 'K']:
+            value += 10
+        elif rank == 'A':
+            value += 11
+            aces += 1
+        else:
+            value += int(rank)
+    while value > 21 and aces:
+        value -= 10
+        aces -= 1
+    return value
+
+
+def benchmark(hands=200_000):
+    orders = [random.sample(range(52), 10) for _ in range(1000)]
+
+    # 文字列版: 1枚引くたびに手札全体を解析し直す（ディーラーの17未満ヒットと同じ流れ）
+    string_orders = [[CARD_NAMES[card] for card in order] for order in orders]
+    start = time.perf_counter()
+    for i in range(hands):
+        order = string_orders[i % 1000]
+        hand = [order[0], order[1]]
+        position = 2
+        while _string_hand_value(hand) < 17:
+            hand.append(order[position])
+            position += 1
+    string_rate = hands / (time.perf_counter() - start)
+
+    # 整数版: 1枚ごとに合計点を差分で更新する
+    start = time.perf_counter()
+    for i in range(hands):
+        order = orders[i % 1000]
+        hand = Hand((order[0], order[1]))
+        position = 2
+        while hand.value < 17:
+            hand.add(order[position])
+            position += 1
+    int_rate = hands / (time.perf_counter() - start)
+
+    print(f"string cards:  {string_rate:>12,.0f} hands/sec")
+    print(f"integer cards: {int_rate:>12,.0f} hands/sec ({int_rate / string_rate:.1f}x)")
+
+    # ゲームごとに52枚のデッキを作ってシャッフルする方式とシューから配る方式を比較する（1ゲーム6枚）
+    start = time.perf_counter()
+    for _ in range(hands):
+        deck = bytearray(DECK)
+        random.shuffle(deck)
+        for _ in range(6):
+            deck.pop()
+    fresh_rate = hands / (time.perf_counter() - start)
+
+    shoe = Shoe()
+    start = time.perf_counter()
+    for _ in range(hands):
+        shoe.start_round()
+        for _ in range(6):
+            shoe.deal()
+    shoe_rate = hands / (time.perf_counter() - start)
+
+    print(f"fresh deck:    {fresh_rate:>12,.0f} games/sec")
+    print(f"shoe:          {shoe_rate:>12,.0f} games/sec ({shoe_rate / fresh_rate:.1f}x)")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,211 @@
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+# コマンドの利用回数の制限（クールダウン・クォータ）
+#   CalendarQuota: 指定したタイムゾーンの1日（0時で切り替わる）ごとにlimit回まで（/daily, /rob）
+#   RollingQuota:  直近window秒の間にlimit回まで（キーごとに直近limit回の利用時刻だけを持ち、最も古いものと比べる）
+# どちらも acquire(key) で確認と消費を同時に行い、使えた場合は0、使えない場合は次に使えるまでの秒数を返す
+# 古い記録は期間（日・window秒）ごとの辞書にまとめて持ち、期間が過ぎたら辞書ごと捨てる（1件ずつ消さない）
+
+_tz_name = os.getenv("COOLDOWN_TIMEZONE")
+if _tz_name:
+    from zoneinfo import ZoneInfo
+    COOLDOWN_TZ = ZoneInfo(_tz_name)
+else:
+    COOLDOWN_TZ = timezone(timedelta(hours=+9))  # 日本時間
+
+# ==============================================================================================
+
+# 日ごとの利用回数をメモリに持つ記録（当日分の辞書だけを残し、日付が変わったら前日分を丸ごと捨てる）
+class DayCounts:
+    def __init__(self):
+        self.day = None
+        self.counts = {}  # key -> 当日の利用回数
+
+    def _roll(self, day):
+        if day != self.day:
+            self.day = day
+            self.counts = {}
+
+    def count(self, key, day):
+        self._roll(day)
+        return self.counts.get(key, 0)
+
+    def add(self, key, day):
+        self._roll(day)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def __len__(self):
+        return len(self.counts)
+
+
+# 台帳に保存している「最後に使った日」を記録として使う（再起動しても残る。1日1回の制限のみ）
+class LedgerDays:
+    def __init__(self, last_day, record):
+        self.last_day = last_day  # last_day(key) -> 最後に使った日（日付序数）またはNone
+        self.record = record      # record(key, day)
+
+    def count(self, key, day):
+        return 1 if self.last_day(key) == day else 0
+
+    def add(self, key, day):
+        self.record(key, day)
+
+# ----------------------------------------------------------------------------------------------
+
+class CalendarQuota:
+    def __init__(self, limit=1, tz=COOLDOWN_TZ, store=None):
+        if store is not None and not isinstance(store, DayCounts) and limit != 1:
+            raise ValueError("a day store only records one use per day")
+        self.limit = limit
+        self.tz = tz
+        self.store = DayCounts() if store is None else store
+
+    # 指定時刻（UNIX時刻）の日付序数
+    def day(self, now=None):
+        return datetime.fromtimestamp(time.time() if now is None else now, self.tz).date().toordinal()
+
+    # 次の0時までの秒数
+    def until_reset(self, now=None):
+        now = time.time() if now is None else now
+        today = datetime.fromtimestamp(now, self.tz).date()
+        midnight = datetime.combine(today + timedelta(days=1), datetime.min.time(), self.tz)
+        return max(0.0, midnight.timestamp() - now)
+
+    # 使わずに確認だけする
+    def check(self, key, now=None):
+        if self.store.count(key, self.day(now)) < self.limit:
+            return 0.0
+        return self.until_reset(now)
+
+    def acquire(self, key, now=None):
+        day = self.day(now)
+        if self.store.count(key, day) >= self.limit:
+            return self.until_reset(now)
+        self.store.add(key, day)
+        return 0.0
+
+    def remaining(self, key, now=None):
+        return max(0, self.limit - self.store.count(key, self.day(now)))
+
+# ----------------------------------------------------------------------------------------------
+
+class RollingQuota:
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = float(window)
+        self._generation = None
+        self._current = {}   # key -> 直近limit回の利用時刻（古い順のタプル）。現在の期間に書き込んだもの
+        self._previous = {}  # 1つ前の期間に書き込んだもの
+
+    # window秒ごとに期間を切り替え、2つ前の期間の記録を丸ごと捨てる
+    # （期間内に書き込んだ記録の利用時刻はすべてその期間内なので、2期間後には必ずwindow秒より前になっている）
+    def _rotate(self, now):
+        generation = int(now // self.window)
+        if generation != self._generation:
+            if self._generation is not None and generation == self._generation + 1:
+                self._previous = self._current
+            else:
+                self._previous = {}
+            self._current = {}
+            self._generation = generation
+
+    def _uses(self, key, now):
+        self._rotate(now)
+        uses = self._current.get(key)
+        if uses is None:
+            uses = self._previous.get(key, ())
+        return uses
+
+    # 直近limit回のうち最も古い利用がwindow秒より前になるまでの秒数
+    def _wait(self, uses, now):
+        if len(uses) < self.limit:
+            return 0.0
+        return max(0.0, uses[0] + self.window - now)
+
+    def check(self, key, now=None):
+        now = time.time() if now is None else now
+        return self._wait(self._uses(key, now), now)
+
+    def acquire(self, key, now=None):
+        now = time.time() if now is None else now
+        uses = self._uses(key, now)
+        wait = self._wait(uses, now)
+        if wait > 0:
+            return wait
+        self._previous.pop(key, None)
+        self._current[key] = uses[1 - self.limit:] + (now,) if self.limit > 1 else (now,)
+        return 0.0
+
+    def __len__(self):
+        return len(self._current) + len(self._previous)
+
+# ==============================================================================================
+
+# セルフチェックとベンチマーク
+def benchmark(keys=100_000, rng=random.Random(1)):
+    # RollingQuota: 厳密な履歴（直近window秒の利用時刻を全部持つ）と同じ判定になることを確認する
+    quota = RollingQuota(3, 10.0)
+    history = {}
+    now = 0.0
+    for _ in range(20_000):
+        now += rng.expovariate(2.0)
+        key = rng.randrange(5)
+        used = [t for t in history.get(key, []) if t > now - 10.0]
+        allowed = quota.acquire(key, now) == 0.0
+        assert allowed == (len(used) < 3), (now, key, used)
+        if allowed:
+            used.append(now)
+        history[key] = used
+
+    # CalendarQuota: 0時で切り替わることを確認する
+    daily = CalendarQuota(limit=2)
+    midnight = datetime(2025, 1, 1, tzinfo=COOLDOWN_TZ).timestamp()
+    assert daily.acquire(1, midnight - 10) == 0.0 and daily.acquire(1, midnight - 5) == 0.0
+    assert daily.acquire(1, midnight - 1) == 1.0
+    assert daily.acquire(1, midnight) == 0.0
+
+    # メモリ使用量と速度
+    now = time.time()
+    tracemalloc.start()
+    rolling = RollingQuota(5, 60.0)
+    for key in range(keys):
+        rolling.acquire(key, now)
+    rolling_bytes = tracemalloc.get_traced_memory()[0] / keys
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    daily = CalendarQuota()
+    for key in range(keys):
+        daily.acquire(key, now)
+    daily_bytes = tracemalloc.get_traced_memory()[0] / keys
+    tracemalloc.stop()
+
+    queries = [rng.randrange(keys) for _ in range(500_000)]
+    start = time.perf_counter()
+    for key in queries:
+        rolling.acquire(key, now)
+    rolling_rate = len(queries) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for key in queries:
+        daily.check(key, now)
+    daily_rate = len(queries) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    rolling.acquire(0, now + 2 * rolling.window)
+    daily.acquire(0, now + 86400)
+    expire = time.perf_counter() - start
+    assert len(rolling) == 1 and len(daily.store) == 1
+
+    print(f"{keys:,} keys")
+    print(f"  rolling quota:  {rolling_bytes:5.1f} bytes/key, {rolling_rate:,.0f} acquires/sec")
+    print(f"  calendar quota: {daily_bytes:5.1f} bytes/key, {daily_rate:,.0f} checks/sec")
+    print(f"  bulk expiry of {2 * keys:,} stale entries: {expire * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,113 @@
+import asyncio
+import random
+import sys
+import time
+
+# ==============================================================================================
+
+# キーで振り分けるイベントの経路表
+# bot.wait_for(check=...) は届いたイベントごとに登録中のすべてのcheckを順に評価するため、待機中のゲームが
+# 増えるほど1イベントあたりの処理が重くなる。ここではイベントのキー（リアクションならメッセージID、
+# 返信なら (チャンネルID, ユーザーID)）で辞書を引き、そのキーに登録された相手だけに渡す
+#   add(key, handler)        : キーに届いたイベントを毎回 handler(event) に渡す（解除するまで有効）
+#   wait(key, check, timeout): キーに届いた最初のイベント（checkを満たすもの）を1回だけ受け取る
+class Routes:
+    def __init__(self):
+        self._handlers = {}  # key -> async def handler(event)
+        self._waiters = {}   # key -> [(future, check), ...]
+
+    def __len__(self):
+        return len(self._handlers) + sum(len(waiters) for waiters in self._waiters.values())
+
+    def __contains__(self, key):
+        return key in self._handlers or key in self._waiters
+
+    def add(self, key, handler):
+        self._handlers[key] = handler
+
+    def remove(self, key):
+        return self._handlers.pop(key, None)
+
+    # キーにイベントが届くまで待つ（timeout秒を過ぎるとasyncio.TimeoutError）
+    async def wait(self, key, check=None, timeout=None):
+        future = asyncio.get_running_loop().create_future()
+        waiter = (future, check)
+        self._waiters.setdefault(key, []).append(waiter)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                if waiter in waiters:
+                    waiters.remove(waiter)
+                if not waiters:
+                    del self._waiters[key]
+
+    # イベントをキーの登録先に渡す（登録先がなければFalse）
+    async def dispatch(self, key, event):
+        waiters = self._waiters.get(key)
+        if waiters:
+            for future, check in waiters:
+                if future.done():
+                    continue
+                try:
+                    if check is None or check(event):
+                        future.set_result(event)
+                except Exception as e:
+                    future.set_exception(e)
+        handler = self._handlers.get(key)
+        if handler is not None:
+            await handler(event)
+            return True
+        return bool(waiters)
+
+# ==============================================================================================
+
+# ベンチマーク: 待機中の相手の数を10～10,000に増やした時の1イベントあたりの処理時間を、
+# bot.wait_forと同じくすべてのcheckを順に評価する方式と比較する
+async def _benchmark(sizes=(10, 100, 1_000, 10_000), events=20_000, rng=random.Random(1)):
+    async def handler(event):
+        pass
+
+    print(f"{'waiters':>8} {'predicate scan':>16} {'keyed routes':>14}")
+    for size in sizes:
+        keys = [(rng.getrandbits(40), rng.getrandbits(40)) for _ in range(size)]
+        # 実際のイベントの大半は待機中のどのゲームにも関係しない
+        stream = [rng.choice(keys) if rng.random() < 0.1 else (rng.getrandbits(40), rng.getrandbits(40)) for _ in range(events)]
+
+        # wait_for方式: (future, check) のリストを毎イベント先頭から評価する
+        listeners = [(None, lambda event, key=key: event == key) for key in keys]
+        start = time.perf_counter()
+        for event in stream:
+            for _, check in listeners:
+                if check(event):
+                    pass
+        scan = (time.perf_counter() - start) / events
+
+        routes = Routes()
+        for key in keys:
+            routes.add(key, handler)
+        start = time.perf_counter()
+        for event in stream:
+            await routes.dispatch(event, event)
+        keyed = (time.perf_counter() - start) / events
+
+        print(f"{size:>8,} {scan * 1e6:>13.2f} us {keyed * 1e6:>11.2f} us")
+
+    # 1回だけの待機とタイムアウトが動くことを確認する
+    routes = Routes()
+    waiter = asyncio.create_task(routes.wait("message", check=lambda event: event == "hit", timeout=1.0))
+    await asyncio.sleep(0)
+    await routes.dispatch("message", "stand")
+    await routes.dispatch("message", "hit")
+    assert await waiter == "hit" and "message" not in routes
+    try:
+        await routes.wait("message", timeout=0.01)
+    except asyncio.TimeoutError:
+        assert "message" not in routes
+    else:
+        raise AssertionError("wait() did not time out")
+
+
+if __name__ == "__main__":
+    asyncio.run(_benchmark(events=int(sys.argv[1]) if len(sys.argv) > 1 else 20_000))
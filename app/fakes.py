@@ -0,0 +1,195 @@
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+import discord
+
+# Discordに接続せずにスラッシュコマンドを動かすための代用品
+# main.py のコマンドが参照する属性とメソッドだけを持ち、送信した内容（本文・Embedなど）は sent に記録する
+# latency を指定すると、送信のたびにその秒数だけ待つ（RESTの往復時間の代わり）
+
+_ids = itertools.count(10 ** 17)
+
+
+def next_id():
+    return next(_ids)
+
+
+# 送信の記録（種類ごとの回数と、keep=Trueの場合は (送信先, 種類, 引数) の並び）
+class Recorder:
+    def __init__(self, latency=0.0, keep=True):
+        self.latency = latency
+        self.keep = keep
+        self.sent = []
+        self.counts = {}  # 種類 -> 回数
+
+    async def record(self, target, kind, kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        if self.keep:
+            self.sent.append((target, kind, kwargs))
+        return FakeMessage(self, target, kwargs)
+
+# ==============================================================================================
+
+class FakeMessage:
+    def __init__(self, recorder, channel, kwargs):
+        self.id = next_id()
+        self.channel = channel
+        self.content = kwargs.get("content")
+        self.embeds = kwargs.get("embeds") or ([kwargs["embed"]] if kwargs.get("embed") else [])
+        self._recorder = recorder
+
+    async def add_reaction(self, emoji):
+        await self._recorder.record(self, "add_reaction", {"emoji": emoji})
+
+    async def edit(self, **kwargs):
+        await self._recorder.record(self, "edit", kwargs)
+        return self
+
+
+class FakeUser:
+    def __init__(self, user_id=None, name=None, bot=False, guild=None):
+        self.id = next_id() if user_id is None else user_id
+        self.name = name or f"user{self.id}"
+        self.global_name = self.name
+        self.display_name = self.name
+        self.bot = bot
+        self.guild = guild
+        self._avatar = f"{self.id:032x}"
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+    # discord.py と同じく、参照するたびにAssetを作る
+    @property
+    def avatar(self):
+        return discord.Asset._from_avatar(None, self.id, self._avatar)
+
+    @property
+    def display_avatar(self):
+        return self.avatar
+
+    def __eq__(self, other):
+        return isinstance(other, FakeUser) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeMember(FakeUser):
+    pass
+
+# ----------------------------------------------------------------------------------------------
+
+class FakeTextChannel:
+    def __init__(self, recorder, guild=None, channel_id=None):
+        self.id = next_id() if channel_id is None else channel_id
+        self.guild = guild
+        self._recorder = recorder
+
+    @property
+    def mention(self):
+        return f"<#{self.id}>"
+
+    async def send(self, content=None, **kwargs):
+        return await self._recorder.record(self, "send", {"content": content, **kwargs})
+
+
+class FakeGuild:
+    # members: 人数（ボットは50人に1人）
+    def __init__(self, recorder, members=100, guild_id=None):
+        self.id = next_id() if guild_id is None else guild_id
+        self._recorder = recorder
+        self._members = {}
+        for i in range(members):
+            member = FakeMember(bot=i % 50 == 49, guild=self)
+            self._members[member.id] = member
+        self.member_count = members
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def get_member(self, user_id):
+        return self._members.get(user_id)
+
+    async def fetch_member(self, user_id):
+        await self._recorder.record(self, "fetch_member", {"user_id": user_id})
+        member = self._members.get(user_id)
+        if member is None:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Member")
+        return member
+
+    async def query_members(self, user_ids=None, limit=5, cache=True, **kwargs):
+        await self._recorder.record(self, "query_members", {"user_ids": user_ids})
+        return [self._members[user_id] for user_id in user_ids or () if user_id in self._members][:limit]
+
+    async def chunk(self, cache=True):
+        await self._recorder.record(self, "chunk", {})
+        return self.members
+
+    def channel(self):
+        return FakeTextChannel(self._recorder, guild=self)
+
+# ----------------------------------------------------------------------------------------------
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        if self._done:
+            raise discord.InteractionResponded(self._interaction)
+        self._done = True
+        await self._interaction._record("send_message", {"content": content, **kwargs})
+
+    async def defer(self, **kwargs):
+        if self._done:
+            raise discord.InteractionResponded(self._interaction)
+        self._done = True
+        await self._interaction._record("defer", kwargs)
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        return await self._interaction._record("followup", {"content": content, **kwargs})
+
+
+class FakeInteraction:
+    def __init__(self, recorder, user, guild=None, channel=None):
+        self.id = next_id()
+        self.user = user
+        self.guild = guild
+        self.guild_id = guild.id if guild is not None else None
+        self.channel = channel
+        self.channel_id = channel.id if channel is not None else None
+        self.extras = {}
+        self.command = None
+        self.command_failed = False
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.sent = []  # この応答で送った内容 (種類, 引数)（send_message / defer / followup / delete_original）
+        self._recorder = recorder
+        self._original = None
+
+    async def _record(self, kind, kwargs):
+        self.sent.append((kind, kwargs))
+        return await self._recorder.record(self, kind, kwargs)
+
+    async def delete_original_response(self):
+        await self._record("delete_original", {})
+
+    async def original_response(self):
+        if self._original is None:
+            self._original = FakeMessage(self._recorder, self.channel, {})
+        return self._original
@@ -0,0 +1,112 @@
+from bisect import bisect_left, insort
+
+PAGE_SIZE = 10  # 1ページあたりの表示人数（Embedのフィールド上限25件以内）
+
+# ==============================================================================================
+
+# 1つのサーバーの所持金ランキング
+# (所持金の符号反転, user_id) の昇順リストを保持し、所持金の多い順・同額ならID順に並べる
+# 変更時は該当ユーザーのキーだけを二分探索で差し替えるため、毎回の全件ソートは不要
+class GuildLeaderboard:
+    def __init__(self, balances=()):
+        self._balances = dict(balances)  # user_id -> 所持金
+        self._keys = sorted((-balance, user_id) for user_id, balance in self._balances.items())
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, user_id):
+        return user_id in self._balances
+
+    def add(self, user_id, balance):
+        if user_id in self._balances:
+            self.update(user_id, balance)
+            return
+        self._balances[user_id] = balance
+        insort(self._keys, (-balance, user_id))
+
+    def remove(self, user_id):
+        balance = self._balances.pop(user_id, None)
+        if balance is not None:
+            del self._keys[bisect_left(self._keys, (-balance, user_id))]
+
+    def update(self, user_id, balance):
+        old = self._balances.get(user_id)
+        if old is None or old == balance:
+            return
+        del self._keys[bisect_left(self._keys, (-old, user_id))]
+        self._balances[user_id] = balance
+        insort(self._keys, (-balance, user_id))
+
+    # 順位を返す（1位から数える、ランキングにいない場合はNone）
+    def rank(self, user_id):
+        balance = self._balances.get(user_id)
+        if balance is None:
+            return None
+        return bisect_left(self._keys, (-balance, user_id)) + 1
+
+    # 指定ページの (user_id, 所持金) のリストを返す（1ページ目から数える）
+    def page(self, page, per_page=PAGE_SIZE):
+        start = (page - 1) * per_page
+        return [(user_id, -key) for key, user_id in self._keys[start:start + per_page]]
+
+    def page_count(self, per_page=PAGE_SIZE):
+        return max(1, -(-len(self._keys) // per_page))
+
+# ----------------------------------------------------------------------------------------------
+
+# 全サーバーのランキングを管理する
+# 台帳の変更通知を受けて、そのユーザーが所属するサーバーのランキングだけを更新する
+class Leaderboard:
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.guilds = {}        # guild_id -> GuildLeaderboard
+        self._user_guilds = {}  # user_id -> 所属しているサーバーIDの集合
+        ledger.add_listener(self._on_balance_change)
+
+    def has_guild(self, guild_id):
+        return guild_id in self.guilds
+
+    def get(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    # サーバーのランキングを作成する（初回の参照時のみ、メンバー一覧から1度だけ構築する）
+    def build(self, guild_id, member_ids):
+        self.drop_guild(guild_id)
+        # アカウント未作成のメンバーはサーバーの初期所持金を持っているものとして扱う
+        starting_balance = self.ledger.starting_balance(guild_id)
+        balance_or = self.ledger.balance_or
+        self.guilds[guild_id] = GuildLeaderboard((user_id, balance_or(user_id, starting_balance)) for user_id in member_ids)
+        for user_id in member_ids:
+            self._user_guilds.setdefault(user_id, set()).add(guild_id)
+        return self.guilds[guild_id]
+
+    def drop_guild(self, guild_id):
+        board = self.guilds.pop(guild_id, None)
+        if board is None:
+            return
+        for user_id in board._balances:
+            self._forget(user_id, guild_id)
+
+    def add_member(self, guild_id, user_id):
+        board = self.guilds.get(guild_id)
+        if board is not None:
+            board.add(user_id, self.ledger.balance_or(user_id, self.ledger.starting_balance(guild_id)))
+            self._user_guilds.setdefault(user_id, set()).add(guild_id)
+
+    def remove_member(self, guild_id, user_id):
+        board = self.guilds.get(guild_id)
+        if board is not None:
+            board.remove(user_id)
+            self._forget(user_id, guild_id)
+
+    def _forget(self, user_id, guild_id):
+        guild_ids = self._user_guilds.get(user_id)
+        if guild_ids is not None:
+            guild_ids.discard(guild_id)
+            if not guild_ids:
+                del self._user_guilds[user_id]
+
+    def _on_balance_change(self, user_id, old, new):
+        for guild_id in self._user_guilds.get(user_id, ()):
+            self.guilds[guild_id].update(user_id, new)
@@ -0,0 +1,719 @@
+import asyncio
+import contextlib
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from accounts import NO_DAY, Accounts
+from snapshot import Snapshot, write_snapshot
+
+DB_PATH = os.getenv("LEDGER_PATH", "economy.db")
+FLUSH_INTERVAL = 0.2  # 書き込みをまとめる待ち時間（秒）
+SNAPSHOT_CHUNK = 10000  # スナップショットの残りを読み込む際に1回で処理する件数
+LOCK_STRIPES = 64       # ユーザーごとのロックを分散させるストライプ数
+STARTING_BALANCE = 2000  # サーバーごとの初期所持金の既定値
+SHARED_REFRESH_INTERVAL = 5.0  # 共有モードで他のプロセスの変更を取り込む間隔（秒）
+BUSY_TIMEOUT_MS = 5000         # 共有モードで他のプロセスの書き込みを待つ最大時間（ミリ秒）
+
+# ==============================================================================================
+
+# 所持金・日次報酬・強奪の状態をSQLiteに永続化する台帳
+# 読み取りはメモリ上の辞書から行い、書き込みはバックグラウンドタスクでまとめてコミットする
+# 正常終了時にはスナップショットを書き出し、次回起動時はそれをメモリマップして遅延読み込みする
+class Ledger:
+    def __init__(self, path=DB_PATH, batching=True, flush_interval=FLUSH_INTERVAL, snapshot_path=None):
+        self.path = path
+        self.snapshot_path = snapshot_path or f"{path}.snap"
+        self.batching = batching
+        self.flush_interval = flush_interval
+
+        self.accounts = Accounts()  # ユーザーごとの所持金・日次報酬の受け取り回数・最終受取日・最終強奪日
+        self.starting_balances = {}  # サーバーごとの初期所持金
+
+        self._dirty = set()    # 未書き込みのユーザーID
+        self._wakeup = None
+        self._task = None
+        self._flush_lock = asyncio.Lock()
+        self._snapshot = None  # 読み込み途中のスナップショット
+        self._snapshot_task = None
+        self._locks = [asyncio.Lock() for _ in range(LOCK_STRIPES)]
+        self._listeners = []   # 所持金の変更を受け取る関数 (user_id, 変更前, 変更後)
+        self._closed = False
+
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS accounts ("
+            " user_id INTEGER PRIMARY KEY,"
+            " balance INTEGER NOT NULL DEFAULT 0,"
+            " daily_count INTEGER NOT NULL DEFAULT 0,"
+            " last_daily INTEGER,"
+            " last_rob INTEGER)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS guild_settings ("
+            " guild_id INTEGER PRIMARY KEY,"
+            " starting_balance INTEGER NOT NULL)"
+        )
+        self.starting_balances = dict(self.conn.execute("SELECT guild_id, starting_balance FROM guild_settings"))
+        if not self._open_snapshot():
+            self._load()
+
+    # ----------------------------------------------------------------------------------------------
+
+    # 起動時に全アカウントをメモリへ読み込む
+    def _load(self):
+        rows = self.conn.execute("SELECT user_id, balance, daily_count, last_daily, last_rob FROM accounts")
+        for record in rows:
+            self.accounts.put(record)
+
+    # 前回の正常終了時に書き出したスナップショットがDBと一致していれば開く
+    def _open_snapshot(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'snapshot_id'").fetchone()
+        if row is None or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            snapshot = Snapshot(self.snapshot_path)
+        except (OSError, ValueError) as e:
+            print(f"Failed to open snapshot: {e}")
+            return False
+        if snapshot.snapshot_id != row[0]:
+            snapshot.close()
+            return False
+        # これ以降の書き込みでDBとスナップショットがずれるため、一致の印を消しておく
+        self.conn.execute("DELETE FROM meta WHERE key = 'snapshot_id'")
+        self._snapshot = snapshot
+        return True
+
+    # まだメモリにないユーザーをスナップショットから読み込む
+    def _fault(self, user_id):
+        record = self._snapshot.lookup(user_id)
+        if record is not None:
+            self.accounts.put(record)
+
+    # スナップショットの残りをイベントループを止めないよう少しずつ読み込む
+    async def _load_snapshot_rest(self):
+        snapshot = self._snapshot
+        for start in range(0, len(snapshot), SNAPSHOT_CHUNK):
+            self._load_snapshot_chunk(start, start + SNAPSHOT_CHUNK)
+            await asyncio.sleep(0)
+        self._close_snapshot()
+
+    def _load_snapshot_chunk(self, start, stop):
+        for record in self._snapshot.records(start, stop):
+            if record[0] not in self.accounts:
+                self.accounts.put(record)
+
+    def _close_snapshot(self):
+        if self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
+
+    # 全件がメモリにある状態にする（スナップショットの読み込みが途中なら同期的に終わらせる）
+    def _load_all(self):
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            self._snapshot_task = None
+        if self._snapshot is not None:
+            self._load_snapshot_chunk(0, len(self._snapshot))
+            self._close_snapshot()
+
+    # ==============================================================================================
+
+    def has_account(self, user_id):
+        if user_id not in self.accounts and self._snapshot is not None:
+            self._fault(user_id)
+        return user_id in self.accounts
+
+    def balance(self, user_id):
+        return self.balance_or(user_id, 0)
+
+    # アカウントがない場合の所持金としてdefaultを返す（アカウントは作らない）
+    def balance_or(self, user_id, default):
+        if self.has_account(user_id):
+            return self.accounts.balance_of(user_id)
+        return default
+
+    # 所持金が未設定の場合は指定額で初期化する（既存のアカウントは上書きしない）
+    def ensure(self, user_id, initial=0):
+        if not self.has_account(user_id):
+            self.accounts.balance[self.accounts.row(user_id)] = initial
+            self._mark(user_id)
+            self._changed(user_id, 0, initial)
+        return self.accounts.balance_of(user_id)
+
+    def set_balance(self, user_id, amount):
+        old = self.balance(user_id)
+        self.accounts.balance[self.accounts.row(user_id)] = amount
+        self._mark(user_id)
+        self._changed(user_id, old, amount)
+
+    # 所持金を増減させ、変更後の所持金を返す
+    def add(self, user_id, delta):
+        old = self.balance(user_id)
+        balance = old + delta
+        self.accounts.balance[self.accounts.row(user_id)] = balance
+        self._mark(user_id)
+        self._changed(user_id, old, balance)
+        return balance
+
+    # 初回のアクセス時にサーバーの初期所持金でアカウントを作る（アカウントの有無が作成済みの印になる）
+    # サーバー外（DMなど）の場合は0で作る
+    def provision(self, user_id, guild_id=None):
+        if self.has_account(user_id):
+            return self.accounts.balance_of(user_id)
+        return self.ensure(user_id, 0 if guild_id is None else self.starting_balance(guild_id))
+
+    def starting_balance(self, guild_id):
+        return self.starting_balances.get(guild_id, STARTING_BALANCE)
+
+    # サーバーの初期所持金を変更する（作成済みのアカウントには影響しない）
+    async def set_starting_balance(self, guild_id, amount):
+        self.starting_balances[guild_id] = amount
+        async with self._flush_lock:
+            await asyncio.to_thread(self._write_setting, guild_id, amount)
+
+    def _write_setting(self, guild_id, amount):
+        self.conn.execute(
+            "INSERT INTO guild_settings (guild_id, starting_balance) VALUES (?, ?)"
+            " ON CONFLICT(guild_id) DO UPDATE SET starting_balance=excluded.starting_balance",
+            (guild_id, amount)
+        )
+
+    # 所持金の変更を通知する関数を登録する（ランキングなどの索引の更新に使う）
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _changed(self, user_id, old, new):
+        if old != new:
+            for listener in self._listeners:
+                listener(user_id, old, new)
+
+    # ----------------------------------------------------------------------------------------------
+
+    # 日付はJSTの日付序数（未設定はNone）
+    def last_daily_day(self, user_id):
+        if not self.has_account(user_id):
+            return None
+        day = self.accounts.last_daily[self.accounts.rows[user_id]]
+        return None if day == NO_DAY else day
+
+    def daily_claims(self, user_id):
+        if not self.has_account(user_id):
+            return 0
+        return self.accounts.daily_count[self.accounts.rows[user_id]]
+
+    # 日次報酬の受取を記録する（受取日と回数を更新）
+    def record_daily(self, user_id, day):
+        self.has_account(user_id)
+        row = self.accounts.row(user_id)
+        self.accounts.last_daily[row] = day
+        self.accounts.daily_count[row] += 1
+        self._mark(user_id)
+
+    def last_rob_day(self, user_id):
+        if not self.has_account(user_id):
+            return None
+        day = self.accounts.last_rob[self.accounts.rows[user_id]]
+        return None if day == NO_DAY else day
+
+    def record_rob(self, user_id, day):
+        self.has_account(user_id)
+        self.accounts.last_rob[self.accounts.row(user_id)] = day
+        self._mark(user_id)
+
+    # ==============================================================================================
+
+    # 指定ユーザーのロックを取得する（ユーザーIDごとにストライプへ割り当て、無関係なユーザー同士は並行に動く）
+    # デッドロックを避けるため、複数のストライプは常に番号順に取得する
+    # ロックは再入できないので、このブロック内ではdebit/credit/transferではなくaddなどの同期メソッドを使う
+    @contextlib.asynccontextmanager
+    async def locked(self, *user_ids):
+        locks = [self._locks[i] for i in sorted({user_id % LOCK_STRIPES for user_id in user_ids})]
+        for lock in locks:
+            await lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    # 所持金を減らす: minimumを指定した場合、減らした後の所持金がそれを下回るなら何もせずNoneを返す
+    async def debit(self, user_id, amount, minimum=None):
+        async with self.locked(user_id):
+            balance = self.balance(user_id)
+            if minimum is not None and balance - amount < minimum:
+                return None
+            return self.add(user_id, -amount)
+
+    async def credit(self, user_id, amount):
+        async with self.locked(user_id):
+            return self.add(user_id, amount)
+
+    # 送金する: clamp=Trueの場合は送金元の所持金の範囲に切り詰め、Falseの場合は足りなければ何もしない
+    # 実際に移動した額を返す（送金しなかった場合は0）
+    async def transfer(self, source_id, target_id, amount, clamp=False):
+        async with self.locked(source_id, target_id):
+            available = max(self.balance(source_id), 0)
+            if amount > available:
+                if not clamp:
+                    return 0
+                amount = available
+            self.add(source_id, -amount)
+            self.add(target_id, amount)
+            return amount
+
+    # ==============================================================================================
+
+    # 変更を記録する: バッチ有効時は書き込み待ちに積み、無効時はその場でコミットする
+    def _mark(self, user_id):
+        if not self.batching:
+            self._write([self._row(user_id)])
+            return
+        self._dirty.add(user_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _row(self, user_id):
+        return self.accounts.record(user_id)
+
+    # 書き込み待ちの行を取り出す（同じユーザーへの複数回の変更は1行にまとまる）
+    def _drain(self):
+        rows = [self._row(user_id) for user_id in self._dirty]
+        self._dirty.clear()
+        return rows
+
+    def _write(self, rows):
+        self.conn.execute("BEGIN")
+        try:
+            self.conn.executemany(
+                "INSERT INTO accounts (user_id, balance, daily_count, last_daily, last_rob) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(user_id) DO UPDATE SET balance=excluded.balance, daily_count=excluded.daily_count,"
+                " last_daily=excluded.last_daily, last_rob=excluded.last_rob",
+                rows
+            )
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    # ----------------------------------------------------------------------------------------------
+
+    # バックグラウンドの書き込みタスクを開始する（イベントループ上で呼ぶ）
+    def start(self):
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        if self._dirty:
+            self._wakeup.set()
+        self._task = asyncio.create_task(self._flush_loop())
+        if self._snapshot is not None:
+            self._snapshot_task = asyncio.create_task(self._load_snapshot_rest())
+
+    async def _flush_loop(self):
+        while True:
+            await self._wakeup.wait()
+            # 少し待ってから書き込むことで、連続した変更を1つのトランザクションにまとめる
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Failed to flush ledger: {e}")
+                self._wakeup.set()
+
+    # 書き込み待ちの変更を別スレッドでコミットする（イベントループをfsyncで止めない）
+    async def flush(self):
+        async with self._flush_lock:
+            rows = self._drain()
+            if rows:
+                try:
+                    await asyncio.to_thread(self._write, rows)
+                except Exception:
+                    self._dirty.update(row[0] for row in rows)
+                    raise
+
+    # 全アカウントをスナップショットとして書き出し、DBと一致している印を記録する
+    def export_snapshot(self):
+        self._load_all()
+        snapshot_id = os.urandom(16)
+        write_snapshot(self.snapshot_path, list(self.accounts.records()), snapshot_id)
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('snapshot_id', ?)", (snapshot_id,))
+
+    # 終了処理（イベントループが閉じる前に、ループ上で呼ぶ）
+    # 書き込み中のコミットが終わるまで待ってから書き込みタスクを止め、残りを書き込んで閉じる
+    async def shutdown(self):
+        async with self._flush_lock:
+            if self._task is not None:
+                self._task.cancel()
+                self._task = None
+            self.close()
+
+    # 残りの変更を同期的に書き込み、スナップショットを書き出して接続を閉じる（2回目以降は何もしない）
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._load_all()
+        rows = self._drain()
+        if rows:
+            self._write(rows)
+        try:
+            self.export_snapshot()
+        except OSError as e:
+            print(f"Failed to write snapshot: {e}")
+        self.conn.close()
+
+# ==============================================================================================
+
+# 複数のプロセス（シャードごとのワーカー）で同じDBを共有する台帳
+# 書き込みはメモリ上の値からではなくSQLの増減（balance = balance + ?）でコミットし、
+# 送金は BEGIN IMMEDIATE のトランザクション内で確認と移動を行うため、他のプロセスと同時に書き込んでも
+# コインが増減しない。SQLはすべて専用のスレッド1本で順に実行し、イベントループは他のプロセスの
+# 書き込みロックを待たない（busy_timeoutで待つのはそのスレッドだけ）
+# 読み取りはメモリ上の値から行い、書き込みの結果の行と、他のプロセスでの変更（一定間隔でまとめて取り込む）で
+# メモリ上の値を更新して、ランキングなどの索引に通知する
+# （スナップショットは単一プロセス用なので使わない）
+_RETURNING = " RETURNING user_id, balance, daily_count, last_daily, last_rob"
+
+
+class SharedLedger(Ledger):
+    def __init__(self, path=DB_PATH, refresh_interval=SHARED_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._refresh_task = None
+        self._data_version = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-ledger")
+        self._pending = {}     # ユーザーID -> 書き込み中の件数（完了するまでDBの行でメモリ上の値を置き換えない）
+        self._writes = set()   # 書き込み中のFuture
+        super().__init__(path, batching=False)
+        self.conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+
+    def _open_snapshot(self):
+        return False
+
+    def export_snapshot(self):
+        pass
+
+    # 変更は書き込みスレッドでSQLとして書き込むので、書き込み待ちには積まない
+    def _mark(self, user_id):
+        pass
+
+    # DBの行でメモリ上の値を置き換え、所持金が変わっていれば通知する
+    def _apply(self, row):
+        user_id = row[0]
+        old = self.accounts.balance_of(user_id, 0)
+        self.accounts.put(row)
+        self._changed(user_id, old, row[1])
+
+    # ----------------------------------------------------------------------------------------------
+
+    # SQLを書き込みスレッドで実行する（fnは (戻り値, 更新後の行のリスト) を返す）
+    # イベントループ上ではその組を結果とするFutureを返し、完了したら行をメモリに反映する（起動前・終了後などループの外ではその場で待つ）
+    def _submit(self, user_ids, fn, *args):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            value, rows = self._executor.submit(fn, *args).result()
+            for row in rows:
+                self._apply(row)
+            return value
+        for user_id in user_ids:
+            self._pending[user_id] = self._pending.get(user_id, 0) + 1
+        future = loop.run_in_executor(self._executor, fn, *args)
+        self._writes.add(future)
+        future.add_done_callback(partial(self._written, user_ids))
+        return future
+
+    def _written(self, user_ids, future):
+        self._writes.discard(future)
+        for user_id in user_ids:
+            count = self._pending[user_id] - 1
+            if count:
+                self._pending[user_id] = count
+            else:
+                del self._pending[user_id]
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            # 書き込めなかった変更はメモリ上にだけ残っているので、DBの値に戻す
+            print(f"Failed to write shared ledger: {error}")
+            self._submit(user_ids, self._select, user_ids)
+            return
+        # まだ書き込み中の変更があるユーザーは、それが終わるまでメモリ上の値を使う
+        for row in future.result()[1]:
+            if row[0] not in self._pending:
+                self._apply(row)
+
+    def _select(self, user_ids):
+        rows = []
+        for user_id in user_ids:
+            row = self.conn.execute(
+                "SELECT user_id, balance, daily_count, last_daily, last_rob FROM accounts WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if row is not None:
+                rows.append(row)
+        return None, rows
+
+    # ----------------------------------------------------------------------------------------------
+
+    # 以下の書き込みはメモリ上の値を先に変えてから、SQLを書き込みスレッドに渡す
+    def ensure(self, user_id, initial=0):
+        if not self.has_account(user_id):
+            super().ensure(user_id, initial)
+            self._submit((user_id,), self._insert, user_id, initial)
+        return self.accounts.balance_of(user_id)
+
+    def _insert(self, user_id, initial):
+        self.conn.execute("INSERT INTO accounts (user_id, balance) VALUES (?, ?) ON CONFLICT(user_id) DO NOTHING", (user_id, initial))
+        return self._select((user_id,))
+
+    def set_balance(self, user_id, amount):
+        super().set_balance(user_id, amount)
+        self._submit((user_id,), self._upsert_balance, user_id, "excluded.balance", amount)
+
+    def add(self, user_id, delta):
+        balance = super().add(user_id, delta)
+        self._submit((user_id,), self._upsert_balance, user_id, "balance + excluded.balance", delta)
+        return balance
+
+    def _upsert_balance(self, user_id, update, value):
+        row = self.conn.execute(
+            "INSERT INTO accounts (user_id, balance) VALUES (?, ?)"
+            f" ON CONFLICT(user_id) DO UPDATE SET balance={update}" + _RETURNING,
+            (user_id, value)
+        ).fetchone()
+        return row[1], [row]
+
+    def record_daily(self, user_id, day):
+        super().record_daily(user_id, day)
+        self._submit((user_id,), self._execute_row,
+            "INSERT INTO accounts (user_id, daily_count, last_daily) VALUES (?, 1, ?)"
+            " ON CONFLICT(user_id) DO UPDATE SET daily_count=daily_count + 1, last_daily=excluded.last_daily" + _RETURNING,
+            (user_id, day)
+        )
+
+    def record_rob(self, user_id, day):
+        super().record_rob(user_id, day)
+        self._submit((user_id,), self._execute_row,
+            "INSERT INTO accounts (user_id, last_rob) VALUES (?, ?)"
+            " ON CONFLICT(user_id) DO UPDATE SET last_rob=excluded.last_rob" + _RETURNING,
+            (user_id, day)
+        )
+
+    def _execute_row(self, sql, parameters):
+        return None, [self.conn.execute(sql, parameters).fetchone()]
+
+    # 書き込みスレッドで実行するため、イベントループは止めない
+    async def set_starting_balance(self, guild_id, amount):
+        self.starting_balances[guild_id] = amount
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._write_setting, guild_id, amount)
+
+    # ----------------------------------------------------------------------------------------------
+
+    # 残高の確認と差し引きを1つのUPDATEで行う（他のプロセスの変更と競合しない）
+    async def debit(self, user_id, amount, minimum=None):
+        async with self.locked(user_id):
+            if minimum is None:
+                return self.add(user_id, -amount)
+            balance, _ = await self._submit((user_id,), self._debit, user_id, amount, minimum)
+            return balance
+
+    def _debit(self, user_id, amount, minimum):
+        row = self.conn.execute(
+            "UPDATE accounts SET balance=balance - ? WHERE user_id = ? AND balance - ? >= ?" + _RETURNING,
+            (amount, user_id, amount, minimum)
+        ).fetchone()
+        if row is None:
+            return None, self._select((user_id,))[1]
+        return row[1], [row]
+
+    async def transfer(self, source_id, target_id, amount, clamp=False):
+        async with self.locked(source_id, target_id):
+            moved, _ = await self._submit((source_id, target_id), self._transfer, source_id, target_id, amount, clamp)
+            return moved
+
+    def _transfer(self, source_id, target_id, amount, clamp):
+        # 書き込みロックを先に取り、確認から移動までの間に他のプロセスが書き込めないようにする
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute("SELECT balance FROM accounts WHERE user_id = ?", (source_id,)).fetchone()
+            available = max(row[0] if row is not None else 0, 0)
+            if amount > available:
+                amount = available if clamp else 0
+            rows = []
+            if amount:
+                rows += self._upsert_balance(source_id, "balance + excluded.balance", -amount)[1]
+                rows += self._upsert_balance(target_id, "balance + excluded.balance", amount)[1]
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        return amount, rows
+
+    # ----------------------------------------------------------------------------------------------
+
+    def start(self):
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    # 他のプロセスがコミットした場合だけ、全アカウントとサーバー設定を読み直して差分を取り込む
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh_all()
+            except Exception as e:
+                print(f"Failed to refresh shared ledger: {e}")
+
+    async def refresh_all(self):
+        result = await asyncio.get_running_loop().run_in_executor(self._executor, self._read_changes)
+        if result is None:
+            return 0
+        rows, settings = result
+        self.starting_balances = settings
+        changed = 0
+        for start in range(0, len(rows), SNAPSHOT_CHUNK):
+            for row in rows[start:start + SNAPSHOT_CHUNK]:
+                if row[0] in self._pending:
+                    continue
+                if self.accounts.balance_of(row[0]) != row[1]:
+                    changed += 1
+                self._apply(row)
+            await asyncio.sleep(0)
+        return changed
+
+    def _read_changes(self):
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return None
+        self._data_version = data_version
+        rows = self.conn.execute("SELECT user_id, balance, daily_count, last_daily, last_rob FROM accounts").fetchall()
+        settings = dict(self.conn.execute("SELECT guild_id, starting_balance FROM guild_settings"))
+        return rows, settings
+
+    # 書き込み中のSQLがすべて終わるまで待つ
+    async def flush(self):
+        if self._writes:
+            await asyncio.gather(*list(self._writes), return_exceptions=True)
+
+    # 終了処理: 書き込みスレッドに渡したSQLを待ってから閉じる
+    async def shutdown(self):
+        await self.flush()
+        self.close()
+
+    # 書き込みスレッドに渡したSQLを実行し終えてから接続を閉じる
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        self._executor.shutdown(wait=True)
+        self.conn.close()
+
+# ==============================================================================================
+
+# ベンチマーク: バッチ書き込みの有無で1秒あたりの変更数を比較する
+async def _benchmark_run(path, batching, mutations, users):
+    ledger = Ledger(path, batching=batching)
+    ledger.start()
+    start = time.perf_counter()
+    for i in range(mutations):
+        ledger.add(i % users, 1)
+        if i % 100 == 0:
+            await asyncio.sleep(0)  # 他のタスク（書き込みタスク）に制御を渡す
+    await ledger.flush()
+    elapsed = time.perf_counter() - start
+    ledger.close()
+    return mutations / elapsed
+
+
+def benchmark(mutations=20000, users=1000):
+    with tempfile.TemporaryDirectory() as tmp:
+        for batching in (False, True):
+            path = os.path.join(tmp, f"bench_{batching}.db")
+            rate = asyncio.run(_benchmark_run(path, batching, mutations, users))
+            print(f"batching={'on ' if batching else 'off'}: {rate:,.0f} mutations/sec")
+
+# ----------------------------------------------------------------------------------------------
+
+# 単一プロセスでのコマンドの同時実行の負荷テストは、実際のコマンドを動かす bench.py --stress で行う
+# （以前の python app/ledger.py stress は python app/bench.py --stress 3000 に置き換えた）
+
+# ----------------------------------------------------------------------------------------------
+
+# 共有モードの負荷テスト: 複数のプロセスから同じDBに送金・強奪・賭けを同時に行い、コインの総量が保存されることを確認する
+async def _shared_worker_run(path, seed, commands, users):
+    ledger = SharedLedger(path)
+    rng = random.Random(seed)
+    house_id = users
+    for _ in range(commands):
+        a, b = rng.randrange(users), rng.randrange(users)
+        amount = rng.randint(1, 1500)
+        kind = rng.randrange(3)
+        if kind == 0:
+            await ledger.transfer(a, b, amount)
+        elif kind == 1:
+            await ledger.transfer(b, a, amount, clamp=True)
+        elif await ledger.transfer(a, house_id, amount):
+            await ledger.transfer(house_id, a, amount * rng.choice((0, 2, 3)))
+    ledger.close()
+
+
+def _shared_worker(path, seed, commands, users):
+    asyncio.run(_shared_worker_run(path, seed, commands, users))
+
+
+def shared_stress(workers=4, commands=5000, users=50):
+    import multiprocessing
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "shared.db")
+        ledger = SharedLedger(path)
+        for user_id in range(users):
+            ledger.set_balance(user_id, 1000)
+        ledger.set_balance(users, 10 ** 12)
+        total = sum(ledger.balance(user_id) for user_id in range(users + 1))
+        ledger.close()
+
+        start = time.perf_counter()
+        processes = [
+            multiprocessing.Process(target=_shared_worker, args=(path, seed, commands, users))
+            for seed in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+        assert all(process.exitcode == 0 for process in processes), "a worker failed"
+
+        ledger = SharedLedger(path)
+        final = sum(ledger.balance(user_id) for user_id in range(users + 1))
+        negative = [user_id for user_id in range(users) if ledger.balance(user_id) < 0]
+        ledger.close()
+    print(f"{workers} processes x {commands:,} commands over {users} users in {elapsed:.2f} s")
+    print(f"total coins: before={total:,} after={final:,}")
+    assert total == final, "total coins were not conserved"
+    assert not negative, f"balances went negative: {negative}"
+    print("OK: coins conserved across processes and no balance went negative")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "shared":
+        shared_stress()
+    elif len(sys.argv) > 1 and sys.argv[1] == "stress":
+        sys.exit("The stress test moved to bench.py: python app/bench.py --stress 3000")
+    else:
+        benchmark()
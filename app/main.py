@@ -1,11 +1,38 @@
+import asyncio
 import discord
 from discord import app_commands
 from discord.ext import commands
 import os
-import random
 from dotenv import load_dotenv
-from datetime import datetime, timedelta, timezone
-from server import server_thread
+from functools import partial
+from server import health, start_server
+from metrics import REGISTRY, MeasuredTree, count_rest_calls
+from ledger import Ledger, SharedLedger
+from cooldowns import CalendarQuota, LedgerDays
+from rng import RNG_LOG_PATH, RNG_SEED, ReplayableShoe, RngService
+from shards import shard_options
+from leaderboard import Leaderboard
+from robindex import RobIndex
+from members import MemberIndex
+from cards import CARD_VALUES, Hand, card_name
+from rules import (
+    BLACKJACK_DRAW_PAYOUT,
+    BLACKJACK_NATURAL_PAYOUT,
+    BLACKJACK_WIN_PAYOUT,
+    DEALER_STAND_VALUE,
+    ROULETTE_BETS,
+    ROULETTE_POCKET_COUNT,
+    ROULETTE_POCKETS,
+    ROULETTE_TABLE,
+    roulette_column,
+)
+import render
+from sessions import TIMEOUT_POLICY, SessionStore
+from multiplayer import LOBBY, LOBBY_TIMEOUT, PLAYING, TURN_TIMEOUT, MultiGame
+from dispatch import Routes
+from outbound import Outbox, auto_defer, defer, respond
+import simulator
+import strategy
 
 load_dotenv()
 
@@ -14,106 +41,379 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-JST = timezone(timedelta(hours=+9))
+ROB_WEIGHTED = os.getenv("ROB_WEIGHTED") == "1"  # 強奪対象を所持金に比例した確率で選ぶかどうか
+LEAN_MEMBERS = os.getenv("LEAN_MEMBERS") == "1"  # メンバーをキャッシュせず、IDだけの索引で扱うかどうか（大きなサーバー向け）
+HTTP_SERVER = os.getenv("HTTP_SERVER") == "1"    # ヘルスチェックと計測値（/metrics）のHTTPサーバーを起動するかどうか
+
+# 省メモリモードでは起動時の全メンバーの取得（chunking）とメンバーキャッシュを止める
+# スラッシュコマンドの呼び出し回数と処理時間を記録する
+bot_options = {"tree_cls": MeasuredTree}
+if LEAN_MEMBERS:
+    bot_options.update(member_cache_flags=discord.MemberCacheFlags.none(), chunk_guilds_at_startup=False)
+
+# シャード構成（SHARD_COUNT / SHARD_IDS）が指定されていれば、受け持つシャードだけに接続する
+SHARDS = shard_options()
+
+
+# 終了時は、イベントループが閉じる前に台帳の未書き込みの変更を保存する
+# （bot.run() から戻った後では、書き込みタスクのスレッドでのコミットと競合する）
+class ShutdownMixin:
+    async def close(self):
+        await super().close()
+        await ledger.shutdown()
+        game_rng.close()
+
+
+class CasinoBot(ShutdownMixin, commands.Bot):
+    pass
+
+
+class ShardedCasinoBot(ShutdownMixin, commands.AutoShardedBot):
+    pass
+
+
+if SHARDS is None:
+    bot = CasinoBot(command_prefix="/", intents=intents, **bot_options)
+else:
+    bot = ShardedCasinoBot(command_prefix="/", intents=intents, **bot_options, **SHARDS)
+
+# 所持金・日次報酬・強奪の状態を永続化する台帳（シャードごとのワーカーで動かす場合は同じDBを共有する）
+ledger = SharedLedger() if os.getenv("LEDGER_SHARED") == "1" else Ledger()
+leaderboard = Leaderboard(ledger)  # サーバーごとの所持金ランキング
+rob_index = RobIndex(ledger)       # サーバーごとの強奪対象
+member_index = MemberIndex()       # サーバーごとのメンバーID（省メモリモードのみ使う）
+
+# /daily と /rob は1日1回（COOLDOWN_TIMEZONEの0時で切り替わる。記録は台帳の最終受取日・最終実行日）
+daily_quota = CalendarQuota(store=LedgerDays(ledger.last_daily_day, ledger.record_daily))
+rob_quota = CalendarQuota(store=LedgerDays(ledger.last_rob_day, ledger.record_rob))
+
+# ゲームの乱数（抽選前の位置をゲームごとに記録し、後から同じ結果を再現できるようにする）
+# シャードごとのワーカーでは受け持つ最初のシャード番号をワーカー番号にして、同じシードでも別の乱数列にする
+game_rng = RngService(
+    seed=int(RNG_SEED, 0) if RNG_SEED else None,
+    worker=SHARDS["shard_ids"][0] if SHARDS and "shard_ids" in SHARDS else 0,
+    log_path=RNG_LOG_PATH,
+)
+roulette_rng = game_rng.stream("roulette")
+rob_rng = game_rng.stream("rob")
+shoe_rng = game_rng.stream("shoe")
+
+blackjack_games = SessionStore()  # チャンネルごとのブラックジャックのゲーム状態（放置されたゲームは自動で終了する）
+shoes = {}                        # チャンネルごとのブラックジャックのシュー（ゲームをまたいで使い回す）
+reaction_routes = Routes()        # リアクションの振り分け先（メッセージID -> マルチプレイヤーの募集）
+reply_routes = Routes()           # メッセージの振り分け先（(チャンネルID, user_id) -> マルチプレイヤーの対戦）
+dm_channels = {}                  # user_id -> DMチャンネル（手番の通知のたびに作り直さない）
+multi_players = {}                # user_id -> 参加中のマルチプレイヤーの対戦（DMの返信の振り分け先が1つに決まるよう、同時に1つまで）
+outbox = Outbox()                 # チャンネルへの送信キュー（短い間に同じチャンネルへ送るメッセージを1通にまとめる）
+
+# ----------------------------------------------------------------------------------------------
+
+# /metrics で公開する計測値（取得された時に読む）
+def gateway_latency():
+    if SHARDS is None:
+        return {("0",): bot.latency}
+    return {(str(shard_id),): latency for shard_id, latency in bot.latencies}
+
 
-bot = commands.Bot(command_prefix="/", intents=intents)
+def sessions_by_mode():
+    counts = {("single",): 0, ("multi",): 0}
+    for game in list(blackjack_games.values()):
+        counts[("multi",) if isinstance(game, MultiGame) else (game["mode"],)] += 1
+    return counts
 
-user_balances = {}     # ユーザーの所持金を管理する辞書
-last_daily_claim = {}  # ユーザーの日次報酬の最終受取日時を管理する辞書
-daily_claim_count = {} # ユーザーの日次報酬の受け取り回数を管理する辞書
-last_rob_attempt = {}  # ユーザーの最後の強奪実行日時を管理する辞書
 
-blackjack_games = {}   # ブラックジャックのゲーム状態を管理する辞書
+REGISTRY.gauge("discord_gateway_latency_seconds", "Gateway heartbeat latency by shard.", gateway_latency, ("shard",))
+REGISTRY.gauge("blackjack_sessions", "Live blackjack sessions by mode.", sessions_by_mode, ("mode",))
+REGISTRY.gauge("blackjack_session_events_total", "Blackjack session lifecycle events.",
+               lambda: {(event,): count for event, count in list(blackjack_games.counters.items())}, ("event",), kind="counter")
+REGISTRY.gauge("ledger_accounts", "Accounts held in the ledger.", lambda: len(ledger.accounts))
+REGISTRY.gauge("ledger_coin_supply", "Total coins across all accounts.", lambda: sum(ledger.accounts.balance))
+REGISTRY.gauge("outbox_messages_total", "Channel messages handled by the outbox.",
+               lambda: {(event,): count for event, count in list(outbox.counters.items())}, ("event",), kind="counter")
+REGISTRY.gauge("outbox_pending_channels", "Channels with messages waiting to be sent.", lambda: len(outbox))
+count_rest_calls()
+
+# /readyz の確認: Gatewayに接続していて、スラッシュコマンドを同期済みであること
+commands_synced = asyncio.Event()
+
+
+def gateway_connected():
+    if not bot.is_ready() or bot.is_closed():
+        return False
+    if SHARDS is None:
+        return bot.ws is not None and bot.ws.open
+    return all(not shard.is_closed() for shard in bot.shards.values())
+
+
+health.checks["gateway"] = gateway_connected
+health.checks["commands_synced"] = commands_synced.is_set
 
 # ==============================================================================================
 
-# ブラックジャック用のカードデッキを生成する関数
-def create_deck():
-    suits = ['♠', '♥', '♦', '♣']
-    ranks = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
-    return [f"{rank}{suit}" for suit in suits for rank in ranks]
+# DMのイベントはシャード0に届くため、シャード0を受け持つプロセスだけがDMでの返信を受け取れる
+def receives_dms():
+    return SHARDS is None or 0 in SHARDS.get("shard_ids", (0,))
 
 # ----------------------------------------------------------------------------------------------
 
-# カードの値を計算する関数
-def calculate_hand_value(hand):
-    value = 0
-    aces = 0
-    for card in hand:
-        rank = card[:-1]  # カードのランク部分を取得
-        if rank in ['J', 'Q', 'K']:
-            value += 10
-        elif rank == 'A':
-            value += 11
-            aces += 1
+# アカウントを必要になった時点で作成する関数（サーバー内ならサーバーの初期所持金、DMなら0で作成）
+# 作成済みの場合は何もしないので、何度呼んでも所持金が上書きされることはない
+def provision(user, guild):
+    return ledger.provision(user.id, guild.id if guild else None)
+
+# ----------------------------------------------------------------------------------------------
+
+# 賭け金を検証し、所持金から先に差し引く関数
+# 確認と差し引きを同じロック内で行うため、同じユーザーの同時実行で二重に賭けられることはない
+# 戻り値: (賭け金, 差し引く前の所持金, エラーメッセージ)
+async def place_bet(user, guild, amount):
+    user_id = user.id
+    async with ledger.locked(user_id):
+        balance = provision(user, guild)  # 所持金が未設定の場合は初期化
+
+        # 賭け金の検証
+        max_bet = 5000 if balance >= 0 else 500
+
+        # "all"が指定された場合、所持金全額を賭ける
+        if amount.lower() == "all":
+            amount = balance
+            if amount <= 0:
+                return None, balance, "You don't have any coins to bet."
         else:
-            value += int(rank)
-    # Aを1として扱う場合の調整
-    while value > 21 and aces:
-        value -= 10
-        aces -= 1
-    return value
+            try:
+                amount = int(amount)
+            except ValueError:
+                return None, balance, "Please enter a valid number for the bet amount."
+
+        if amount <= 0:
+            return None, balance, "Please enter a valid bet amount."
+
+        # all以外の時に、賭け金が最大賭け金を超えている場合
+        if amount != balance and amount > max_bet:
+            return None, balance, render.BET_LIMIT(max_bet=max_bet)
+
+        # 賭けた分を先に減らす
+        ledger.add(user_id, -amount)
+        return amount, balance, None
 
 # ----------------------------------------------------------------------------------------------
 
-# ターンを進める関数
-def next_turn(game):
-    players = game["players"]
-    current_index = players.index(next(player for player in players if player.id == game["current_turn"]))
-    for i in range(1, len(players) + 1):
-        next_index = (current_index + i) % len(players)
-        next_player = players[next_index]
-        if not game["game_state"][next_player.id]["stand"]:
-            game["current_turn"] = next_player.id
-            return
+# サーバーのボット以外のメンバーのIDを取得する関数（省メモリモードでは初回のみGatewayから取得して索引を作る）
+async def member_ids(guild):
+    if not LEAN_MEMBERS:
+        return [member.id for member in guild.members if not member.bot]
+    members = member_index.get(guild.id)
+    if members is None:
+        members = await member_index.load(guild)
+    return members.humans()
 
-    # 全員がスタンドした場合、ディーラーのターンに進む
-    game["current_turn"] = "dealer"
+
+# メンバーを取得する関数（キャッシュにない場合はAPIから取得し、サーバーにいなければNone）
+async def get_member(guild, user_id):
+    member = guild.get_member(user_id)
+    if member is None and LEAN_MEMBERS:
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.HTTPException:
+            return None
+    return member
+
+
+# メンバーの名前を取得する関数（キャッシュにないメンバーはまとめて1回で取得する）
+async def member_names(guild, user_ids):
+    names = {}
+    missing = []
+    for user_id in user_ids:
+        member = guild.get_member(user_id)
+        if member is not None:
+            names[user_id] = member.name
+        else:
+            missing.append(user_id)
+    if missing and LEAN_MEMBERS:
+        try:
+            for member in await guild.query_members(user_ids=missing, limit=len(missing), cache=False):
+                names[member.id] = member.name
+        except (asyncio.TimeoutError, discord.HTTPException) as e:
+            print(f"Failed to query members of {guild.id}: {e}")
+    return names
 
 # ----------------------------------------------------------------------------------------------
 
-# ゲームの進行状況を更新する関数
-async def update_game_state(channel, game):
-    embed = discord.Embed(
-        title="Blackjack Game State",
-        color=discord.Color.blue()
-    )
+# サーバーのランキングを取得する関数（初回のみメンバー一覧から作成し、以降は所持金の変更に合わせて更新される）
+async def get_leaderboard(guild):
+    board = leaderboard.get(guild.id)
+    if board is None:
+        board = leaderboard.build(guild.id, await member_ids(guild))
+    return board
 
-    for player in game["players"]:
-        player_state = game["game_state"][player.id]
-        hand = player_state["hand"]
-        hand_value = calculate_hand_value(hand)
-        status = "Stand" if player_state["stand"] else "Playing"
+# ----------------------------------------------------------------------------------------------
+
+# サーバーの強奪対象を取得する関数（初回のみメンバー一覧から作成し、以降は所持金の変更に合わせて更新される）
+async def get_rob_index(guild):
+    index = rob_index.get(guild.id)
+    if index is None:
+        index = rob_index.build(guild.id, await member_ids(guild))
+    return index
+
+# ----------------------------------------------------------------------------------------------
+
+# チャンネルのシューを取得する関数（初回のみ作成してシャッフルする）
+def get_shoe(channel):
+    shoe = shoes.get(channel.id)
+    if shoe is None:
+        shoe = shoes[channel.id] = ReplayableShoe(rng=shoe_rng)
+    return shoe
+
+# ----------------------------------------------------------------------------------------------
+
+# マルチプレイヤーのゲームの進行状況を送信する関数
+def update_game_state(channel, game):
+    embed = render.MULTI_GAME_STATE.render()
+
+    for user_id in game.players:
+        hand = game.hands[user_id]
+        status = "Stand" if user_id in game.stood else "Playing"
         embed.add_field(
-            name=f"{player.name}'s Hand",
-            value=f"{', '.join(hand)} (Value: {hand_value}) - {status}",
+            name=f"{game.names[user_id]}'s Hand",
+            value=f"{render.HAND_FIELD(hand=hand, value=hand.value)} - {status}",
             inline=False
         )
 
-    if game["current_turn"] == "dealer":
+    if game.state != PLAYING:
         embed.add_field(name="Dealer's Turn", value="The dealer is playing now.", inline=False)
     else:
-        current_player = next(player for player in game["players"] if player.id == game["current_turn"])
-        embed.add_field(name="Current Turn", value=f"It's {current_player.name}'s turn.", inline=False)
+        embed.add_field(name="Current Turn", value=f"It's {game.names[game.current_turn]}'s turn.", inline=False)
+
+    outbox.send(channel, embed=embed)
+
+# ----------------------------------------------------------------------------------------------
+
+# シングルプレイヤーのゲームをスタンドとして精算し、結果のEmbedを返す関数
+# （/stand と放置されたゲームの自動スタンドで共通。呼ぶ前にゲームを blackjack_games から取り除いておく）
+async def settle_single_game(game):
+    user_id = game["current_turn"]
+
+    # ディーラーのターン
+    dealer_hand = game["dealer_hand"]
+    shoe = game["shoe"]
+    dealer_value = dealer_hand.value
+    while dealer_value < DEALER_STAND_VALUE:
+        dealer_hand.add(shoe.deal())
+        dealer_value = dealer_hand.value
+
+    player_hand = game["player_hand"]
+    player_value = player_hand.value
+
+    # 勝敗判定（賭け金は開始時に差し引き済み）
+    if dealer_value > 21 or player_value > dealer_value:
+        await ledger.credit(user_id, game["bet"] * BLACKJACK_WIN_PAYOUT)
+        result = "You Win!"
+        color = render.GREEN
+    elif player_value == dealer_value:
+        await ledger.credit(user_id, game["bet"] * BLACKJACK_DRAW_PAYOUT)  # 賭け金を払い戻す
+        result = "It's a Draw!"
+        color = render.ORANGE
+    else:
+        result = "You Lose!"
+        color = render.RED
 
-    await channel.send(embed=embed)
+    return render.BLACKJACK_RESULT.render(
+        color=color, result=result, hand=player_hand, value=player_value, dealer_hand=dealer_hand, dealer_value=dealer_value
+    )
+
+# ----------------------------------------------------------------------------------------------
+
+# 一定時間操作のなかったゲームを終了する関数（セッションストアから呼ばれる）
+# シングルプレイヤーは設定に応じて自動でスタンドするか賭け金を返し、マルチプレイヤーは終了を通知する
+async def expire_blackjack_game(channel_id, game):
+    channel = bot.get_channel(channel_id)
+    if isinstance(game, MultiGame):
+        await expire_multi_game(channel, game)
+        return
+    else:
+        user_id = game["current_turn"]
+        if TIMEOUT_POLICY == "refund":
+            await ledger.credit(user_id, game["bet"])
+            embed = None
+            message = render.BLACKJACK_TIMEOUT_REFUND(mention=f"<@{user_id}>", bet=game["bet"])
+        else:
+            embed = await settle_single_game(game)
+            message = render.BLACKJACK_TIMEOUT_STAND(mention=f"<@{user_id}>")
+    if channel is not None:
+        outbox.send(channel, message, embed)
+
+blackjack_games.on_expire = expire_blackjack_game
 
 # ==============================================================================================
 
+@bot.event
+async def setup_hook():
+    # 台帳の書き込みタスクを開始
+    ledger.start()
+    # 放置されたブラックジャックのゲームを終了するタイマーを開始
+    blackjack_games.start()
+    # /hint用の計算済みの期待値表を読み込む
+    strategy.load_table()
+    # イベントループの遅延の計測と、ヘルスチェック・計測値のHTTPサーバーを開始（同じイベントループで動かす）
+    health.start()
+    if HTTP_SERVER:
+        start_server()
+
+# ----------------------------------------------------------------------------------------------
+
 @bot.event
 async def on_ready():
     print(f'Logged in as {bot.user}')
-    # スラッシュコマンドを同期
+    # スラッシュコマンドを同期（シャードごとのワーカーで動かす場合は、シャード0を受け持つプロセスだけが行う）
+    if not receives_dms():
+        commands_synced.set()
+        return
     try:
         synced = await bot.tree.sync()
         print(f"Synced {len(synced)} command(s).")
+        commands_synced.set()
     except Exception as e:
         print(f"Failed to sync commands: {e}")
 
-    # 初期化: 全メンバーに所持金を設定
-    for guild in bot.guilds:
-        for member in guild.members:
-            user_balances[member.id] = 2000
+    # 所持金は各ユーザーの初回アクセス時に設定するため、ここでメンバーごとの初期化は行わない
+    # （再接続のたびに呼ばれても既存の所持金が上書きされることはない）
+
+# ----------------------------------------------------------------------------------------------
+
+# メンバーの参加・退出に合わせてランキングと強奪対象を更新
+@bot.event
+async def on_member_join(member):
+    member_index.add(member.guild.id, member.id, member.bot)
+    if not member.bot:
+        leaderboard.add_member(member.guild.id, member.id)
+        rob_index.add_member(member.guild.id, member.id)
+
+# 退出はキャッシュにないメンバーでも届くrawイベントで受け取る（on_member_removeはキャッシュ済みのメンバーのみ）
+@bot.event
+async def on_raw_member_remove(payload):
+    member_index.remove(payload.guild_id, payload.user.id)
+    leaderboard.remove_member(payload.guild_id, payload.user.id)
+    rob_index.remove_member(payload.guild_id, payload.user.id)
+    render.forget_author(payload.user.id)
+
+@bot.event
+async def on_guild_remove(guild):
+    leaderboard.drop_guild(guild.id)
+    rob_index.drop_guild(guild.id)
+    member_index.drop_guild(guild.id)
+
+# ----------------------------------------------------------------------------------------------
+
+# 名前やアバターが変わったユーザーの作成者欄のキャッシュを破棄
+@bot.event
+async def on_user_update(before, after):
+    if before.name != after.name or before.avatar != after.avatar:
+        render.forget_author(after.id)
+
+@bot.event
+async def on_member_update(before, after):
+    if before.guild_avatar != after.guild_avatar:
+        render.forget_author(after.id)
 
 # ==============================================================================================
 
@@ -124,945 +424,983 @@ async def on_ready():
 
 # スラッシュコマンド: /daily
 @bot.tree.command(name="daily", description="Claim your daily reward.")
+@auto_defer()
 async def daily(interaction: discord.Interaction):
     user_id = interaction.user.id
-    now = datetime.now(JST)
-
-    # 最後の受取日時を取得
-    if user_id in last_daily_claim:
-        last_claim_time = last_daily_claim[user_id]
-        if last_claim_time.date() == now.date():
-            embed = discord.Embed(
-                title="Daily Reward",
-                description="You have already claimed your daily reward today.",
-                color=discord.Color.red()
-            )
-            embed.set_author(name=interaction.user.name, icon_url=interaction.user.avatar.url)
-            await interaction.response.send_message(embed=embed)
-            return
+    provision(interaction.user, interaction.guild)
+
+    # 今日すでに受け取っているか確認
+    if daily_quota.check(user_id):
+        embed = render.DAILY_ALREADY_CLAIMED.render(author=interaction.user)
+        await respond(interaction, embed=embed)
+        return
 
     base_reward = 100  # 日次報酬の基本額
     bonus_reward = 100 # 7日毎のボーナス額
 
-    if daily_claim_count.get(user_id, 0) % 7 == 6:
+    bonus_message = None
+    if ledger.daily_claims(user_id) % 7 == 6:
         base_reward += bonus_reward
-        interaction.channel.send(
-            f"{interaction.user.mention} has claimed their daily reward for the 7th time!\nThey received an extra {bonus_reward} coins!"
-        )
+        bonus_message = render.DAILY_BONUS(mention=interaction.user.mention, bonus=bonus_reward)
 
-    # 日次報酬を付与
-    user_balances[user_id] = user_balances.get(user_id, 0) + base_reward
-    last_daily_claim[user_id] = now  # 最終受取日時を更新
-
-    # 日次報酬の受け取り回数を更新
-    daily_claim_count[user_id] = daily_claim_count.get(user_id, 0) + 1
+    # 最終受取日と受け取り回数を更新し、日次報酬を付与
+    if daily_quota.acquire(user_id):
+        embed = render.DAILY_ALREADY_CLAIMED.render(author=interaction.user)
+        await respond(interaction, embed=embed)
+        return
+    ledger.add(user_id, base_reward)
 
-    embed = discord.Embed(
-        title="Daily Reward",
-        description=f"You have claimed your daily reward of <:casino_tip2:1369628815709569044> {base_reward} coins!\nYou now have <:casino_tip2:1369628815709569044> {user_balances[user_id]} coins.",
-        color=discord.Color.green()
-    )
-    embed.set_author(name=interaction.user.name, icon_url=interaction.user.avatar.url)
-    await interaction.response.send_message(embed=embed)
+    embed = render.DAILY_CLAIMED.render(author=interaction.user, reward=base_reward, balance=ledger.balance(user_id))
+    await respond(interaction, bonus_message, embed=embed)
 
 # ==============================================================================================
 
 # スラッシュコマンド: /give
 @bot.tree.command(name="give", description="Give coins to another user.")
 @app_commands.describe(user="Select a user to give coins to", amount="Enter the amount of coins to give")
+@auto_defer()
 async def give(interaction: discord.Interaction, user: discord.Member, amount: int):
     giver_id = interaction.user.id
     receiver_id = user.id
 
-    # 所持金の確認
-    if giver_id not in user_balances or user_balances[giver_id] < amount:
-        embed = discord.Embed(
-            title="Error",
-            description="You don't have enough coins to give.",
-            color=discord.Color.red()
-        )
-        embed.set_author(name=interaction.user.name, icon_url=interaction.user.avatar.url)
-        await interaction.response.send_message(embed=embed)
+    if amount <= 0:
+        await respond(interaction, "Please enter a valid amount of coins to give.", ephemeral=True)
         return
 
-    # 受取人の所持金を更新
-    user_balances[giver_id] -= amount
-    user_balances[receiver_id] = user_balances.get(receiver_id, 0) + amount
+    # 所持金の確認と送金を同時に行う（足りない場合は送金されない）
+    provision(interaction.user, interaction.guild)
+    provision(user, interaction.guild)
+    if not await ledger.transfer(giver_id, receiver_id, amount):
+        embed = render.GIVE_NOT_ENOUGH.render(author=interaction.user)
+        await respond(interaction, embed=embed)
+        return
 
-    embed = discord.Embed(
-        title="Coins Given",
-        description=f"You have given <:casino_tip2:1369628815709569044> {amount} coins to {user.name}.\nYou now have <:casino_tip2:1369628815709569044> {user_balances[giver_id]} coins.",
-        color=discord.Color.green()
-    )
-    embed.set_author(name=interaction.user.name, icon_url=interaction.user.avatar.url)
-    await interaction.response.send_message(embed=embed)
+    embed = render.GIVE_DONE.render(author=interaction.user, amount=amount, receiver=user.name, balance=ledger.balance(giver_id))
+    await respond(interaction, embed=embed)
 
 # ----------------------------------------------------------------------------------------------
 
 # スラッシュコマンド: /rob
 @bot.tree.command(name="rob", description="Rob coins from a random user.")
+@auto_defer()
 async def rob(interaction: discord.Interaction):
     robber_id = interaction.user.id
-    now = datetime.now(JST)  # 現在の日本時間を取得
-
-    # 最後の実行日時を確認
-    if robber_id in last_rob_attempt:
-        last_attempt_time = last_rob_attempt[robber_id]
-        if last_attempt_time.date() == now.date():
-            embed = discord.Embed(
-                title="Robbery Limit Reached",
-                description="You can only rob once per day. Please try again tomorrow!",
-                color=discord.Color.red()
-            )
-            embed.set_author(name=interaction.user.name, icon_url=interaction.user.avatar.url)
-            await interaction.response.send_message(embed=embed, ephemeral=True)
-            return
+    provision(interaction.user, interaction.guild)
 
-    # 抽選対象のユーザーを取得（所持金が0より大きいユーザーのみ）
-    eligible_users = [
-        member for member in interaction.guild.members
-        if not member.bot and user_balances.get(member.id, 0) > 0 and member.id != robber_id
-    ]
-
-    if not eligible_users:
-        embed = discord.Embed(
-            title="Error",
-            description="No eligible users to rob. All users have 0 or negative balance.",
-            color=discord.Color.red()
-        )
-        embed.set_author(name=interaction.user.name, icon_url=interaction.user.avatar.url)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+    # 今日すでに実行しているか確認
+    if rob_quota.check(robber_id):
+        embed = render.ROB_LIMIT.render(author=interaction.user)
+        await respond(interaction, embed=embed, ephemeral=True)
         return
 
-    # 無作為に対象を選択
-    victim = random.choice(eligible_users)
-    victim_id = victim.id
+    # 抽選対象（所持金が0より大きいユーザーのみ）から無作為に対象を選択
+    # 対象・強奪額（100～500）・成否（50%で失敗）は、再現できるよう待機を挟まずに続けて抽選する
+    index = await get_rob_index(interaction.guild)
+    rng_key = rob_rng.tell()
+    if ROB_WEIGHTED:
+        victim_id = index.pick_weighted(exclude=robber_id, rng=rob_rng)
+    else:
+        victim_id = index.pick(exclude=robber_id, rng=rob_rng)
+    amount = rob_rng.randint(100, 500)
+    failed = rob_rng.random() < 0.5
+    victim = await get_member(interaction.guild, victim_id) if victim_id is not None else None
+
+    if victim is None:
+        embed = render.ROB_NO_TARGET.render(author=interaction.user)
+        await respond(interaction, embed=embed, ephemeral=True)
+        return
+    provision(victim, interaction.guild)
 
-    # 強奪額をランダムに設定（100～500の間）
-    amount = random.randint(100, 500)
+    # 最後の実行日を更新（失敗した場合も1回と数える）
+    if rob_quota.acquire(robber_id):
+        embed = render.ROB_LIMIT.render(author=interaction.user)
+        await respond(interaction, embed=embed, ephemeral=True)
+        return
 
-    # 50%の確率で強奪に失敗
-    if random.random() < 0.5:
-        # 強奪失敗: 実行者が被害者に所持金を奪われる
-        if user_balances[robber_id] < amount:
-            amount = user_balances[robber_id]  # 実行者の所持金が足りない場合、全額を奪われる
+    game_rng.record("rob", rng_key, user_id=robber_id, victim_id=victim_id, amount=amount, failed=failed)
 
-        user_balances[robber_id] -= amount
-        user_balances[victim_id] += amount
+    if failed:
+        # 強奪失敗: 実行者が被害者に所持金を奪われる（実行者の所持金が足りない場合、全額を奪われる）
+        amount = await ledger.transfer(robber_id, victim_id, amount, clamp=True)
 
         # 実行側に通知
-        embed = discord.Embed(
-            title="Robbery Failed!",
-            description=f"You tried to rob {victim.name}, but failed!\n"
-                        f"{victim.name} has robbed <:casino_tip2:1369628815709569044> {amount} coins from you instead.\n"
-                        f"You now have <:casino_tip2:1369628815709569044> {user_balances[robber_id]} coins.",
-            color=discord.Color.red()
-        )
-        embed.set_author(name=interaction.user.name, icon_url=interaction.user.avatar.url)
-        await interaction.response.send_message(embed=embed)
+        embed = render.ROB_FAILED.render(author=interaction.user, victim=victim.name, amount=amount, balance=ledger.balance(robber_id))
+        await respond(interaction, embed=embed)
         return
 
-    # 強奪成功
-    if user_balances[victim_id] < amount:
-        amount = user_balances[victim_id]  # 被害者の所持金が足りない場合、全額を奪う
-
-    user_balances[robber_id] += amount
-    user_balances[victim_id] -= amount
+    # 強奪成功（被害者の所持金が足りない場合、全額を奪う）
+    amount = await ledger.transfer(victim_id, robber_id, amount, clamp=True)
 
     # 実行側に通知
-    embed = discord.Embed(
-        title="Robbery Successful!",
-        description=f"You have successfully robbed <:casino_tip2:1369628815709569044> {amount} coins from {victim.name}.\n"
-                    f"You now have <:casino_tip2:1369628815709569044> {user_balances[robber_id]} coins.",
-        color=discord.Color.green()
-    )
-    embed.set_author(name=interaction.user.name, icon_url=interaction.user.avatar.url)
-    await interaction.response.send_message(embed=embed)
+    embed = render.ROB_SUCCESS.render(author=interaction.user, victim=victim.name, amount=amount, balance=ledger.balance(robber_id))
+    await respond(interaction, embed=embed)
 
     # 被害者側に通知
-    embed_victim = discord.Embed(
-        title="Robbery Alert!",
-        description=f"You have been robbed by {interaction.user.name}!\n"
-                    f"You lost <:casino_tip2:1369628815709569044> {amount} coins.\n"
-                    f"You now have <:casino_tip2:1369628815709569044> {user_balances[victim_id]} coins.",
-        color=discord.Color.red()
-    )
-    embed_victim.set_author(name=victim.name, icon_url=victim.display_avatar.url)
-    await interaction.channel.send(embed=embed_victim)
-    await interaction.channel.send(content=f"{victim.mention}")
-
-    # 最後の実行日時を更新
-    last_rob_attempt[robber_id] = now
+    embed_victim = render.ROB_ALERT.render(author=victim, robber=interaction.user.name, amount=amount, balance=ledger.balance(victim_id))
+    outbox.send(interaction.channel, embed=embed_victim)
+    outbox.send(interaction.channel, victim.mention)
 
 # ==============================================================================================
 
 # スラッシュコマンド: /balance
 @bot.tree.command(name="balance", description="Check your balance or another user's balance.")
 @app_commands.describe(user="Select a user to check their balance (optional).")
+@auto_defer()
 async def balance(interaction: discord.Interaction, user: discord.Member = None):
     # ユーザーが指定されていない場合は実行者を対象にする
     target_user = user or interaction.user
     user_id = target_user.id
 
-    if user_id in user_balances:
-        balance = user_balances[user_id]
-        embed = discord.Embed(
-            title="Balance",
-            description=f"{target_user.name} has {"<:casino_tip2:1369628815709569044>"} {balance}.",
-            color=discord.Color.green()
-        )
-        embed.set_author(name=target_user.name, icon_url=target_user.avatar.url)
-        await interaction.response.send_message(embed=embed)
+    # サーバー内のメンバーは初回の参照時にアカウントを作成する
+    if interaction.guild:
+        provision(target_user, interaction.guild)
+
+    if ledger.has_account(user_id):
+        balance = ledger.balance(user_id)
+        embed = render.BALANCE.render(author=target_user, name=target_user.name, balance=balance)
+        await respond(interaction, embed=embed)
     else:
-        embed = discord.Embed(
-            title="Error",
-            description=f"{target_user.name} does not have a balance yet.",
-            color=discord.Color.red()
-        )
-        embed.set_author(name=target_user.name, icon_url=target_user.avatar.url)
-        await interaction.response.send_message(embed=embed)
+        embed = render.BALANCE_MISSING.render(author=target_user, name=target_user.name)
+        await respond(interaction, embed=embed)
 
 # ----------------------------------------------------------------------------------------------
 
 # スラッシュコマンド: /balance_all
 @bot.tree.command(name="balance_all", description="Check the balance of all members in the server.")
-async def balance_all(interaction: discord.Interaction):
+@app_commands.describe(page="Page number of the ranking (optional)")
+@auto_defer()
+async def balance_all(interaction: discord.Interaction, page: int = 1):
     guild = interaction.guild
     if not guild:
-        await interaction.response.send_message("This command can only be used in a server.", ephemeral=True)
+        await respond(interaction, "This command can only be used in a server.", ephemeral=True)
         return
 
-    # 全メンバーの所持金を取得
-    balances = []
-    for member in guild.members:
-        if not member.bot:  # ボットを除外
-            balance = user_balances.get(member.id, 0)
-            balances.append((member.name, balance))
-
-    if not balances:
-        await interaction.response.send_message("No balances found for members.", ephemeral=True)
+    # ランキングから指定ページ分だけ取得（ボットは除外済み）
+    board = await get_leaderboard(guild)
+    if not len(board):
+        await respond(interaction, "No balances found for members.", ephemeral=True)
         return
 
-    balances = sorted(balances, key=lambda x: x[1], reverse=True)  # 所持金でソート
+    page_count = board.page_count()
+    page = min(max(page, 1), page_count)
 
     # Embedメッセージで出力
-    embed = discord.Embed(
-        title="All Members' Balances",
-        color=discord.Color.blue()
-    )
+    embed = render.BALANCE_ALL.render(footer_user=interaction.user, page=page, page_count=page_count, name=interaction.user.name)
 
-    for name, balance in balances:
+    rows = board.page(page)
+    names = await member_names(guild, [user_id for user_id, _ in rows])
+    for user_id, balance in rows:
         embed.add_field(
-            name=name,
-            value=f"<:casino_tip2:1369628815709569044> {balance} coins",
+            name=names.get(user_id, str(user_id)),
+            value=render.COINS(balance=balance),
             inline=False
         )
 
-    embed.set_footer(text=f"Requested by {interaction.user.name}", icon_url=interaction.user.avatar.url)
-    await interaction.response.send_message(embed=embed)
+    await respond(interaction, embed=embed)
 
-# ==============================================================================================
+# ----------------------------------------------------------------------------------------------
 
-# スラッシュコマンド: /roulette
-@bot.tree.command(name="roulette", description="Play roulette. Usage: /roulette <amount> <option> <number>")
-@app_commands.describe(amount="The amount to bet (or type 'all' to bet all your coins)", option="Choose your bet option", number="Choose a number between 0 and 36 (only for 'Number')")
-@app_commands.choices(
-    option=[
-        app_commands.Choice(name="Even", value="even"),
-        app_commands.Choice(name="Odd", value="odd"),
-        app_commands.Choice(name="Small (1-12)", value="small"),
-        app_commands.Choice(name="Medium (13-24)", value="medium"),
-        app_commands.Choice(name="Large (25-36)", value="large"),
-        app_commands.Choice(name="First Half (1-18)", value="first"),
-        app_commands.Choice(name="Second Half (19-36)", value="second"),
-        app_commands.Choice(name="Number", value="number"),
-    ]
-)
-async def roulette(interaction: discord.Interaction, amount: str, option: app_commands.Choice[str], number: int = None):
-    # 入力の検証
-    if option.value == "number" and (number is None or number < 0 or number > 36):
-        await interaction.response.send_message("Please specify a valid number between 0 and 36 after selecting 'Number'.", ephemeral=True)
+# スラッシュコマンド: /rank
+@bot.tree.command(name="rank", description="Check your rank or another user's rank in the server.")
+@app_commands.describe(user="Select a user to check their rank (optional).")
+@auto_defer()
+async def rank(interaction: discord.Interaction, user: discord.Member = None):
+    guild = interaction.guild
+    if not guild:
+        await respond(interaction, "This command can only be used in a server.", ephemeral=True)
         return
 
-    user_id = interaction.user.id
-    if user_id not in user_balances:
-        user_balances[user_id] = 0  # 所持金が未設定の場合は0に初期化
-
-    # 賭け金の検証
-    max_bet = 5000 if user_balances[user_id] >= 0 else 500
+    target_user = user or interaction.user
+    provision(target_user, guild)
+    board = await get_leaderboard(guild)
+    position = board.rank(target_user.id)
 
-    # "all"が指定された場合、所持金全額を賭ける
-    if amount.lower() == "all":
-        amount = user_balances[user_id]
-        if amount <= 0:
-            await interaction.response.send_message("You don't have any coins to bet.", ephemeral=True)
-            return
+    if position is None:
+        embed = render.RANK_MISSING.render(author=target_user, name=target_user.name)
     else:
-        try:
+        embed = render.RANK.render(
+            author=target_user, name=target_user.name, position=position, count=len(board), balance=ledger.balance(target_user.id)
+        )
+    await respond(interaction, embed=embed)
+
+# ----------------------------------------------------------------------------------------------
+
+# スラッシュコマンド: /starting_balance（管理者用）
+@bot.tree.command(name="starting_balance", description="Set the starting balance for new members in this server.")
+@app_commands.describe(amount="The starting balance given to members on their first use")
+@app_commands.default_permissions(manage_guild=True)
+@auto_defer(ephemeral=True)
+async def starting_balance(interaction: discord.Interaction, amount: int):
+    guild = interaction.guild
+    if not guild:
+        await respond(interaction, "This command can only be used in a server.", ephemeral=True)
+        return
+
+    if amount < 0:
+        await respond(interaction, "Please enter a valid starting balance.", ephemeral=True)
+        return
+
+    await ledger.set_starting_balance(guild.id, amount)
+
+    # アカウント未作成のメンバーの所持金が変わるため、索引は次回の参照時に作り直す
+    leaderboard.drop_guild(guild.id)
+    rob_index.drop_guild(guild.id)
+
+    await respond(interaction, render.STARTING_BALANCE_SET(amount=amount), ephemeral=True)
+
+# ==============================================================================================
+
+# ルーレットの賭け方（/roulette の選択肢と、複数の賭けの結果に表示する名前）
+ROULETTE_OPTIONS = [
+    app_commands.Choice(name="Even", value="even"),
+    app_commands.Choice(name="Odd", value="odd"),
+    app_commands.Choice(name="Small (1-12)", value="small"),
+    app_commands.Choice(name="Medium (13-24)", value="medium"),
+    app_commands.Choice(name="Large (25-36)", value="large"),
+    app_commands.Choice(name="First Half (1-18)", value="first"),
+    app_commands.Choice(name="Second Half (19-36)", value="second"),
+    app_commands.Choice(name="Number", value="number"),
+]
+ROULETTE_OPTION_NAMES = {choice.value: choice.name for choice in ROULETTE_OPTIONS}
+ROULETTE_MAX_BETS = 10  # 1回のスピンにまとめられる賭けの数
+ROULETTE_BETS_USAGE = 'Write bets as "<option> <amount>" separated by commas, e.g. "even 100, number 7 50, large 200".'
+
+
+# 複数の賭けの入力（"even 100, number 7 50, large 200"）を読む関数
+# 数字だけの賭け方（"7 50"）は"number"とみなす。"all"は賭けが1つの場合だけ使える
+# 戻り値: ([(賭け方, 数字, 賭け金), ...], エラーメッセージ)
+def parse_roulette_bets(text):
+    parts = [part.split() for part in text.replace(";", ",").split(",") if part.strip()]
+    if not parts:
+        return None, ROULETTE_BETS_USAGE
+    if len(parts) > ROULETTE_MAX_BETS:
+        return None, f"You can place up to {ROULETTE_MAX_BETS} bets per spin."
+
+    bets = []
+    for tokens in parts:
+        option, number = tokens[0].lower(), None
+        if option.isdigit():
+            option, tokens = "number", ["number"] + tokens
+        if option == "number" and len(tokens) == 3 and tokens[1].isdigit():
+            number = int(tokens[1])
+            if number >= ROULETTE_POCKET_COUNT:
+                return None, "Please specify a valid number between 0 and 36."
+        elif option not in ROULETTE_POCKETS or len(tokens) != 2:
+            return None, f'Could not read the bet "{" ".join(tokens)}". ' + ROULETTE_BETS_USAGE
+
+        amount = tokens[-1].lower()
+        if amount == "all":
+            if len(parts) > 1:
+                return None, "You can only bet 'all' on a single bet."
+        elif amount.isdigit() and int(amount) > 0:
             amount = int(amount)
-        except ValueError:
-            await interaction.response.send_message("Please enter a valid number for the bet amount.", ephemeral=True)
+        else:
+            return None, f'Please enter a valid bet amount for "{" ".join(tokens)}".'
+        bets.append((option, number, amount))
+    return bets, None
+
+
+# ルーレットを1回まわし、賭けごとの払い戻し額をポケットの配当表の行から求める関数
+# bets: [(配当表の列, 賭け金), ...] / 戻り値: (ポケット, [払い戻し額, ...])
+def spin_roulette(user_id, bets):
+    rng_key = roulette_rng.tell()
+    result = roulette_rng.below(ROULETTE_POCKET_COUNT)
+    game_rng.record("roulette", rng_key, user_id=user_id, pocket=result, bets=[[ROULETTE_BETS[column], amount] for column, amount in bets])
+    row = ROULETTE_TABLE[result]
+    return result, [amount * row[column] for column, amount in bets]
+
+# ----------------------------------------------------------------------------------------------
+
+# スラッシュコマンド: /roulette
+@bot.tree.command(name="roulette", description="Play roulette. Usage: /roulette <amount> <option> <number> or /roulette bets:<even 100, number 7 50>")
+@app_commands.describe(
+    amount="The amount to bet (or type 'all' to bet all your coins)",
+    option="Choose your bet option",
+    number="Choose a number between 0 and 36 (only for 'Number')",
+    bets="Several bets on one spin, e.g. 'even 100, number 7 50, large 200'",
+)
+@app_commands.choices(option=ROULETTE_OPTIONS)
+@auto_defer()
+async def roulette(interaction: discord.Interaction, amount: str = None, option: app_commands.Choice[str] = None, number: int = None, bets: str = None):
+    if bets is not None:
+        if amount is not None or option is not None:
+            await respond(interaction, "Please use either amount and option, or bets, not both.", ephemeral=True)
             return
+        await roulette_bets(interaction, bets)
+        return
 
-    if amount <= 0:
-        await interaction.response.send_message("Please enter a valid bet amount.", ephemeral=True)
+    # 入力の検証
+    if amount is None or option is None:
+        await respond(interaction, "Please specify an amount and an option, or several bets with bets.", ephemeral=True)
+        return
+    if option.value == "number" and (number is None or number < 0 or number > 36):
+        await respond(interaction, "Please specify a valid number between 0 and 36 after selecting 'Number'.", ephemeral=True)
         return
 
-    # all以外の時に、賭け金が最大賭け金を超えている場合
-    if amount != user_balances[user_id] and amount > max_bet:
-        await interaction.response.send_message(f"Your bet amount exceeds the maximum limit of <:casino_tip2:1369628815709569044> {max_bet}.", ephemeral=True)
+    user_id = interaction.user.id
+
+    # 賭け金を検証して先に差し引く
+    amount, balance, error = await place_bet(interaction.user, interaction.guild, amount)
+    if error:
+        await respond(interaction, error, ephemeral=True)
         return
 
     # 賭け金が所持金を超えている場合の警告を追加
-    if user_balances[user_id] >= 0 and user_balances[user_id] < amount:
-        channel = interaction.channel
-        await channel.send(
-            f"{interaction.user.mention}\nWarning: You are betting more than your current balance <:casino_tip2:1369628815709569044> {user_balances[user_id]}.\nYour balance will go negative if you lose."
-        )
+    warning = None
+    if balance >= 0 and balance < amount:
+        warning = render.BET_WARNING(mention=interaction.user.mention, balance=balance)
 
-    # Embedメッセージで賭け情報を送信
-    embed_description = (
-        f"**Bet Amount**\n<:casino_tip2:1369628815709569044> {amount} coins\n\n"
-        f"**Bet Option**\n{option.name}\n"
-    )
+    # Embedメッセージで賭け情報を送信（警告は同じメッセージの本文に付ける）
     if option.value == "number":
-        embed_description += f"\n**Chosen Number**\n{number}"
-
-    embed = discord.Embed(
-        title="Roulette Bet",
-        description=embed_description,
-        color=discord.Color.blue()
+        embed = render.ROULETTE_BET_NUMBER.render(author=interaction.user, amount=amount, option=option.name, number=number)
+    else:
+        embed = render.ROULETTE_BET.render(author=interaction.user, amount=amount, option=option.name)
+    await respond(interaction, warning, embed=embed)
+
+    # ルーレットの結果を計算し、配当表で勝敗を判定
+    result, (winnings,) = spin_roulette(user_id, [(roulette_column(option.value, number), amount)])
+    won = winnings > 0
+    if won:
+        await ledger.credit(user_id, winnings)
+    messages = render.ROULETTE_WIN if won else render.ROULETTE_LOSE
+    result_message = messages[option.value](
+        result=result, parity="even" if result % 2 == 0 else "odd", amount=amount, winnings=winnings,
+        name=interaction.user.name, balance=ledger.balance(user_id)
     )
-    embed.set_author(name=interaction.user.name, icon_url=interaction.user.avatar.url)
-    await interaction.response.send_message(embed=embed)
 
-    # 賭けた分を先に減らす
-    user_balances[user_id] -= amount
+    # 通常のメッセージで結果を送信
+    await respond(interaction, result_message)
 
-    # ルーレットの結果を計算
-    result = random.randint(0, 36)
-    result_type = "even" if result % 2 == 0 else "odd"
 
-    # 勝敗判定
-    if option.value == "number":
-        if result == number:
-            user_balances[user_id] += amount * 36
-            result_message = f"The roulette landed on {result}.\nYOU WIN! The number matched! You gained <:casino_tip2:1369628815709569044> {amount * 36}.\n\n{interaction.user.name} now have <:casino_tip2:1369628815709569044> {user_balances[user_id]}."
-        else:
-            result_message = f"The roulette landed on {result}.\nYOU LOSE... The number didn't match. You lost <:casino_tip2:1369628815709569044> {amount}.\n\n{interaction.user.name} now have <:casino_tip2:1369628815709569044> {user_balances[user_id]}."
-    elif option.value == "small" and 1 <= result <= 12:
-        user_balances[user_id] += amount * 3
-        result_message = f"The roulette landed on {result}.\nYOU WIN! The range matched! You gained <:casino_tip2:1369628815709569044> {amount * 3}.\n\n{interaction.user.name} now have <:casino_tip2:1369628815709569044> {user_balances[user_id]}."
-    elif option.value == "medium" and 13 <= result <= 24:
-        user_balances[user_id] += amount * 3
-        result_message = f"The roulette landed on {result}.\nYOU WIN! The range matched! You gained <:casino_tip2:1369628815709569044> {amount * 3}.\n\n{interaction.user.name} now have <:casino_tip2:1369628815709569044> {user_balances[user_id]}."
-    elif option.value == "large" and 25 <= result <= 36:
-        user_balances[user_id] += amount * 3
-        result_message = f"The roulette landed on {result}.\nYOU WIN! The range matched! You gained <:casino_tip2:1369628815709569044> {amount * 3}.\n\n{interaction.user.name} now have <:casino_tip2:1369628815709569044> {user_balances[user_id]}."
-    elif option.value == "first" and 1 <= result <= 18:
-        user_balances[user_id] += amount * 2
-        result_message = f"The roulette landed on {result}.\nYOU WIN! The range matched! You gained <:casino_tip2:1369628815709569044> {amount * 2}.\n\n{interaction.user.name} now have <:casino_tip2:1369628815709569044> {user_balances[user_id]}."
-    elif option.value == "second" and 19 <= result <= 36:
-        user_balances[user_id] += amount * 2
-        result_message = f"The roulette landed on {result}.\nYOU WIN! The range matched! You gained <:casino_tip2:1369628815709569044> {amount * 2}.\n\n{interaction.user.name} now have <:casino_tip2:1369628815709569044> {user_balances[user_id]}."
-    elif option.value == "even" and result_type == "even":
-        user_balances[user_id] += amount * 2
-        result_message = f"The roulette landed on {result} ({result_type}).\nYOU WIN! You gained <:casino_tip2:1369628815709569044> {amount * 2}.\n\n{interaction.user.name} now have <:casino_tip2:1369628815709569044> {user_balances[user_id]}."
-    elif option.value == "odd" and result_type == "odd":
-        user_balances[user_id] += amount * 2
-        result_message = f"The roulette landed on {result} ({result_type}).\nYOU WIN! You gained <:casino_tip2:1369628815709569044> {amount * 2}.\n\n{interaction.user.name} now have <:casino_tip2:1369628815709569044> {user_balances[user_id]}."
-    else:
-        result_message = f"The roulette landed on {result}.\nYOU LOSE... You lost <:casino_tip2:1369628815709569044> {amount}.\n\n{interaction.user.name} now have <:casino_tip2:1369628815709569044> {user_balances[user_id]}."
+# 複数の賭けを1回のスピンで判定し、結果を1つのメッセージで送る
+# 最大賭け金は賭けの合計に対して検証し、合計をまとめて差し引いてから当たりの分をまとめて払い戻す
+async def roulette_bets(interaction, text):
+    bets, error = parse_roulette_bets(text)
+    if error:
+        await respond(interaction, error, ephemeral=True)
+        return
 
-    # 通常のメッセージで結果を送信
-    await interaction.followup.send(result_message)
+    user_id = interaction.user.id
+    total = bets[0][2] if bets[0][2] == "all" else str(sum(amount for _, _, amount in bets))
+    stake, balance, error = await place_bet(interaction.user, interaction.guild, total)
+    if error:
+        await respond(interaction, error, ephemeral=True)
+        return
+    if total == "all":
+        bets = [(bets[0][0], bets[0][1], stake)]
+
+    warning = None
+    if balance >= 0 and balance < stake:
+        warning = render.BET_WARNING(mention=interaction.user.mention, balance=balance)
+
+    result, payouts = spin_roulette(user_id, [(roulette_column(option, number), amount) for option, number, amount in bets])
+    payout = sum(payouts)
+    if payout:
+        await ledger.credit(user_id, payout)
+
+    lines = []
+    for (option, number, amount), paid in zip(bets, payouts):
+        name = f"Number {number}" if option == "number" else ROULETTE_OPTION_NAMES[option]
+        line = render.ROULETTE_SPIN_WIN if paid else render.ROULETTE_SPIN_LOSE
+        lines.append(line(option=name, amount=amount, payout=paid))
+
+    embed = render.ROULETTE_SPIN.render(
+        author=interaction.user, color=render.GREEN if payout > stake else render.RED if payout < stake else None,
+        result=result, parity="even" if result % 2 == 0 else "odd", lines="\n".join(lines),
+        stake=stake, payout=payout, net=payout - stake, name=interaction.user.name, balance=ledger.balance(user_id)
+    )
+    await respond(interaction, warning, embed=embed)
 
 # ----------------------------------------------------------------------------------------------
 
 # スラッシュコマンド: /blackjack
 @bot.tree.command(name="blackjack", description="Play blackjack. Usage: /blackjack <amount>")
 @app_commands.describe(amount="The amount to bet (or type 'all' to bet all your coins)")
+@auto_defer()
 async def blackjack(interaction: discord.Interaction, amount: str):
     channel_id = interaction.channel.id
     user_id = interaction.user.id
 
-    if user_id not in user_balances:
-        user_balances[user_id] = 0  # 所持金が未設定の場合は0に初期化
-
-    # 賭け金の検証
-    max_bet = 5000 if user_balances[user_id] >= 0 else 500
-
-    # "all"が指定された場合、所持金全額を賭ける
-    if amount.lower() == "all":
-        amount = user_balances[user_id]
-        if amount <= 0:
-            await interaction.response.send_message("You don't have any coins to bet.", ephemeral=True)
-            return
-    else:
-        try:
-            amount = int(amount)
-        except ValueError:
-            await interaction.response.send_message("Please enter a valid number for the bet amount.", ephemeral=True)
-            return
-
-    if amount <= 0:
-        await interaction.response.send_message("Please enter a valid bet amount.", ephemeral=True)
+    # 進行中のゲームを上書きすると預かった賭け金が失われるため、同じチャンネルでの二重開始を防ぐ
+    if channel_id in blackjack_games:
+        await respond(interaction, "A blackjack game is already in progress in this channel.", ephemeral=True)
         return
-
-    # all以外の時に、賭け金が最大賭け金を超えている場合
-    if amount != user_balances[user_id] and amount > max_bet:
-        await interaction.response.send_message(f"Your bet amount exceeds the maximum limit of <:casino_tip2:1369628815709569044> {max_bet}.", ephemeral=True)
+    if blackjack_games.full():
+        await respond(interaction, render.BLACKJACK_TABLES_FULL, ephemeral=True)
         return
 
-    # 賭け金が所持金を超えている場合の警告を追加
-    if user_balances[user_id] >= 0 and user_balances[user_id] < amount:
-        channel = interaction.channel
-        await channel.send(
-            f"{interaction.user.mention}\nWarning: You are betting more than your current balance <:casino_tip2:1369628815709569044> {user_balances[user_id]}.\nYour balance will go negative if you lose."
-        )
+    # 賭け金を検証して先に差し引く（勝敗が決まった時点で払い戻す）
+    amount, balance, error = await place_bet(interaction.user, interaction.guild, amount)
+    if error:
+        await respond(interaction, error, ephemeral=True)
+        return
 
-    # デッキを作成してシャッフル
-    deck = create_deck()
-    random.shuffle(deck)
+    # チャンネルのシューからカードを配る（必要な場合だけシャッフルし直す）
+    shoe = get_shoe(interaction.channel)
+    shoe.start_round()
 
     # プレイヤーとディーラーの手札を配る
-    player_hand = [deck.pop(), deck.pop()]
-    dealer_hand = [deck.pop(), deck.pop()]
+    player_hand = Hand((shoe.deal(), shoe.deal()))
+    dealer_hand = Hand((shoe.deal(), shoe.deal()))
+    game_rng.record("blackjack", shoe.replay_key(), channel_id=channel_id, user_id=user_id)
 
-    # ゲーム状態を保存
-    blackjack_games[channel_id] = {
+    # ゲーム状態を保存（警告の送信中に同じチャンネルで開始されないよう、先に登録する）
+    game = {
         "mode": "single",
-        "deck": deck,
+        "shoe": shoe,
         "player_hand": player_hand,
         "dealer_hand": dealer_hand,
         "bet": amount,
         "current_turn": user_id,
         "double_down_allowed": True
     }
+    if channel_id in blackjack_games or not blackjack_games.add(channel_id, game):
+        # 賭け金の差し引き中に他のゲームが始まった、または上限に達した場合は賭け金を返す
+        await ledger.credit(user_id, amount)
+        if channel_id in blackjack_games:
+            await respond(interaction, "A blackjack game is already in progress in this channel.", ephemeral=True)
+        else:
+            await respond(interaction, render.BLACKJACK_TABLES_FULL, ephemeral=True)
+        return
+
+    # 賭け金が所持金を超えている場合の警告を追加（最初の応答の本文に付ける）
+    warning = None
+    if balance >= 0 and balance < amount:
+        warning = render.BET_WARNING(mention=interaction.user.mention, balance=balance)
 
     # ナチュラル21の判定
-    player_value = calculate_hand_value(player_hand)
-    dealer_value = calculate_hand_value(dealer_hand)
+    player_value = player_hand.value
+    dealer_value = dealer_hand.value
 
     if player_value == 21:
         if dealer_value == 21:
-            # 引き分け
-            embed = discord.Embed(
-                title="Blackjack - It's a Draw!",
-                description=(
-                    f"**Your Hand**: {', '.join(player_hand)} (Value: 21)\n"
-                    f"**Dealer's Hand**: {', '.join(dealer_hand)} (Value: 21)\n\n"
-                    "It's a draw! Your balance remains the same.\n"
-                    f"Your new balance is <:casino_tip2:1369628815709569044> {user_balances[user_id]} coins."
-                ),
-                color=discord.Color.orange()
+            # 引き分け: 賭け金を払い戻す
+            await ledger.credit(user_id, amount * BLACKJACK_DRAW_PAYOUT)
+            embed = render.BLACKJACK_NATURAL_DRAW.render(
+                hand=player_hand, value=21, dealer_hand=dealer_hand, dealer_value=21, balance=ledger.balance(user_id)
             )
-            await interaction.response.send_message(embed=embed)
+            await respond(interaction, warning, embed=embed)
             del blackjack_games[channel_id]  # ゲームを終了
             return
         else:
             # プレイヤーの勝利（ナチュラル21）
-            winnings = int(amount * 2.5)
-            user_balances[user_id] += winnings
-            embed = discord.Embed(
-                title="Blackjack - Natural 21!",
-                description=(
-                    f"**Your Hand**: {', '.join(player_hand)} (Value: 21)\n"
-                    f"**Dealer's Hand**: {', '.join(dealer_hand)} (Value: {dealer_value})\n\n"
-                    f"You got a Natural 21! You win <:casino_tip2:1369628815709569044> {winnings} coins.\n"
-                    f"Your new balance is <:casino_tip2:1369628815709569044> {user_balances[user_id]} coins."
-                ),
-                color=discord.Color.green()
+            winnings = int(amount * BLACKJACK_NATURAL_PAYOUT)
+            await ledger.credit(user_id, winnings)
+            embed = render.BLACKJACK_NATURAL.render(
+                hand=player_hand, value=21, dealer_hand=dealer_hand, dealer_value=dealer_value,
+                winnings=winnings, balance=ledger.balance(user_id)
             )
-            await interaction.response.send_message(embed=embed)
+            await respond(interaction, warning, embed=embed)
             del blackjack_games[channel_id]  # ゲームを終了
             return
 
     # プレイヤーとディーラーの手札を表示（ディーラーの2枚目は裏向き）
-    embed = discord.Embed(
-        title="Blackjack",
-        description=(
-            f"**Your Hand**: {', '.join(player_hand)} (Value: {calculate_hand_value(player_hand)})\n"
-            f"**Dealer's Hand**: {dealer_hand[0]}, ❓"
-        ),
-        color=discord.Color.blue()
-    )
-    embed.set_footer(text="Type '/hit' to draw another card or '/stand' to end your turn.")
-    await interaction.response.send_message(embed=embed)
+    embed = render.BLACKJACK_HAND.render(hand=player_hand, value=player_hand.value, upcard=card_name(dealer_hand[0]))
+    await respond(interaction, warning, embed=embed)
 
 # ----------------------------------------------------------------------------------------------
 
 # スラッシュコマンド: /multi_bj
 @bot.tree.command(name="multi_bj", description="Start a multiplayer blackjack game. Up to 4 players can join.")
 @app_commands.describe(amount="The amount to bet (or type 'all' to bet all your coins)")
+@auto_defer()
 async def multi_bj(interaction: discord.Interaction, amount: str):
     user_id = interaction.user.id
-    if user_id not in user_balances:
-        user_balances[user_id] = 0  # 所持金が未設定の場合は0に初期化
+    channel_id = interaction.channel.id
 
-    user_id = interaction.user.id
-    if user_id not in user_balances:
-        user_balances[user_id] = 0  # 所持金が未設定の場合は0に初期化
+    # 同じチャンネルで進行中のゲームがある場合は開始しない
+    if channel_id in blackjack_games:
+        await respond(interaction, "A blackjack game is already in progress in this channel.", ephemeral=True)
+        return
+    if blackjack_games.full():
+        await respond(interaction, render.BLACKJACK_TABLES_FULL, ephemeral=True)
+        return
+    # 別のチャンネルのマルチプレイヤーの対戦に参加中の場合は開始しない
+    other = active_multi_game(user_id)
+    if other is not None:
+        await respond(interaction, f"You are already in a multiplayer blackjack game in <#{other.channel_id}>.", ephemeral=True)
+        return
+    provision(interaction.user, interaction.guild)  # 所持金が未設定の場合は初期化
 
     # 賭け金の検証
-    max_bet = 5000 if user_balances[user_id] >= 0 else 500
+    max_bet = 5000 if ledger.balance(user_id) >= 0 else 500
 
     # "all"が指定された場合、所持金全額を賭ける
     if amount.lower() == "all":
-        amount = user_balances[user_id]
+        amount = ledger.balance(user_id)
         if amount <= 0:
-            await interaction.response.send_message("You don't have any coins to bet.", ephemeral=True)
+            await respond(interaction, "You don't have any coins to bet.", ephemeral=True)
             return
     else:
         try:
             amount = int(amount)
         except ValueError:
-            await interaction.response.send_message("Please enter a valid number for the bet amount.", ephemeral=True)
+            await respond(interaction, "Please enter a valid number for the bet amount.", ephemeral=True)
             return
 
     if amount <= 0:
-        await interaction.response.send_message("Please enter a valid bet amount.", ephemeral=True)
+        await respond(interaction, "Please enter a valid bet amount.", ephemeral=True)
         return
 
     # all以外の時に、賭け金が最大賭け金を超えている場合
-    if amount != user_balances[user_id] and amount > max_bet:
-        await interaction.response.send_message(f"Your bet amount exceeds the maximum limit of <:casino_tip2:1369628815709569044> {max_bet}.", ephemeral=True)
+    if amount != ledger.balance(user_id) and amount > max_bet:
+        await respond(interaction, render.BET_LIMIT(max_bet=max_bet), ephemeral=True)
         return
 
     # 賭け金が所持金を超えている場合の警告を追加
-    if user_balances[user_id] >= 0 and user_balances[user_id] < amount:
-        channel = interaction.channel
-        await channel.send(
-            f"{interaction.user.mention}\nWarning: You are betting more than your current balance <:casino_tip2:1369628815709569044> {user_balances[user_id]}.\nYour balance will go negative if you lose."
-        )
+    warning = None
+    if ledger.balance(user_id) >= 0 and ledger.balance(user_id) < amount:
+        warning = render.BET_WARNING(mention=interaction.user.mention, balance=ledger.balance(user_id))
 
     # 募集メッセージを送信
-    embed = discord.Embed(
-        title="Multiplayer Blackjack",
-        description=(
-            "React with 🎮 to join the game!\n"
-            "React with ✅ to start the game immediately (at least 2 players required).\n"
-            "Up to 4 players can join.\n"
-            "The game will start in 60 seconds or when 4 players join."
-        ),
-        color=discord.Color.blue()
-    )
-    embed.set_footer(text=f"Hosted by {interaction.user.name}", icon_url=interaction.user.avatar.url)
-    await interaction.response.send_message(embed=embed)
-
+    embed = render.MULTI_RECRUIT.render(footer_user=interaction.user, name=interaction.user.name)
+    await respond(interaction, warning, embed=embed)
     message = await interaction.original_response()
 
+    # ゲームを登録（以降は参加のリアクション・/hit・/stand・時間切れのイベントで進行する）
+    game = MultiGame(channel_id, user_id, interaction.user.name, amount)
+    game.message_id = message.id
+    if channel_id in blackjack_games or active_multi_game(user_id) is not None \
+            or not blackjack_games.add(channel_id, game, timeout=LOBBY_TIMEOUT):
+        outbox.send(message.channel, "The game could not be started. Please try again later.")
+        return
+    multi_players[user_id] = game
+    reaction_routes.add(message.id, partial(on_lobby_reaction, game))
+
     # 募集用のリアクションを追加
     await message.add_reaction("🎮")
     await message.add_reaction("✅")  # Botがチェックマークを送信
 
-    # プレイヤーリストを管理
-    players = [interaction.user]  # コマンド実行者は自動的に参加
-    max_players = 4
+# ----------------------------------------------------------------------------------------------
+
+# ユーザーが参加中（募集中・対戦中）のマルチプレイヤーの対戦を返す関数（なければNone）
+# DMの返信は (DMチャンネルID, user_id) で振り分けるため、2つ目の対戦には参加させない
+def active_multi_game(user_id):
+    game = multi_players.get(user_id)
+    if game is None or game.state not in (LOBBY, PLAYING) or blackjack_games.get(game.channel_id) is not game:
+        return None
+    return game
 
-    def check_reaction(reaction, user):
-        return (
-            reaction.message.id == message.id
-            and str(reaction.emoji) in ["🎮", "✅"]
-            and not user.bot
-        )
 
-    # 30秒間リアクションを待機
-    try:
-        while len(players) < max_players:
-            reaction, user = await bot.wait_for("reaction_add", timeout=60.0, check=check_reaction)
-
-            if str(reaction.emoji) == "🎮" and user not in players:
-                players.append(user)
-                await message.channel.send(f"{user.name} has joined the game! ({len(players)}/{max_players})")
-
-            # チェックマークが押された場合、2人以上で強制開始
-            if str(reaction.emoji) == "✅" and len(players) >= 2:
-                await message.channel.send("✅ reaction received! Starting the game immediately.")
-                break
-    except TimeoutError:
-        pass
-
-    # プレイヤーが1人以下の場合、ゲームをキャンセル
-    if len(players) < 2:
-        await message.channel.send("Not enough players to start the game. The game has been canceled.")
+# 終了・キャンセルした対戦の参加者を解放する関数
+def release_multi_players(game):
+    for user_id in game.players:
+        if multi_players.get(user_id) is game:
+            del multi_players[user_id]
+
+# ----------------------------------------------------------------------------------------------
+
+# リアクションとメッセージは、メッセージIDや (チャンネルID, user_id) で登録先を引いて渡す
+# （待機中のゲームの数によらず、1イベントあたり辞書を1回引くだけで済む）
+@bot.event
+async def on_raw_reaction_add(payload):
+    if payload.member is None or payload.member.bot:
         return
+    await reaction_routes.dispatch(payload.message_id, payload)
 
-    # ゲーム開始
-    await message.channel.send(f"The game is starting with {len(players)} players: {', '.join([player.name for player in players])}!")
-
-    # デッキを作成してシャッフル
-    deck = create_deck()
-    random.shuffle(deck)
-
-    # 各プレイヤーに手札を配る
-    game_state = {player.id: {"hand": [deck.pop(), deck.pop()], "stand": False} for player in players}
-
-    # ゲーム状態を保存
-    blackjack_games[interaction.channel.id] = {
-        "mode": "multi",  # マルチプレイヤーモード
-        "deck": deck,
-        "players": players,
-        "game_state": game_state,
-        "current_turn": players[0].id,  # 最初のプレイヤーのID
-        "dealer_hand": [deck.pop(), deck.pop()]
-    }
 
-    # プレイヤーに手札を送信
-    embed = discord.Embed(
-        title="Blackjack Hands",
-        color=discord.Color.blue()
-    )
+@bot.listen("on_message")
+async def route_reply(message):
+    if message.author.bot:
+        return
+    await reply_routes.dispatch((message.channel.id, message.author.id), message)
 
-    for player in players:
-        if player.id in game_state:
-            player_hand = game_state[player.id]["hand"]
-            embed.add_field(
-                name=f"{player.name}'s Hand",
-                value=f"{', '.join(player_hand)} (Value: {calculate_hand_value(player_hand)})",
-                inline=False
-            )
-    embed.set_footer(text="Type '/hit' to draw another card or '/stand' to end your turn.")
-    await interaction.channel.send(embed=embed)
+# ----------------------------------------------------------------------------------------------
 
-    # ディーラーの手札を作成
-    dealer_hand = [deck.pop(), deck.pop()]
-    dealer_value = calculate_hand_value(dealer_hand)
+# 募集メッセージへのリアクションで参加・開始する
+async def on_lobby_reaction(game, payload):
+    if game.state != LOBBY:
+        return
+    blackjack_games.touch(game.channel_id)
+
+    member = payload.member
+    channel = bot.get_channel(game.channel_id)
+    emoji = str(payload.emoji)
+    if emoji == "🎮":
+        other = active_multi_game(member.id)
+        if other is not None and other is not game:
+            outbox.send(channel, f"{member.name} is already in a multiplayer blackjack game in <#{other.channel_id}>.")
+        elif game.join(member.id, member.name):
+            multi_players[member.id] = game
+            outbox.send(channel, f"{member.name} has joined the game! ({len(game.players)}/4)")
+            if game.is_full():
+                await start_multi_game(channel, game)
+
+    # チェックマークが押された場合、2人以上で強制開始
+    elif emoji == "✅" and game.can_start():
+        outbox.send(channel, "✅ reaction received! Starting the game immediately.")
+        await start_multi_game(channel, game)
+
+
+# ゲームのチャンネルやDMに送られた "/hit" "/stand" のメッセージで手番を進める
+async def on_multi_reply(game, message):
+    action = message.content.lower().strip()
+    if action not in ("/hit", "/stand") or game.current_turn != message.author.id:
+        return
+    blackjack_games.touch(game.channel_id)
 
-    # ゲーム進行
-    while any(not state["stand"] for state in game_state.values()):
-        for player in players:
-            if game_state[player.id]["stand"]:
-                continue
+    content, embed = play_multi_turn(game, message.author.id, action[1:])
+    outbox.send(message.channel, content, embed)
+    await advance_multi_game(bot.get_channel(game.channel_id), game)
 
-            # プレイヤーのターンを進行
-            await player.send("It's your turn! Type '/hit' to draw a card or '/stand' to end your turn.")
-            try:
-                response = await bot.wait_for(
-                    "message",
-                    timeout=60.0,
-                    check=lambda m: m.author == player and m.content.lower() in ["/hit", "/stand"]
-                )
-            except TimeoutError:
-                await player.send("You took too long to respond. Your turn has been skipped.")
-                game_state[player.id]["stand"] = True
-                continue
-
-            if response.content.lower() == "/hit":
-                # カードを引く
-                card = deck.pop()
-                game_state[player.id]["hand"].append(card)
-                hand_value = calculate_hand_value(game_state[player.id]["hand"])
-
-                # 手札を送信
-                embed = discord.Embed(
-                    title="Your Blackjack Hand",
-                    description=f"Your hand: {', '.join(game_state[player.id]['hand'])} (Value: {hand_value})",
-                    color=discord.Color.blue()
-                )
-                await player.send(embed=embed)
-
-                # バースト判定
-                if hand_value > 21:
-                    await player.send("You went over 21! You have been eliminated from the game.")
-                    game_state[player.id]["stand"] = True
-            elif response.content.lower() == "/stand":
-                # スタンド
-                game_state[player.id]["stand"] = True
-                await player.send("You have chosen to stand.")
+# ----------------------------------------------------------------------------------------------
 
-    # ディーラーのターン
-    while dealer_value < 17:
-        dealer_hand.append(deck.pop())
-        dealer_value = calculate_hand_value(dealer_hand)
-
-    # 勝敗判定
-    results = []
-    for player in players:
-        player_hand = game_state[player.id]["hand"]
-        player_value = calculate_hand_value(player_hand)
-
-        if player_value > 21:
-            result = f"{player.name}: Busted!"
-        elif dealer_value > 21 or player_value > dealer_value:
-            result = f"{player.name}: Won!"
-        elif player_value == dealer_value:
-            result = f"{player.name}: Draw!"
-        else:
-            result = f"{player.name}: Lost!"
-        results.append(result)
-
-    # 結果を送信
-    embed = discord.Embed(
-        title="Blackjack Results",
-        description="\n".join(results),
-        color=discord.Color.green()
-    )
+# DMを送り、DMチャンネルを返す関数（DMチャンネルは1度だけ作って使い回す。作れなかった場合はNone）
+async def send_dm(user_id, content):
+    try:
+        channel = dm_channels.get(user_id)
+        if channel is None:
+            channel = dm_channels[user_id] = await bot.create_dm(discord.Object(id=user_id))
+        outbox.send(channel, content)
+        return channel
+    except discord.HTTPException as e:
+        print(f"Failed to send a DM to {user_id}: {e}")
+        return None
+
+
+# 手番のプレイヤーにDMで知らせ、DMでの返信もゲームに振り分ける関数
+async def prompt_turn(game):
+    user_id = game.current_turn
+    if not receives_dms():
+        # このプロセスにはDMでの返信が届かないため、ゲームのチャンネルで操作してもらう
+        await send_dm(user_id, f"It's your turn! Type '/hit' to draw a card or '/stand' to end your turn in <#{game.channel_id}>.")
+        return
+    channel = await send_dm(user_id, "It's your turn! Type '/hit' to draw a card or '/stand' to end your turn.")
+    if channel is not None and game.current_turn == user_id:
+        reply_routes.add((channel.id, user_id), partial(on_multi_reply, game))
+
+
+# 募集を締め切って手札を配る関数
+async def start_multi_game(channel, game):
+    if game.state != LOBBY:  # 同時に届いた開始のリアクションで2回始めない
+        return
+    reaction_routes.remove(game.message_id)
+    game.start(get_shoe(channel))
+    game_rng.record("multi_bj", game.shoe.replay_key(), channel_id=game.channel_id, players=list(game.players))
+    for user_id in game.players:
+        reply_routes.add((game.channel_id, user_id), partial(on_multi_reply, game))
+    # 以降は手番ごとの待ち時間で時間切れを判定する（ここまでの処理は待機を挟まずに行う）
+    blackjack_games.add(game.channel_id, game, timeout=TURN_TIMEOUT)
+
+    # ゲーム開始
+    outbox.send(channel, f"The game is starting with {len(game.players)} players: {', '.join(game.names[user_id] for user_id in game.players)}!")
+
+    # プレイヤーの手札を送信
+    embed = render.MULTI_HANDS.render()
+    for user_id in game.players:
+        player_hand = game.hands[user_id]
+        embed.add_field(
+            name=f"{game.names[user_id]}'s Hand",
+            value=render.HAND_FIELD(hand=player_hand, value=player_hand.value),
+            inline=False
+        )
+    outbox.send(channel, embed=embed)
+    await prompt_turn(game)
+
+
+# 手番のプレイヤーの操作を適用し、本人への返信 (本文, Embed) を返す関数（/hit・/stand とDMの返信で共通）
+def play_multi_turn(game, user_id, action):
+    if action == "hit":
+        hand = game.hit(user_id)
+        if hand.value > 21:
+            return None, render.MULTI_BUSTED.render(hand=hand, value=hand.value)
+        return None, render.MULTI_TURN_HAND.render(hand=hand, value=hand.value)
+    game.stand(user_id)
+    return "You have chosen to stand.", None
+
+
+# 操作の後に呼び、進行状況と次の手番を通知するか、全員が終わっていれば結果を送信する関数
+async def advance_multi_game(channel, game):
+    if game.state == PLAYING:
+        update_game_state(channel, game)
+        await prompt_turn(game)
+        return
+
+    # ゲームを終了
+    if blackjack_games.get(game.channel_id) is game:
+        blackjack_games.pop(game.channel_id)
+    for user_id in game.players:
+        reply_routes.remove((game.channel_id, user_id))
+        if user_id in dm_channels:
+            reply_routes.remove((dm_channels[user_id].id, user_id))
+    release_multi_players(game)
+
+    # 勝敗を送信
+    labels = {"busted": "Busted!", "won": "Won!", "draw": "Draw!", "lost": "Lost!"}
+    results = [f"{game.names[user_id]}: {labels[result]}" for user_id, result in game.results()]
+    embed = render.MULTI_RESULTS.render(results="\n".join(results))
     embed.add_field(
         name="Dealer's Hand",
-        value=f"{', '.join(dealer_hand)} (Value: {dealer_value})",
+        value=render.HAND_FIELD(hand=game.dealer_hand, value=game.dealer_hand.value),
         inline=False
     )
-    await message.channel.send(embed=embed)
+    if channel is not None:
+        outbox.send(channel, embed=embed)
+
+
+# 募集や手番の待ち時間が過ぎた場合の処理（セッションストアから呼ばれる）
+async def expire_multi_game(channel, game):
+    if game.state == LOBBY:
+        reaction_routes.remove(game.message_id)
+        if game.can_start() and channel is not None:
+            await start_multi_game(channel, game)
+        else:
+            # プレイヤーが1人以下の場合、ゲームをキャンセル
+            game.cancel()
+            release_multi_players(game)
+            if channel is not None:
+                outbox.send(channel, "Not enough players to start the game. The game has been canceled.")
+        return
+
+    # 手番のプレイヤーをスタンド扱いにして次に進める（待機を挟む前に登録し直す）
+    user_id = game.skip()
+    if game.state == PLAYING:
+        blackjack_games.add(game.channel_id, game, timeout=TURN_TIMEOUT)
+    await send_dm(user_id, "You took too long to respond. Your turn has been skipped.")
+    await advance_multi_game(channel, game)
 
 # ----------------------------------------------------------------------------------------------
 
 # ブラックジャックの "hit" コマンド
 @bot.tree.command(name="hit", description="Draw another card in blackjack.")
+@auto_defer()
 async def hit(interaction: discord.Interaction):
     channel_id = interaction.channel.id
     user_id = interaction.user.id
 
     # ゲームが存在するか確認
     if channel_id not in blackjack_games:
-        await interaction.response.send_message("You are not currently in a blackjack game.", ephemeral=True)
+        await respond(interaction, "You are not currently in a blackjack game.", ephemeral=True)
         return
 
     game = blackjack_games[channel_id]
 
     # シングルプレイヤーモードの場合
-    if game["mode"] == "single":
+    if not isinstance(game, MultiGame):
         if user_id != game["current_turn"]:
-            await interaction.response.send_message("It's not your turn!", ephemeral=True)
+            await respond(interaction, "It's not your turn!", ephemeral=True)
             return
 
-        deck = game["deck"]
+        shoe = game["shoe"]
         player_hand = game["player_hand"]
 
         # カードを引く
-        card = deck.pop()
-        player_hand.append(card)
-        hand_value = calculate_hand_value(player_hand)
+        card = shoe.deal()
+        player_hand.add(card)
+        hand_value = player_hand.value
 
         # バースト判定
         if hand_value > 21:
-            bet = game["bet"]
-            user_balances[user_id] -= bet
+            bet = game["bet"]  # 賭け金は開始時に差し引き済み
             del blackjack_games[channel_id]  # ゲームを終了
-            embed = discord.Embed(
-                title="Blackjack - You Lose!",
-                description=(
-                    f"**Your Hand**: {', '.join(player_hand)} (Value: {hand_value})\n"
-                    f"You went over 21 and lost <:casino_tip2:1369628815709569044> {bet} coins.\n"
-                    f"Your new balance is <:casino_tip2:1369628815709569044> {user_balances[user_id]} coins."
-                ),
-                color=discord.Color.red()
-            )
-            await interaction.response.send_message(embed=embed)
+            embed = render.BLACKJACK_BUST.render(hand=player_hand, value=hand_value, bet=bet, balance=ledger.balance(user_id))
+            await respond(interaction, embed=embed)
             return
 
         # 手札を表示
-        embed = discord.Embed(
-            title="Blackjack",
-            description=(
-                f"**Your Hand**: {', '.join(player_hand)} (Value: {hand_value})\n"
-                f"**Dealer's Hand**: {game['dealer_hand'][0]}, ❓"
-            ),
-            color=discord.Color.blue()
-        )
-        embed.set_footer(text="Type '/hit' to draw another card or '/stand' to end your turn.")
-        await interaction.response.send_message(embed=embed)
+        embed = render.BLACKJACK_HAND.render(hand=player_hand, value=hand_value, upcard=card_name(game["dealer_hand"][0]))
+        await respond(interaction, embed=embed)
 
     # マルチプレイヤーモードの場合
-    elif game["mode"] == "multi":
-        if game["current_turn"] != user_id:
-            await interaction.response.send_message("It's not your turn!", ephemeral=True)
+    else:
+        if game.current_turn != user_id:
+            await respond(interaction, "It's not your turn!", ephemeral=True)
             return
 
-        player_state = game["game_state"][user_id]
-        deck = game["deck"]
-
-        # カードを引く
-        card = deck.pop()
-        player_state["hand"].append(card)
-        hand_value = calculate_hand_value(player_state["hand"])
-
-        # バースト判定
-        if hand_value > 21:
-            player_state["stand"] = True
-            embed = discord.Embed(
-                title="Blackjack - You Busted!",
-                description=f"Your hand: {', '.join(player_state['hand'])} (Value: {hand_value})\nYou went over 21!",
-                color=discord.Color.red()
-            )
-            await interaction.response.send_message(embed=embed)
-        else:
-            embed = discord.Embed(
-                title="Your Blackjack Hand",
-                description=f"Your hand: {', '.join(player_state['hand'])} (Value: {hand_value})",
-                color=discord.Color.blue()
-            )
-            await interaction.response.send_message(embed=embed)
-
-        # 次のターンに進む
-        next_turn(game)
-
-        # ゲームの進行状況を更新
-        await update_game_state(interaction.channel, game)
+        # カードを引いて手札を表示し、次の手番に進む
+        content, embed = play_multi_turn(game, user_id, "hit")
+        await respond(interaction, content, embed=embed)
+        await advance_multi_game(interaction.channel, game)
 
 # ----------------------------------------------------------------------------------------------
 
 # ブラックジャックの "stand" コマンド
 @bot.tree.command(name="stand", description="End your turn in blackjack.")
+@auto_defer()
 async def stand(interaction: discord.Interaction):
     channel_id = interaction.channel.id
     user_id = interaction.user.id
 
     # ゲームが存在するか確認
     if channel_id not in blackjack_games:
-        await interaction.response.send_message("You are not currently in a blackjack game.", ephemeral=True)
+        await respond(interaction, "You are not currently in a blackjack game.", ephemeral=True)
         return
 
     game = blackjack_games[channel_id]
 
     # シングルプレイヤーモードの場合
-    if game["mode"] == "single":
+    if not isinstance(game, MultiGame):
         if user_id != game["current_turn"]:
-            await interaction.response.send_message("It's not your turn!", ephemeral=True)
+            await respond(interaction, "It's not your turn!", ephemeral=True)
             return
 
-        # ディーラーのターン
-        dealer_hand = game["dealer_hand"]
-        deck = game["deck"]
-        dealer_value = calculate_hand_value(dealer_hand)
-        while dealer_value < 17:
-            dealer_hand.append(deck.pop())
-            dealer_value = calculate_hand_value(dealer_hand)
-
-        player_hand = game["player_hand"]
-        player_value = calculate_hand_value(player_hand)
-
-        # 勝敗判定
-        if dealer_value > 21 or player_value > dealer_value:
-            user_balances[user_id] += game["bet"] * 2
-            result = "You Win!"
-            color = discord.Color.green()
-        elif player_value == dealer_value:
-            result = "It's a Draw!"
-            color = discord.Color.orange()
-        else:
-            result = "You Lose!"
-            color = discord.Color.red()
-
-        # ゲームを終了
+        # ゲームを終了して精算し、結果を表示
         del blackjack_games[channel_id]
-
-        # 結果を表示
-        embed = discord.Embed(
-            title=f"Blackjack - {result}",
-            description=(
-                f"**Your Hand**: {', '.join(player_hand)} (Value: {player_value})\n"
-                f"**Dealer's Hand**: {', '.join(dealer_hand)} (Value: {dealer_value})"
-            ),
-            color=color
-        )
-        await interaction.response.send_message(embed=embed)
+        embed = await settle_single_game(game)
+        await respond(interaction, embed=embed)
 
     # マルチプレイヤーモードの場合
-    elif game["mode"] == "multi":
-        if game["current_turn"] != user_id:
-            await interaction.response.send_message("It's not your turn!", ephemeral=True)
+    else:
+        if game.current_turn != user_id:
+            await respond(interaction, "It's not your turn!", ephemeral=True)
             return
 
-        # プレイヤーの状態を更新
-        game["game_state"][user_id]["stand"] = True
-        await interaction.response.send_message("You have chosen to stand.")
-
-        # 次のターンに進む
-        next_turn(game)
-
-        # ゲームの進行状況を更新
-        await update_game_state(interaction.channel, game)
+        content, embed = play_multi_turn(game, user_id, "stand")
+        await respond(interaction, content, embed=embed)
+        await advance_multi_game(interaction.channel, game)
 
 # ----------------------------------------------------------------------------------------------
 
 # ブラックジャックの "double_down" コマンド
 @bot.tree.command(name="double_down", description="Double your bet and draw one card in blackjack.")
+@auto_defer()
 async def double_down(interaction: discord.Interaction):
+    channel_id = interaction.channel.id
     user_id = interaction.user.id
-    if user_id not in blackjack_games:
-        await interaction.response.send_message("You are not currently in a blackjack game.", ephemeral=True)
+    if channel_id not in blackjack_games:
+        await respond(interaction, "You are not currently in a blackjack game.", ephemeral=True)
         return
 
-    game = blackjack_games[user_id]
+    game = blackjack_games[channel_id]
+    if isinstance(game, MultiGame) or user_id != game["current_turn"]:
+        await respond(interaction, "It's not your turn!", ephemeral=True)
+        return
 
     # ダブルダウンが許可されているか確認
     if not game.get("double_down_allowed", False):
-        await interaction.response.send_message("You can only double down immediately after the first two cards are dealt.", ephemeral=True)
+        await respond(interaction, "You can only double down immediately after the first two cards are dealt.", ephemeral=True)
         return
 
-    deck = game["deck"]
+    shoe = game["shoe"]
     player_hand = game["player_hand"]
     bet = game["bet"]
 
-    # 賭け金を倍にする
-    if user_balances[user_id] < bet:
-        await interaction.response.send_message("You don't have enough coins to double your bet.", ephemeral=True)
+    # ダブルダウン後はフラグを無効化（同時に実行されても二重に賭けないよう、待機の前に無効化する）
+    game["double_down_allowed"] = False
+
+    # 賭け金を倍にする（所持金の確認と差し引きを同時に行う）
+    if await ledger.debit(user_id, bet, minimum=0) is None:
+        game["double_down_allowed"] = True
+        await respond(interaction, "You don't have enough coins to double your bet.", ephemeral=True)
         return
 
     game["bet"] *= 2
-    user_balances[user_id] -= bet  # 賭け金を差し引く
 
     # プレイヤーにカードを1枚配る
-    player_hand.append(deck.pop())
-    player_value = calculate_hand_value(player_hand)
-
-    # ダブルダウン後はフラグを無効化
-    game["double_down_allowed"] = False
+    player_hand.add(shoe.deal())
+    player_value = player_hand.value
 
     # プレイヤーがバーストした場合
     if player_value > 21:
-        del blackjack_games[user_id]  # ゲームを終了
-        embed = discord.Embed(
-            title="Blackjack - You Lose!",
-            description=(
-                f"**Your Hand**: {', '.join(player_hand)} (Value: {player_value})\n"
-                f"You went over 21 and lost <:casino_tip2:1369628815709569044> {game['bet']} coins.\n"
-                f"Your new balance is <:casino_tip2:1369628815709569044> {user_balances[user_id]} coins."
-            ),
-            color=discord.Color.red()
-        )
-        await interaction.response.send_message(embed=embed)
+        del blackjack_games[channel_id]  # ゲームを終了
+        embed = render.BLACKJACK_BUST.render(hand=player_hand, value=player_value, bet=game["bet"], balance=ledger.balance(user_id))
+        await respond(interaction, embed=embed)
         return
 
     # ディーラーのターン
     dealer_hand = game["dealer_hand"]
-    dealer_value = calculate_hand_value(dealer_hand)
-    while dealer_value < 17:
-        dealer_hand.append(deck.pop())
-        dealer_value = calculate_hand_value(dealer_hand)
+    dealer_value = dealer_hand.value
+    while dealer_value < DEALER_STAND_VALUE:
+        dealer_hand.add(shoe.deal())
+        dealer_value = dealer_hand.value
 
-    # 勝敗判定
+    # 勝敗判定（賭け金は差し引き済み）
     if dealer_value > 21 or player_value > dealer_value:
-        user_balances[user_id] += game["bet"] * 2
+        await ledger.credit(user_id, game["bet"] * BLACKJACK_WIN_PAYOUT)
         result = "You Win!"
-        color = discord.Color.green()
-        balance_change = f"You gained <:casino_tip2:1369628815709569044> {game['bet'] * 2} coins."
+        color = render.GREEN
+        balance_change = render.BLACKJACK_GAINED(amount=game["bet"] * BLACKJACK_WIN_PAYOUT)
     elif player_value == dealer_value:
+        await ledger.credit(user_id, game["bet"] * BLACKJACK_DRAW_PAYOUT)  # 賭け金を払い戻す
         result = "It's a Draw!"
-        color = discord.Color.orange()
+        color = render.ORANGE
         balance_change = "Your balance remains the same."
     else:
         result = "You Lose!"
-        color = discord.Color.red()
-        balance_change = f"You lost <:casino_tip2:1369628815709569044> {game['bet']} coins."
+        color = render.RED
+        balance_change = render.BLACKJACK_LOST(amount=game["bet"])
 
     # ゲームを終了
-    del blackjack_games[user_id]
+    del blackjack_games[channel_id]
 
     # 結果を表示
-    embed = discord.Embed(
-        title=f"Blackjack - {result}",
-        description=(
-            f"**Your Hand**: {', '.join(player_hand)} (Value: {player_value})\n"
-            f"**Dealer's Hand**: {', '.join(dealer_hand)} (Value: {dealer_value})\n\n"
-            f"{balance_change}\n"
-            f"Your new balance is <:casino_tip2:1369628815709569044> {user_balances[user_id]} coins."
-        ),
-        color=color
+    embed = render.BLACKJACK_DOUBLE_RESULT.render(
+        color=color, result=result, hand=player_hand, value=player_value, dealer_hand=dealer_hand, dealer_value=dealer_value,
+        balance_change=balance_change, balance=ledger.balance(user_id)
     )
-    await interaction.response.send_message(embed=embed)
+    await respond(interaction, embed=embed)
+
+# ----------------------------------------------------------------------------------------------
+
+# ブラックジャックの "hint" コマンド（スタンド・ヒット・ダブルダウンの期待値を表示）
+@bot.tree.command(name="hint", description="Show the expected value of hitting or standing in blackjack.")
+@auto_defer(ephemeral=True)
+async def hint(interaction: discord.Interaction):
+    channel_id = interaction.channel.id
+    user_id = interaction.user.id
+
+    # ゲームが存在するか確認
+    game = blackjack_games.get(channel_id)
+    if game is None:
+        await respond(interaction, "You are not currently in a blackjack game.", ephemeral=True)
+        return
+
+    if not isinstance(game, MultiGame):
+        if user_id != game["current_turn"]:
+            await respond(interaction, "You are not playing this blackjack game.", ephemeral=True)
+            return
+        player_hand = game["player_hand"]
+        dealer_hand = game["dealer_hand"]
+        shoe = game["shoe"]
+        can_double = game.get("double_down_allowed", False)
+    else:
+        if game.state != PLAYING or user_id not in game.hands or user_id in game.stood:
+            await respond(interaction, "You have no hand to play in this blackjack game.", ephemeral=True)
+            return
+        player_hand = game.hands[user_id]
+        dealer_hand = game.dealer_hand
+        shoe = game.shoe
+        can_double = False  # マルチプレイヤーモードではダブルダウンできない
+
+    # 見えていないカード（シューの残りとディーラーの伏せ札）の構成から期待値を計算する
+    unseen_cards = shoe.remaining() + bytes(dealer_hand.cards[1:])
+    key = strategy.composition_key(unseen_cards)
+    situation = (player_hand.value, player_hand.soft_aces, CARD_VALUES[dealer_hand[0]], key)
+    result = strategy.cached(*situation)
+    if result is None:
+        # 計算済みの表にない構成（シューの途中）は、残りのカードの割合から近似する（正確な計算は行わない）
+        result = strategy.approximate(*situation)
+    stand_ev, hit_ev, double_ev = result
+
+    options = {"Stand": stand_ev, "Hit": hit_ev}
+    if can_double:
+        options["Double Down"] = double_ev
+    best = max(options, key=options.get)
+    lines = [f"{'→' if name == best else '　'} **{name}**: EV {ev:+.3f}" for name, ev in options.items()]
+
+    embed = render.BLACKJACK_HINT.render(
+        best=best, hand=player_hand, value=player_hand.value, upcard=card_name(dealer_hand[0]), lines="\n".join(lines)
+    )
+    await respond(interaction, embed=embed, ephemeral=True)
+
+# ==============================================================================================
 
-# server_thread()
-# bot.run(TOKEN)
-bot.run(os.getenv('TOKEN'))
\ No newline at end of file
+# スラッシュコマンド: /odds（管理者用）
+@bot.tree.command(name="odds", description="Simulate the expected value of each roulette bet and blackjack strategy.")
+@app_commands.describe(spins="Number of roulette spins to simulate", hands="Number of blackjack hands per strategy to simulate")
+@app_commands.default_permissions(administrator=True)
+@auto_defer()
+async def odds(interaction: discord.Interaction, spins: app_commands.Range[int, 1000, 50_000_000] = 1_000_000, hands: app_commands.Range[int, 1000, 2_000_000] = 100_000):
+    await defer(interaction)
+
+    # シミュレーションは別スレッドで実行し、イベントループを止めない
+    lines = await asyncio.to_thread(simulator.run, spins, hands)
+
+    embed = render.ODDS.render(lines="\n".join(lines))
+    await respond(interaction, embed=embed)
+
+# 直接実行した場合だけボットを起動する（ベンチマークなどから読み込んだ場合は起動しない）
+if __name__ == "__main__":
+    # bot.run(TOKEN)
+    # 未書き込みの変更の保存は、終了時に bot.close() の中で行う（ShutdownMixin）
+    bot.run(os.getenv('TOKEN'))
@@ -0,0 +1,156 @@
+import asyncio
+import sys
+import time
+import tracemalloc
+from array import array
+from bisect import bisect_left
+
+# メンバーの省メモリな索引
+# discord.pyのメンバーキャッシュはメンバーごとにMember・Userオブジェクト（名前・ロール・アバターなど）を
+# 保持するが、ランキングや強奪の対象選びに必要なのはボット以外のユーザーIDだけなので、
+# サーバーごとに昇順のID配列（8バイト/人）とボットかどうかのビットマップ（1ビット/人）だけを持つ
+
+# ==============================================================================================
+
+# 1サーバー分のメンバー
+class GuildMembers:
+    __slots__ = ("ids", "bots")
+
+    # members: (user_id, ボットかどうか) の並び
+    def __init__(self, members=()):
+        pairs = sorted(members)
+        self.ids = array("Q", [user_id for user_id, _ in pairs])
+        bitmap = bytearray(len(pairs) // 8 + 1)
+        for i, (_, bot) in enumerate(pairs):
+            if bot:
+                bitmap[i >> 3] |= 1 << (i & 7)
+        self.bots = int.from_bytes(bitmap, "little")  # i番目のメンバーがボットならiビット目が1
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _find(self, user_id):
+        i = bisect_left(self.ids, user_id)
+        return i, i < len(self.ids) and self.ids[i] == user_id
+
+    def __contains__(self, user_id):
+        return self._find(user_id)[1]
+
+    def is_bot(self, user_id):
+        i, found = self._find(user_id)
+        return found and bool(self.bots >> i & 1)
+
+    def add(self, user_id, bot=False):
+        i, found = self._find(user_id)
+        if found:
+            return
+        self.ids.insert(i, user_id)
+        # i番目以降のビットを1つずらして空けたところに入れる
+        low = self.bots & ((1 << i) - 1)
+        self.bots = low | ((self.bots >> i) << (i + 1)) | (int(bot) << i)
+
+    def remove(self, user_id):
+        i, found = self._find(user_id)
+        if not found:
+            return
+        del self.ids[i]
+        low = self.bots & ((1 << i) - 1)
+        self.bots = low | ((self.bots >> (i + 1)) << i)
+
+    # ボット以外のメンバーのID
+    def humans(self):
+        bots = self.bots.to_bytes(len(self.ids) // 8 + 1, "little")
+        return [user_id for i, user_id in enumerate(self.ids) if not bots[i >> 3] >> (i & 7) & 1]
+
+# ----------------------------------------------------------------------------------------------
+
+# 全サーバーのメンバー索引（サーバーごとに初回の参照時に1度だけ読み込み、以降は参加・退出のイベントで更新する）
+class MemberIndex:
+    def __init__(self):
+        self.guilds = {}    # guild_id -> GuildMembers
+        self._loading = {}  # guild_id -> 読み込み中のTask（同時に参照されても1回だけ読み込む）
+
+    def get(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    # メンバー一覧をGatewayから取得して索引を作る（取得したMemberはキャッシュしない）
+    async def load(self, guild):
+        members = self.guilds.get(guild.id)
+        if members is not None:
+            return members
+        task = self._loading.get(guild.id)
+        if task is None:
+            task = self._loading[guild.id] = asyncio.ensure_future(guild.chunk(cache=False))
+        try:
+            chunk = await task
+        finally:
+            self._loading.pop(guild.id, None)
+        members = self.guilds.get(guild.id)
+        if members is None:
+            members = self.guilds[guild.id] = GuildMembers((member.id, member.bot) for member in chunk)
+        return members
+
+    def add(self, guild_id, user_id, bot=False):
+        members = self.guilds.get(guild_id)
+        if members is not None:
+            members.add(user_id, bot)
+
+    def remove(self, guild_id, user_id):
+        members = self.guilds.get(guild_id)
+        if members is not None:
+            members.remove(user_id)
+
+    def drop_guild(self, guild_id):
+        self.guilds.pop(guild_id, None)
+
+# ==============================================================================================
+
+# ベンチマーク: 10万人のサーバーについて、discord.pyのメンバーキャッシュと索引のメモリ使用量を比較する
+def benchmark(size=100_000):
+    import discord
+
+    client = discord.Client(intents=discord.Intents.default())
+    state = client._connection
+    guild = discord.Guild(data={"id": "1", "name": "bench", "member_count": size}, state=state)
+    payloads = [
+        {
+            "user": {"id": str(10 ** 17 + i), "username": f"user{i}", "discriminator": "0", "global_name": f"User {i}",
+                     "avatar": "a" * 32, "bot": i % 50 == 0},
+            "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0,
+        }
+        for i in range(size)
+    ]
+
+    tracemalloc.start()
+    for data in payloads:
+        guild._add_member(discord.Member(data=data, guild=guild, state=state))
+    cache_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    humans_cache = [member.id for member in guild.members if not member.bot]
+
+    pairs = [(member.id, member.bot) for member in guild.members]
+    guild._members.clear()
+    state._users.clear()
+
+    tracemalloc.start()
+    members = GuildMembers(pairs)
+    index_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert members.humans() == sorted(humans_cache)
+
+    start = time.perf_counter()
+    for i in range(1000):
+        members.add(2 * 10 ** 17 + i, i % 2 == 0)
+    for i in range(1000):
+        members.remove(2 * 10 ** 17 + i)
+    churn = (time.perf_counter() - start) / 2000
+    assert members.humans() == sorted(humans_cache)
+
+    print(f"{size:,} members")
+    print(f"  member cache: {cache_bytes / 2 ** 20:8.1f} MiB ({cache_bytes / size:,.0f} bytes/member)")
+    print(f"  member index: {index_bytes / 2 ** 20:8.1f} MiB ({index_bytes / size:,.1f} bytes/member)")
+    print(f"  join/leave: {churn * 1e6:.1f} us/event")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
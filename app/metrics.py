@@ -0,0 +1,349 @@
+import functools
+import math
+import os
+import sys
+import time
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+
+import discord
+from discord import app_commands
+from discord.http import HTTPClient
+from discord.webhook.async_ import AsyncWebhookAdapter
+
+# Prometheus形式（text/plain; version=0.0.4）で公開する計測値
+# 記録はメモリ上の数値の加算だけで行い、ボットの状態（接続の遅延・ゲーム数・台帳の大きさなど）は
+# 関数で登録しておいて /metrics を取得された時にだけ読む（取得されない間は何も計算しない）
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # 秒
+
+# ==============================================================================================
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value != value:
+        return "NaN"
+    if value in (math.inf, -math.inf):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+# ----------------------------------------------------------------------------------------------
+
+# 増えるだけの値（ラベルの値の組ごと）
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self.values = {}  # ラベルの値のタプル -> 値
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        return [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in list(self.values.items())]
+
+
+# 読み出した時点の値（read() が数値か、ラベルの値のタプル -> 数値 の辞書を返す）
+# 他のオブジェクトがすでに数えている値（SessionStore.counters など）は kind="counter" で読み出す
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, read, labels=(), kind="gauge"):
+        super().__init__(name, help, labels)
+        self.read = read
+        self.kind = kind
+
+    def samples(self):
+        value = self.read()
+        if not isinstance(value, dict):
+            return [f"{self.name} {_number(value)}"]
+        return [f"{self.name}{_labels(self.labels, key)} {_number(number)}" for key, number in value.items()]
+
+
+# 値の分布（バケットごとの個数を持ち、累積は出力する時に計算する）
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.values = {}  # ラベルの値のタプル -> [バケットごとの個数..., 上限超えの個数, 合計]
+
+    def observe(self, value, *labels):
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self):
+        lines = []
+        for key, counts in list(self.values.items()):
+            counts = list(counts)
+            total = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                total += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {total}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {total}")
+        return lines
+
+# ----------------------------------------------------------------------------------------------
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}  # 名前 -> Metric
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, read, labels=(), kind="gauge"):
+        return self.register(Gauge(name, help, read, labels, kind))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                # 1つの値の読み出しに失敗しても他の値は返す
+                print(f"Failed to collect metric {metric.name}: {e}")
+                continue
+            lines.extend(metric.header())
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ==============================================================================================
+
+# コマンドとDiscordのREST呼び出し
+# 処理時間はインタラクションを受け取った時点から測り、最初の応答（send_message / defer）が返るまでと、
+# ハンドラが終わるまでを記録する。ハンドラの中で待ったREST呼び出しの時間はコンテキスト変数で
+# 呼び出し中のコマンドに足し込み、残りをローカルの処理時間とする（並行して呼んだ場合は重なった分だけ多く数える）
+COMMAND_CALLS = REGISTRY.counter("bot_command_calls_total", "Slash command invocations.", ("command", "result"))
+COMMAND_ERRORS = REGISTRY.counter("bot_command_errors_total", "Slash command errors by exception type.", ("command", "error"))
+COMMAND_LATENCY = REGISTRY.histogram("bot_command_duration_seconds", "Time from interaction receipt to handler completion.", ("command",))
+COMMAND_FIRST_RESPONSE = REGISTRY.histogram("bot_command_first_response_seconds", "Time from interaction receipt to the first response.", ("command",))
+COMMAND_PHASE = REGISTRY.counter("bot_command_phase_seconds_total", "Handler time split into Discord REST calls and local compute.", ("command", "phase"))
+REST_CALLS = REGISTRY.counter("discord_rest_calls_total", "Discord REST calls by route and outcome.", ("method", "route", "status"))
+
+SLOW_COMMAND_SECONDS = float(os.getenv("SLOW_COMMAND_SECONDS", "1.0"))  # これ以上かかったコマンドを引数つきで記録する
+SLOW_LOG_SIZE = 100                                                    # 記録しておく遅いコマンドの数
+CALLBACK_ROUTE = "/interactions/{interaction_id}/{interaction_token}/callback"  # インタラクションへの最初の応答
+
+slow_commands = deque(maxlen=SLOW_LOG_SIZE)  # 最近の遅いコマンド（新しいものが後ろ）
+
+
+# 1回のコマンドの呼び出し
+class Invocation:
+    __slots__ = ("received", "first_response", "rest")
+
+    def __init__(self, received):
+        self.received = received      # インタラクションを受け取った時刻（time.perf_counter()）
+        self.first_response = None    # 最初の応答が返った時刻
+        self.rest = 0.0               # REST呼び出しを待った時間の合計
+
+
+_invocation = ContextVar("invocation", default=None)  # 実行中のコマンドの Invocation
+
+# ----------------------------------------------------------------------------------------------
+
+# discord.pyのREST呼び出し（ボットのHTTPクライアントと、インタラクションの応答・followupに使うWebhook）を数える
+# ルートはIDを埋め込む前のパス（"/channels/{channel_id}/messages"）なので、ラベルの種類は増え続けない
+def count_rest_calls():
+    def wrap(request):
+        if getattr(request, "_counted", False):
+            return request
+
+        @functools.wraps(request)
+        async def counted(self, route, *args, **kwargs):
+            status = "ok"
+            start = time.perf_counter()
+            try:
+                return await request(self, route, *args, **kwargs)
+            except discord.HTTPException as e:
+                status = str(e.status)
+                raise
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                end = time.perf_counter()
+                REST_CALLS.inc(route.method, route.path, status)
+                invocation = _invocation.get()
+                if invocation is not None:
+                    invocation.rest += end - start
+                    if invocation.first_response is None and route.path == CALLBACK_ROUTE:
+                        invocation.first_response = end
+
+        counted._counted = True
+        return counted
+
+    HTTPClient.request = wrap(HTTPClient.request)
+    AsyncWebhookAdapter.request = wrap(AsyncWebhookAdapter.request)
+
+# ----------------------------------------------------------------------------------------------
+
+# スラッシュコマンドの呼び出しを計測するコマンドツリー（commands.Bot(tree_cls=MeasuredTree)）
+# 受け取った時点で Invocation を作り、実行中はコンテキスト変数に置く（ハンドラが作るタスクにも引き継がれる）
+class MeasuredTree(app_commands.CommandTree):
+    def _from_interaction(self, interaction):
+        if interaction.type is discord.InteractionType.application_command:
+            interaction.extras["invocation"] = Invocation(time.perf_counter())
+        super()._from_interaction(interaction)
+
+    async def _call(self, interaction):
+        invocation = interaction.extras.get("invocation")
+        if invocation is None:
+            return await super()._call(interaction)
+        token = _invocation.set(invocation)
+        try:
+            await super()._call(interaction)
+        except Exception:
+            interaction.command_failed = True
+            raise
+        finally:
+            _invocation.reset(token)
+            finish(interaction, invocation)
+
+    async def on_error(self, interaction, error):
+        original = getattr(error, "original", error)
+        COMMAND_ERRORS.inc(command_name(interaction), type(original).__name__)
+        await super().on_error(interaction, error)
+
+
+def command_name(interaction):
+    command = interaction.command
+    return command.qualified_name if command is not None else "unknown"
+
+
+def finish(interaction, invocation, end=None):
+    end = time.perf_counter() if end is None else end
+    name = command_name(interaction)
+    total = end - invocation.received
+    COMMAND_CALLS.inc(name, "error" if interaction.command_failed else "ok")
+    COMMAND_LATENCY.observe(total, name)
+    if invocation.first_response is not None:
+        COMMAND_FIRST_RESPONSE.observe(invocation.first_response - invocation.received, name)
+    COMMAND_PHASE.inc(name, "rest", amount=invocation.rest)
+    COMMAND_PHASE.inc(name, "compute", amount=max(0.0, total - invocation.rest))
+    if total >= SLOW_COMMAND_SECONDS:
+        log_slow(interaction, name, invocation, total)
+
+
+def log_slow(interaction, name, invocation, total):
+    arguments = {key: _argument(value) for key, value in interaction.namespace}
+    first_response = None if invocation.first_response is None else invocation.first_response - invocation.received
+    slow_commands.append({
+        "at": time.time(), "command": name, "user_id": interaction.user.id, "arguments": arguments,
+        "total": total, "first_response": first_response, "rest": invocation.rest,
+    })
+    print(
+        f"Slow command /{name} by {interaction.user.id}: {total * 1000:.0f} ms "
+        f"(first response {'-' if first_response is None else f'{first_response * 1000:.0f} ms'}, "
+        f"REST {invocation.rest * 1000:.0f} ms) {arguments}"
+    )
+
+
+# ユーザー・チャンネルなどはIDだけを残す
+def _argument(value):
+    if isinstance(value, (int, float, str, bool)) or value is None:
+        return value
+    if hasattr(value, "id"):
+        return f"{type(value).__name__}({value.id})"
+    return str(value)
+
+# ==============================================================================================
+
+# ベンチマーク: 記録1回あたりのコストと、/metrics の出力にかかる時間
+def benchmark(events=1_000_000):
+    registry = Registry()
+    calls = registry.counter("calls_total", "Calls.", ("command", "result"))
+    latency = registry.histogram("duration_seconds", "Duration.", ("command",))
+    registry.gauge("sessions", "Sessions.", lambda: {("single",): 3, ("multi",): 1}, ("mode",))
+    commands = ["daily", "give", "rob", "roulette", "blackjack", "hit", "stand", "balance"]
+
+    start = time.perf_counter()
+    for i in range(events):
+        command = commands[i & 7]
+        calls.inc(command, "ok")
+        latency.observe((i % 997) / 1000, command)
+    record = (time.perf_counter() - start) / events
+
+    start = time.perf_counter()
+    text = registry.render()
+    render = time.perf_counter() - start
+
+    assert f'calls_total{{command="daily",result="ok"}} {events // 8}' in text
+    assert f'duration_seconds_count{{command="rob"}} {events // 8}' in text
+    assert 'duration_seconds_bucket{command="rob",le="+Inf"}' in text
+    assert 'sessions{mode="single"} 3' in text
+
+    # コマンド1回分の計測（Invocationの作成・コンテキスト変数の設定と解除・finish）のコスト
+    from types import SimpleNamespace
+
+    interactions = [
+        SimpleNamespace(command=SimpleNamespace(qualified_name=command), command_failed=False, extras={})
+        for command in commands
+    ]
+    invocations = events // 10
+    start = time.perf_counter()
+    for i in range(invocations):
+        interaction = interactions[i & 7]
+        invocation = interaction.extras["invocation"] = Invocation(time.perf_counter())
+        token = _invocation.set(invocation)
+        _invocation.reset(token)
+        finish(interaction, invocation)
+    overhead = (time.perf_counter() - start) / invocations
+
+    # 遅いコマンドは引数つきで記録される
+    slow = SimpleNamespace(
+        command=SimpleNamespace(qualified_name="rob"), command_failed=False, extras={},
+        user=SimpleNamespace(id=42), namespace=[("amount", 100), ("user", SimpleNamespace(id=7))],
+    )
+    finish(slow, Invocation(time.perf_counter() - SLOW_COMMAND_SECONDS))
+    assert slow_commands[-1]["arguments"] == {"amount": 100, "user": "SimpleNamespace(7)"}
+
+    print(f"counter + histogram: {record * 1e9:.0f} ns/event")
+    print(f"command instrumentation: {overhead * 1e9:.0f} ns/invocation")
+    print(f"render {len(text.splitlines())} lines: {render * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
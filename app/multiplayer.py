@@ -0,0 +1,203 @@
+import random
+import sys
+import time
+import tracemalloc
+
+from cards import Hand, Shoe
+from rules import DEALER_STAND_VALUE
+
+MAX_PLAYERS = 4
+MIN_PLAYERS = 2
+LOBBY_TIMEOUT = 60.0  # 募集の待ち時間（秒）
+TURN_TIMEOUT = 60.0   # 1ターンの待ち時間（秒、過ぎるとそのプレイヤーはスタンド扱い）
+
+LOBBY = "lobby"
+PLAYING = "playing"
+FINISHED = "finished"
+CANCELED = "canceled"
+
+# ==============================================================================================
+
+# マルチプレイヤーブラックジャックの状態機械
+# 募集 (lobby) → 対戦 (playing) → 終了 (finished / canceled) の順に、届いたイベント（参加・開始・ヒット・
+# スタンド・時間切れ）を1つずつ適用して進める。待機するコルーチンは持たず、入出力はすべて呼び出し側が行う
+# 状態はすべて整数・文字列・リストで表せるので、to_dict() / from_dict() で保存・復元できる
+class MultiGame:
+    __slots__ = ("channel_id", "host_id", "bet", "state", "message_id", "players", "names", "hands", "stood", "turn", "dealer_hand", "shoe")
+
+    def __init__(self, channel_id, host_id, host_name, bet):
+        self.channel_id = channel_id
+        self.host_id = host_id
+        self.bet = bet
+        self.state = LOBBY
+        self.message_id = None  # 募集メッセージのID
+        self.players = [host_id]          # 参加順のuser_id（主催者は自動的に参加）
+        self.names = {host_id: host_name}
+        self.hands = {}                   # user_id -> Hand
+        self.stood = set()                # スタンド（バースト・時間切れを含む）したプレイヤー
+        self.turn = 0                     # 現在の手番（playersの位置）
+        self.dealer_hand = None
+        self.shoe = None                  # チャンネルのシュー（保存対象外）
+
+    # ----------------------------------------------------------------------------------------------
+
+    # 募集中に参加する（参加できた場合はTrue）
+    def join(self, user_id, name):
+        if self.state != LOBBY or user_id in self.names or self.is_full():
+            return False
+        self.players.append(user_id)
+        self.names[user_id] = name
+        return True
+
+    def is_full(self):
+        return len(self.players) >= MAX_PLAYERS
+
+    def can_start(self):
+        return self.state == LOBBY and len(self.players) >= MIN_PLAYERS
+
+    # 全員に手札を配って対戦を始める
+    def start(self, shoe):
+        self.shoe = shoe
+        shoe.start_round()
+        for user_id in self.players:
+            self.hands[user_id] = Hand((shoe.deal(), shoe.deal()))
+        self.dealer_hand = Hand((shoe.deal(), shoe.deal()))
+        self.state = PLAYING
+        self.turn = 0
+
+    # 人数不足などで募集を取りやめる
+    def cancel(self):
+        self.state = CANCELED
+
+    # ----------------------------------------------------------------------------------------------
+
+    # 現在の手番のuser_id（対戦中でなければNone）
+    @property
+    def current_turn(self):
+        if self.state != PLAYING:
+            return None
+        return self.players[self.turn]
+
+    # カードを1枚引く（バーストした場合はスタンド扱い）。手番は次のプレイヤーに移る
+    def hit(self, user_id):
+        hand = self.hands[user_id]
+        hand.add(self.shoe.deal())
+        if hand.value > 21:
+            self.stood.add(user_id)
+        self._advance()
+        return hand
+
+    def stand(self, user_id):
+        self.stood.add(user_id)
+        self._advance()
+
+    # 手番のプレイヤーが時間切れになった場合（スタンド扱いにして手番を進める）
+    def skip(self):
+        user_id = self.current_turn
+        self.stood.add(user_id)
+        self._advance()
+        return user_id
+
+    # まだスタンドしていない次のプレイヤーに手番を移し、全員スタンドしたらディーラーのターンを行う
+    def _advance(self):
+        count = len(self.players)
+        for i in range(1, count + 1):
+            index = (self.turn + i) % count
+            if self.players[index] not in self.stood:
+                self.turn = index
+                return
+        self._finish()
+
+    def _finish(self):
+        while self.dealer_hand.value < DEALER_STAND_VALUE:
+            self.dealer_hand.add(self.shoe.deal())
+        self.state = FINISHED
+
+    # 各プレイヤーの結果 (user_id, "busted" / "won" / "draw" / "lost")
+    def results(self):
+        dealer_value = self.dealer_hand.value
+        for user_id in self.players:
+            value = self.hands[user_id].value
+            if value > 21:
+                yield user_id, "busted"
+            elif dealer_value > 21 or value > dealer_value:
+                yield user_id, "won"
+            elif value == dealer_value:
+                yield user_id, "draw"
+            else:
+                yield user_id, "lost"
+
+    # ----------------------------------------------------------------------------------------------
+
+    def to_dict(self):
+        return {
+            "channel_id": self.channel_id,
+            "host_id": self.host_id,
+            "bet": self.bet,
+            "state": self.state,
+            "message_id": self.message_id,
+            "players": [[user_id, self.names[user_id]] for user_id in self.players],
+            "hands": {str(user_id): list(hand) for user_id, hand in self.hands.items()},
+            "stood": sorted(self.stood),
+            "turn": self.turn,
+            "dealer_hand": list(self.dealer_hand) if self.dealer_hand is not None else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data, shoe=None):
+        (host_id, host_name), *others = data["players"]
+        game = cls(data["channel_id"], host_id, host_name, data["bet"])
+        for user_id, name in others:
+            game.players.append(user_id)
+            game.names[user_id] = name
+        game.state = data["state"]
+        game.message_id = data["message_id"]
+        game.hands = {int(user_id): Hand(cards) for user_id, cards in data["hands"].items()}
+        game.stood = set(data["stood"])
+        game.turn = data["turn"]
+        game.dealer_hand = Hand(data["dealer_hand"]) if data["dealer_hand"] is not None else None
+        game.shoe = shoe
+        return game
+
+# ==============================================================================================
+
+# ベンチマーク: 多数の卓を同時に進行させ、1卓あたりのメモリとイベントの処理速度を測る
+# （以前はゲームごとにwait_forで待機するコルーチンが1つずつ残っていた）
+def benchmark(tables=10_000, rng=random.Random(1)):
+    tracemalloc.start()
+    games = []
+    for channel_id in range(tables):
+        game = MultiGame(channel_id, channel_id * 10, "host", 100)
+        for user_id in range(1, rng.randint(MIN_PLAYERS, MAX_PLAYERS)):
+            game.join(channel_id * 10 + user_id, f"player{user_id}")
+        game.start(Shoe(decks=1, rng=rng))
+        games.append(game)
+    table_bytes = tracemalloc.get_traced_memory()[0] / tables
+    tracemalloc.stop()
+
+    # 保存と復元で状態が変わらないことを確認する
+    for game in games[:100]:
+        assert MultiGame.from_dict(game.to_dict(), game.shoe).to_dict() == game.to_dict()
+
+    events = 0
+    start = time.perf_counter()
+    live = games
+    while live:
+        for game in live:
+            user_id = game.current_turn
+            action = rng.random()
+            if action < 0.05:
+                game.skip()
+            elif action < 0.5 and game.hands[user_id].value < 17:
+                game.hit(user_id)
+            else:
+                game.stand(user_id)
+            events += 1
+        live = [game for game in live if game.state == PLAYING]
+    elapsed = time.perf_counter() - start
+
+    print(f"{tables:,} tables: {table_bytes:,.0f} bytes/table (including a 1-deck shoe), {events / elapsed:,.0f} events/sec")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
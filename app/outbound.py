@@ -0,0 +1,303 @@
+import asyncio
+import functools
+import os
+import time
+
+import discord
+
+COALESCE_WINDOW = float(os.getenv("OUTBOUND_COALESCE_WINDOW", "0.05"))  # 同じチャンネル宛てのメッセージをまとめる待ち時間（秒）
+CHANNEL_RATE = float(os.getenv("OUTBOUND_CHANNEL_RATE", "1.0"))         # チャンネルごとの送信数の上限（秒あたり）
+CHANNEL_BURST = int(os.getenv("OUTBOUND_CHANNEL_BURST", "5"))           # 連続で送れる数（Discordのチャンネルごとの制限は5回/5秒）
+AUTO_DEFER_AFTER = float(os.getenv("AUTO_DEFER_AFTER", "2.0"))          # この秒数までに応答しないインタラクションは自動でdeferする
+MAX_CONTENT = 2000   # 1メッセージの本文の最大文字数
+MAX_EMBEDS = 10      # 1メッセージのEmbedの最大数
+
+# ==============================================================================================
+
+# トークンバケット（rate個/秒で補充し、最大capacity個まで貯まる）
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate=CHANNEL_RATE, capacity=CHANNEL_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    # 1個予約し、使えるようになるまでの秒数を返す（足りない場合は前借りして順番に待たせる）
+    def reserve(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+# ----------------------------------------------------------------------------------------------
+
+# 送信キュー
+# send() はすぐに戻り、同じチャンネル宛てのメッセージをwindow秒の間まとめてから1回のREST呼び出しで送る
+# 送信はチャンネル（Discordのレート制限の単位）ごとのトークンバケットで間隔を空け、待っている間に届いた
+# メッセージも同じ送信にまとめる。送信の結果（Message、失敗時はNone）は戻り値のFutureで受け取れる
+class Outbox:
+    def __init__(self, window=COALESCE_WINDOW, rate=CHANNEL_RATE, burst=CHANNEL_BURST):
+        self.window = window
+        self.rate = rate
+        self.burst = burst
+        self._pending = {}  # チャンネルID -> (チャンネル, [(本文, Embed), ...], [Future, ...])
+        self._buckets = {}  # チャンネルID -> TokenBucket
+        self.counters = {"queued": 0, "sent": 0, "failed": 0}
+
+    def send(self, channel, content=None, embed=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.get(channel.id)
+        if pending is None:
+            pending = self._pending[channel.id] = (channel, [], [])
+            loop.call_later(self.window, lambda: asyncio.ensure_future(self._flush(channel.id)))
+        pending[1].append((content, embed))
+        pending[2].append(future)
+        self.counters["queued"] += 1
+        return future
+
+    async def _flush(self, channel_id):
+        futures = None
+        try:
+            bucket = self._buckets.get(channel_id)
+            if bucket is None:
+                bucket = self._buckets[channel_id] = TokenBucket(self.rate, self.burst)
+            delay = bucket.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+
+            channel, parts, futures = self._pending.pop(channel_id)
+            batches = merge(parts)
+            message = None
+            for i, (content, embeds) in enumerate(batches):
+                if i:
+                    delay = bucket.reserve()
+                    if delay:
+                        await asyncio.sleep(delay)
+                try:
+                    message = await channel.send(content, embeds=embeds)
+                    self.counters["sent"] += 1
+                except discord.HTTPException as e:
+                    self.counters["failed"] += 1
+                    print(f"Failed to send a message to {channel_id}: {e}")
+            for future in futures:
+                if not future.done():
+                    future.set_result(message)
+        except Exception as e:
+            # 想定外の例外でも、送信を待っている呼び出し元が止まったままにならないよう例外を渡す
+            self.counters["failed"] += 1
+            print(f"Failed to flush messages to {channel_id}: {e!r}")
+            if futures is None:
+                futures = self._pending.pop(channel_id, (None, None, ()))[2]
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            # キャンセルされた場合も同様に、待っている呼び出し元を解放する
+            if futures is None:
+                futures = self._pending.pop(channel_id, (None, None, ()))[2]
+            for future in futures:
+                if not future.done():
+                    future.cancel()
+
+    # 保留中のメッセージがあるチャンネル数
+    def __len__(self):
+        return len(self._pending)
+
+
+# (本文, Embed) の並びを、本文は改行でつなぎ、Embedは並べて、1メッセージの上限に収まる送信単位に分ける
+# 1つで上限を超える本文は行ごとに分けて詰め直す（Discordは上限を超える本文を400で拒否し、まとめた送信全体が失敗する）
+def merge(parts):
+    batches = []
+    lines = []
+    length = 0
+    embeds = []
+    for content, embed in parts:
+        if content is not None:
+            for line in split_content(str(content)):
+                if lines and length + 1 + len(line) > MAX_CONTENT:
+                    batches.append(("\n".join(lines), embeds))
+                    lines, length, embeds = [], 0, []
+                lines.append(line)
+                length += len(line) + (1 if length else 0)
+        if embed is not None:
+            if len(embeds) >= MAX_EMBEDS:
+                batches.append(("\n".join(lines) if lines else None, embeds))
+                lines, length, embeds = [], 0, []
+            embeds.append(embed)
+    if lines or embeds:
+        batches.append(("\n".join(lines) if lines else None, embeds))
+    return batches
+
+
+# 上限を超える本文を行に分ける（1行で上限を超える場合は、その行を上限の長さごとに切る）
+def split_content(content):
+    if len(content) <= MAX_CONTENT:
+        return (content,)
+    pieces = []
+    for line in content.split("\n"):
+        pieces.extend(line[i:i + MAX_CONTENT] for i in range(0, len(line), MAX_CONTENT))
+        if not line:
+            pieces.append(line)
+    return pieces
+
+# ==============================================================================================
+
+# インタラクションへの応答
+# 最初の応答（send_message / defer）をTaskとして記録し、2回目以降はそれを待ってからfollowupで送る
+# auto_defer() を付けたコマンドは、AUTO_DEFER_AFTER秒までに応答しないと自動でdeferされ、
+# 以降の respond() はdeferされたメッセージへのfollowupになる（Discordの3秒の応答期限を過ぎない）
+# deferの公開・非公開は後から変えられないため、応答がすべて非公開のコマンドは auto_defer(ephemeral=True) にする
+# 公開でdeferした後に非公開で応答する場合は、「考え中」のメッセージを消してから非公開のfollowupを送る
+_acks = {}      # インタラクションID -> 最初の応答のTask
+_deferred = {}  # インタラクションID -> deferしてまだ応答していない場合、そのdeferが非公開かどうか
+
+
+async def respond(interaction, content=None, **kwargs):
+    if content is not None:
+        kwargs["content"] = content
+    ack = _acks.get(interaction.id)
+    if ack is None and not interaction.response.is_done():
+        ack = _acks[interaction.id] = asyncio.ensure_future(interaction.response.send_message(**kwargs))
+        await ack
+        return None
+    if ack is not None:
+        await ack
+    if _deferred.pop(interaction.id, None) is False and kwargs.get("ephemeral"):
+        try:
+            await interaction.delete_original_response()
+        except discord.HTTPException as e:
+            print(f"Failed to delete the deferred response: {e}")
+    return await interaction.followup.send(**kwargs)
+
+
+async def defer(interaction, **kwargs):
+    if interaction.id not in _acks and not interaction.response.is_done():
+        _deferred[interaction.id] = kwargs.get("ephemeral", False)
+        _acks[interaction.id] = asyncio.ensure_future(interaction.response.defer(thinking=True, **kwargs))
+    await _acks[interaction.id]
+
+
+def _auto_defer(interaction, ephemeral):
+    if interaction.id not in _acks and not interaction.response.is_done():
+        _deferred[interaction.id] = ephemeral
+        _acks[interaction.id] = asyncio.ensure_future(interaction.response.defer(thinking=True, ephemeral=ephemeral))
+
+
+# ephemeral: 自動でdeferする場合に非公開にするかどうか（応答がすべて非公開のコマンドで指定する）
+def auto_defer(delay=AUTO_DEFER_AFTER, ephemeral=False):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(interaction, *args, **kwargs):
+            timer = asyncio.get_running_loop().call_later(delay, _auto_defer, interaction, ephemeral)
+            try:
+                return await func(interaction, *args, **kwargs)
+            finally:
+                timer.cancel()
+                _deferred.pop(interaction.id, None)
+                ack = _acks.pop(interaction.id, None)
+                if ack is not None and not ack.done():
+                    await asyncio.wait([ack])
+        return wrapper
+    return decorator
+
+# ==============================================================================================
+
+# セルフチェック: ローカルの偽のDiscord APIに対してdiscord.pyのHTTPクライアントで送信し、
+# まとめて送信できること・送信の失敗が呼び出し元に伝わること・レート制限の間隔を確認する
+# （リポジトリにpytestのテストはないため、python app/outbound.py で実行する）
+async def _self_check():
+    import json
+
+    from aiohttp import web
+    from discord.http import Route
+
+    calls = []
+
+    # discord.pyは Content-Type が "application/json" ちょうどの場合だけJSONとして読む
+    def json_response(data):
+        return web.Response(body=json.dumps(data).encode(), content_type="application/json")
+
+    async def users_me(request):
+        return json_response({"id": "1", "username": "bot", "discriminator": "0", "avatar": None})
+
+    async def create_message(request):
+        data = await request.json()
+        calls.append(request.path)
+        return json_response({
+            "id": str(len(calls)), "channel_id": request.match_info["channel_id"], "type": 0,
+            "author": {"id": "1", "username": "bot", "discriminator": "0", "avatar": None},
+            "content": data.get("content") or "", "embeds": data.get("embeds", []), "attachments": [],
+            "mentions": [], "mention_roles": [], "mention_everyone": False, "pinned": False, "tts": False,
+            "timestamp": "2024-01-01T00:00:00+00:00", "edited_timestamp": None,
+        })
+
+    app = web.Application()
+    app.router.add_get("/api/v10/users/@me", users_me)
+    app.router.add_post("/api/v10/channels/{channel_id}/messages", create_message)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    base = Route.BASE
+    Route.BASE = f"http://127.0.0.1:{port}/api/v10"
+    client = discord.Client(intents=discord.Intents.none())
+    try:
+        await client.http.static_login("fake-token")
+        channel = client.get_partial_messageable(100)
+
+        # 同じチャンネル宛ての本文とEmbedは、1回の送信にまとめられる
+        # （実際のコマンドごとの送信回数は bench.py --rest-calls で、コマンドをそのまま動かして測る）
+        embed = discord.Embed(title="embed")
+        sends = [("<@2>", None), (None, embed), ("player2 has joined the game! (2/4)", None), (None, embed)]
+        calls.clear()
+        outbox = Outbox(rate=1000.0, burst=1000)
+        messages = await asyncio.gather(*[outbox.send(channel, content, embed_) for content, embed_ in sends])
+        assert all(message is not None for message in messages) and len(calls) == 1
+        print(f"{len(sends)} sends to one channel: {len(calls)} REST call")
+
+        # 上限（2000文字）を超える本文は、行の区切り（1行で超える場合はその途中）で分けて送る
+        calls.clear()
+        long_lines = "\n".join(f"line {i:04d} " + "x" * 90 for i in range(30))
+        huge_line = "y" * (MAX_CONTENT * 2 + 10)
+        batches = merge([("short", None), (long_lines, embed), (huge_line, None)])
+        assert all(content is None or len(content) <= MAX_CONTENT for content, embeds in batches)
+        # 文字は欠けない（1行で上限を超える行は、切った位置で改行されて届く）
+        assert "".join(content.replace("\n", "") for content, embeds in batches) == ("short" + long_lines + huge_line).replace("\n", "")
+        await asyncio.gather(outbox.send(channel, "short"), outbox.send(channel, long_lines, embed), outbox.send(channel, huge_line))
+        assert len(calls) == len(batches)
+        print(f"{len('short') + len(long_lines) + len(huge_line):,} characters in 3 sends: {len(calls)} REST calls of at most {MAX_CONTENT} characters")
+
+        # 送信中に想定外の例外が起きても、待っている呼び出し元には例外が渡る（止まったままにならない）
+        class Broken:
+            id = 200
+            async def send(self, content=None, **kwargs):
+                raise RuntimeError("broken channel")
+        futures = [outbox.send(Broken(), "a"), outbox.send(Broken(), "b")]
+        results = await asyncio.wait_for(asyncio.gather(*futures, return_exceptions=True), 1.0)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        print("unexpected send errors are passed to every waiting caller")
+
+        # レート制限: 5回/5秒のバケットで12件を順に送ると、待っている間に届いたものがまとめて送られる
+        calls.clear()
+        outbox = Outbox(window=0.01, rate=1.0, burst=5)
+        start = time.monotonic()
+        futures = []
+        for i in range(12):
+            futures.append(outbox.send(channel, f"message {i}"))
+            await asyncio.sleep(0.02)
+        await asyncio.gather(*futures)
+        print(f"12 sends spaced 20 ms apart: {len(calls)} REST calls in {time.monotonic() - start:.2f} s")
+    finally:
+        Route.BASE = base
+        await client.http.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(_self_check())
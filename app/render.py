@@ -0,0 +1,314 @@
+import string
+import sys
+import time
+from collections import OrderedDict
+from operator import itemgetter
+
+import discord
+
+# 応答メッセージの組み立てをまとめたモジュール
+# メッセージの種類ごとにテンプレートを起動時に1度だけ用意し、各コマンドでは値を差し込むだけにする
+
+COIN = "<:casino_tip2:1369628815709569044>"
+
+# 色は毎回作らず使い回す
+BLUE = discord.Color.blue()
+GREEN = discord.Color.green()
+RED = discord.Color.red()
+ORANGE = discord.Color.orange()
+
+# ==============================================================================================
+
+# 文字列テンプレートを起動時に1度だけ解析し、値を埋め込む関数にする
+# {coin} は絵文字へ置き換え、残りの {name} は % 書式の %s（!r は %r）にして、呼び出しのたびには
+# itemgetter で値を順に取り出して % で埋めるだけにする（テンプレートを毎回解析しない）
+# {net:+} のように書式指定のある欄を含むテンプレートだけは、値ごとに format() を呼ぶ
+# keywords=True の場合は値をキーワード引数で、それ以外は辞書で受け取る（使わない値は無視する）
+def compile_template(template, keywords=False):
+    parsed = list(string.Formatter().parse(template.replace("{coin}", COIN)))
+    fields = [(name, spec, conversion) for literal, name, spec, conversion in parsed if name is not None]
+    for name, spec, conversion in fields:
+        if not name.isidentifier():
+            raise ValueError(f"Unsupported template field: {{{name}}}")
+
+    formatted = any(spec for name, spec, conversion in fields)
+    pieces = []
+    for literal, name, spec, conversion in parsed:
+        pieces.append(literal.replace("%", "%%"))
+        if name is not None:
+            pieces.append("%r" if conversion == "r" and not formatted else "%a" if conversion == "a" and not formatted else "%s")
+    fmt = "".join(pieces)
+
+    if formatted:
+        convert = {"r": repr, "s": str, "a": ascii}
+
+        def get(values):
+            return tuple(
+                format(convert[conversion](values[name]) if conversion else values[name], spec)
+                for name, spec, conversion in fields
+            )
+    else:
+        if not fields:
+            def get(values):
+                return ()
+        elif len(fields) == 1:
+            # itemgetter は1つだけ取り出す場合はタプルを返さないため、同じ値を2回取り出して2つ目は %.0s（0文字）で読み捨てる
+            fmt += "%.0s"
+            get = itemgetter(fields[0][0], fields[0][0])
+        else:
+            get = itemgetter(*(name for name, spec, conversion in fields))
+
+    if keywords:
+        def fill(**values):
+            return fmt % get(values)
+    else:
+        def fill(values):
+            return fmt % get(values)
+    return fill
+
+
+# 値をキーワード引数で受け取って埋め込む関数にする
+def text(template):
+    return compile_template(template, keywords=True)
+
+
+# Embedのテンプレート（タイトル・色・本文・フッター）
+# 差し込む値のないタイトルとフッターは文字列のまま持ち、関数を呼ばずに済ませる
+# 本文などは値の辞書をそのまま渡す関数（compile_template）で持ち、キーワード引数を詰め直さない
+class Template:
+    __slots__ = ("title", "color", "description", "footer")
+
+    def __init__(self, title, color, description=None, footer=None):
+        self.title = compile_template(title) if "{" in title else title
+        self.color = color
+        self.description = compile_template(description) if description else None
+        self.footer = compile_template(footer) if footer and "{" in footer else footer
+
+    # author: 作成者欄に表示するユーザー / footer_user: フッターにアイコンを表示するユーザー
+    def render(self, author=None, footer_user=None, color=None, **values):
+        title = self.title
+        embed = discord.Embed(
+            title=title if title.__class__ is str else title(values),
+            description=self.description(values) if self.description else None,
+            color=color or self.color
+        )
+        if author is not None:
+            name, icon_url = author_block(author)
+            embed.set_author(name=name, icon_url=icon_url)
+        footer = self.footer
+        if footer is not None:
+            embed.set_footer(
+                text=footer if footer.__class__ is str else footer(values),
+                icon_url=author_block(footer_user)[1] if footer_user else None
+            )
+        return embed
+
+# ----------------------------------------------------------------------------------------------
+
+# ユーザーごとの作成者欄（名前とアイコンのURL）のキャッシュ
+# display_avatar を使うので、アバター未設定のユーザーでもデフォルトのアイコンが表示される
+# サーバー専用のアバターがあるため、サーバーごとに保持する（DMでは0）
+# 最近表示したAUTHOR_CACHE_SIZE人分だけを残し、それより古いユーザーから捨てる
+AUTHOR_CACHE_SIZE = 10000
+_authors = OrderedDict()  # user_id -> {guild_id: (名前, アイコンのURL)}（最近使った順）
+
+
+def author_block(user):
+    entries = _authors.get(user.id)
+    if entries is None:
+        entries = _authors[user.id] = {}
+        if len(_authors) > AUTHOR_CACHE_SIZE:
+            _authors.popitem(last=False)
+    else:
+        _authors.move_to_end(user.id)
+    guild = getattr(user, "guild", None)
+    guild_id = guild.id if guild is not None else 0
+    block = entries.get(guild_id)
+    if block is None:
+        block = entries[guild_id] = (user.name, user.display_avatar.url)
+    return block
+
+
+# 名前やアバターが変わった場合に呼ぶ（次の表示時に作り直す）
+def forget_author(user_id):
+    _authors.pop(user_id, None)
+
+# ==============================================================================================
+
+# 共通
+BET_WARNING = text("{mention}\nWarning: You are betting more than your current balance {coin} {balance}.\nYour balance will go negative if you lose.")
+BET_LIMIT = text("Your bet amount exceeds the maximum limit of {coin} {max_bet}.")
+COINS = text("{coin} {balance} coins")
+
+# /daily
+DAILY_ALREADY_CLAIMED = Template("Daily Reward", RED, "You have already claimed your daily reward today.")
+DAILY_CLAIMED = Template("Daily Reward", GREEN, "You have claimed your daily reward of {coin} {reward} coins!\nYou now have {coin} {balance} coins.")
+DAILY_BONUS = text("{mention} has claimed their daily reward for the 7th time!\nThey received an extra {bonus} coins!")
+
+# /give
+GIVE_NOT_ENOUGH = Template("Error", RED, "You don't have enough coins to give.")
+GIVE_DONE = Template("Coins Given", GREEN, "You have given {coin} {amount} coins to {receiver}.\nYou now have {coin} {balance} coins.")
+
+# /rob
+ROB_LIMIT = Template("Robbery Limit Reached", RED, "You can only rob once per day. Please try again tomorrow!")
+ROB_NO_TARGET = Template("Error", RED, "No eligible users to rob. All users have 0 or negative balance.")
+ROB_FAILED = Template(
+    "Robbery Failed!", RED,
+    "You tried to rob {victim}, but failed!\n{victim} has robbed {coin} {amount} coins from you instead.\nYou now have {coin} {balance} coins.",
+)
+ROB_SUCCESS = Template("Robbery Successful!", GREEN, "You have successfully robbed {coin} {amount} coins from {victim}.\nYou now have {coin} {balance} coins.")
+ROB_ALERT = Template("Robbery Alert!", RED, "You have been robbed by {robber}!\nYou lost {coin} {amount} coins.\nYou now have {coin} {balance} coins.")
+
+# /balance, /balance_all, /rank, /starting_balance
+BALANCE = Template("Balance", GREEN, "{name} has {coin} {balance}.")
+BALANCE_MISSING = Template("Error", RED, "{name} does not have a balance yet.")
+BALANCE_ALL = Template("All Members' Balances", BLUE, footer="Page {page}/{page_count} - Requested by {name}")
+RANK = Template("Rank", BLUE, "{name} is ranked #{position} of {count} with {coin} {balance} coins.")
+RANK_MISSING = Template("Error", RED, "{name} is not ranked in this server.")
+STARTING_BALANCE_SET = text("The starting balance for new members is now {coin} {amount} coins.")
+
+# ----------------------------------------------------------------------------------------------
+
+# /roulette
+ROULETTE_BET = Template("Roulette Bet", BLUE, "**Bet Amount**\n{coin} {amount} coins\n\n**Bet Option**\n{option}\n")
+ROULETTE_BET_NUMBER = Template("Roulette Bet", BLUE, "**Bet Amount**\n{coin} {amount} coins\n\n**Bet Option**\n{option}\n\n**Chosen Number**\n{number}")
+
+_ROULETTE_BALANCE = "\n\n{name} now have {coin} {balance}."
+_ROULETTE_RANGE_WIN = text("The roulette landed on {result}.\nYOU WIN! The range matched! You gained {coin} {winnings}." + _ROULETTE_BALANCE)
+_ROULETTE_PARITY_WIN = text("The roulette landed on {result} ({parity}).\nYOU WIN! You gained {coin} {winnings}." + _ROULETTE_BALANCE)
+_ROULETTE_LOSE = text("The roulette landed on {result}.\nYOU LOSE... You lost {coin} {amount}." + _ROULETTE_BALANCE)
+
+# 賭け方ごとの結果メッセージ
+ROULETTE_WIN = {
+    "number": text("The roulette landed on {result}.\nYOU WIN! The number matched! You gained {coin} {winnings}." + _ROULETTE_BALANCE),
+    "even": _ROULETTE_PARITY_WIN,
+    "odd": _ROULETTE_PARITY_WIN,
+    "small": _ROULETTE_RANGE_WIN,
+    "medium": _ROULETTE_RANGE_WIN,
+    "large": _ROULETTE_RANGE_WIN,
+    "first": _ROULETTE_RANGE_WIN,
+    "second": _ROULETTE_RANGE_WIN,
+}
+ROULETTE_LOSE = dict.fromkeys(ROULETTE_WIN, _ROULETTE_LOSE)
+ROULETTE_LOSE["number"] = text("The roulette landed on {result}.\nYOU LOSE... The number didn't match. You lost {coin} {amount}." + _ROULETTE_BALANCE)
+
+# 複数の賭けを1回のスピンでまとめて判定した結果（賭けごとの行と合計を1つのメッセージにする）
+ROULETTE_SPIN = Template(
+    "Roulette", BLUE,
+    "The roulette landed on **{result}** ({parity}).\n\n{lines}\n\n**Total Bet** {coin} {stake}\n**Total Payout** {coin} {payout} ({net:+})"
+    + _ROULETTE_BALANCE,
+)
+ROULETTE_SPIN_WIN = text("WIN  **{option}** {coin} {amount} → {coin} {payout}")
+ROULETTE_SPIN_LOSE = text("LOSE **{option}** {coin} {amount}")
+
+# ----------------------------------------------------------------------------------------------
+
+# /blackjack, /hit, /stand, /double_down
+_YOUR_HAND = "**Your Hand**: {hand} (Value: {value})\n"
+_NEW_BALANCE = "Your new balance is {coin} {balance} coins."
+BLACKJACK_HAND = Template(
+    "Blackjack", BLUE,
+    _YOUR_HAND + "**Dealer's Hand**: {upcard}, ❓",
+    footer="Type '/hit' to draw another card or '/stand' to end your turn.",
+)
+BLACKJACK_NATURAL_DRAW = Template(
+    "Blackjack - It's a Draw!", ORANGE,
+    _YOUR_HAND + "**Dealer's Hand**: {dealer_hand} (Value: {dealer_value})\n\nIt's a draw! Your balance remains the same.\n" + _NEW_BALANCE,
+)
+BLACKJACK_NATURAL = Template(
+    "Blackjack - Natural 21!", GREEN,
+    _YOUR_HAND + "**Dealer's Hand**: {dealer_hand} (Value: {dealer_value})\n\nYou got a Natural 21! You win {coin} {winnings} coins.\n" + _NEW_BALANCE,
+)
+BLACKJACK_BUST = Template("Blackjack - You Lose!", RED, _YOUR_HAND + "You went over 21 and lost {coin} {bet} coins.\n" + _NEW_BALANCE)
+BLACKJACK_RESULT = Template("Blackjack - {result}", BLUE, _YOUR_HAND + "**Dealer's Hand**: {dealer_hand} (Value: {dealer_value})")
+BLACKJACK_DOUBLE_RESULT = Template(
+    "Blackjack - {result}", BLUE,
+    _YOUR_HAND + "**Dealer's Hand**: {dealer_hand} (Value: {dealer_value})\n\n{balance_change}\n" + _NEW_BALANCE,
+)
+BLACKJACK_GAINED = text("You gained {coin} {amount} coins.")
+BLACKJACK_LOST = text("You lost {coin} {amount} coins.")
+BLACKJACK_TABLES_FULL = "Too many blackjack games are in progress. Please try again later."
+BLACKJACK_TIMEOUT_STAND = text("{mention} Your blackjack game timed out, so you stood automatically.")
+BLACKJACK_TIMEOUT_REFUND = text("{mention} Your blackjack game timed out. Your bet of {coin} {bet} coins has been refunded.")
+BLACKJACK_HINT = Template(
+    "Blackjack Hint - {best}", GREEN,
+    _YOUR_HAND + "**Dealer's Hand**: {upcard}, ❓\n\n{lines}",
+    footer="EV is the expected net result per 1 coin bet, based on the cards not yet seen.",
+)
+
+# /multi_bj
+MULTI_RECRUIT = Template(
+    "Multiplayer Blackjack", BLUE,
+    "React with 🎮 to join the game!\n"
+    "React with ✅ to start the game immediately (at least 2 players required).\n"
+    "Up to 4 players can join.\n"
+    "The game will start in 60 seconds or when 4 players join.",
+    footer="Hosted by {name}",
+)
+MULTI_HANDS = Template("Blackjack Hands", BLUE, footer="Type '/hit' to draw another card or '/stand' to end your turn.")
+MULTI_TURN_HAND = Template("Your Blackjack Hand", BLUE, "Your hand: {hand} (Value: {value})")
+MULTI_BUSTED = Template("Blackjack - You Busted!", RED, "Your hand: {hand} (Value: {value})\nYou went over 21!")
+MULTI_GAME_STATE = Template("Blackjack Game State", BLUE)
+MULTI_RESULTS = Template("Blackjack Results", GREEN, "{results}")
+HAND_FIELD = text("{hand} (Value: {value})")
+
+# /odds
+ODDS = Template("House Edge Simulation", BLUE, "EV and variance are per 1 coin bet.\n```\n{lines}\n```")
+
+# ==============================================================================================
+
+# ベンチマーク: /roulette の応答（賭けのEmbedと結果のメッセージ）を毎回組み立てる方式と比較する
+class _FakeUser:
+    __slots__ = ("id", "name", "guild", "_avatar")
+
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.guild = None
+        self._avatar = f"{user_id:032x}"
+
+    # discord.py と同じく、参照するたびにAssetを作る
+    @property
+    def avatar(self):
+        return discord.Asset._from_avatar(None, self.id, self._avatar)
+
+    @property
+    def display_avatar(self):
+        return self.avatar
+
+
+def _inline_roulette(user, amount, result, balance):
+    embed = discord.Embed(
+        title="Roulette Bet",
+        description=(
+            f"**Bet Amount**\n<:casino_tip2:1369628815709569044> {amount} coins\n\n"
+            f"**Bet Option**\nEven\n"
+        ),
+        color=discord.Color.blue()
+    )
+    embed.set_author(name=user.name, icon_url=user.avatar.url)
+    message = f"The roulette landed on {result} (even).\nYOU WIN! You gained <:casino_tip2:1369628815709569044> {amount * 2}.\n\n{user.name} now have <:casino_tip2:1369628815709569044> {balance}."
+    return embed, message
+
+
+def _template_roulette(user, amount, result, balance):
+    embed = ROULETTE_BET.render(author=user, amount=amount, option="Even")
+    message = ROULETTE_WIN["even"](result=result, parity="even", winnings=amount * 2, amount=amount, name=user.name, balance=balance)
+    return embed, message
+
+
+def benchmark(responses=200_000, users=1000):
+    people = [_FakeUser(i) for i in range(users)]
+    assert _inline_roulette(people[1], 100, 2, 500)[0].to_dict() == _template_roulette(people[1], 100, 2, 500)[0].to_dict()
+    assert _inline_roulette(people[1], 100, 2, 500)[1] == _template_roulette(people[1], 100, 2, 500)[1]
+    assert compile_template("{{%}} {a!r} {net:+,}")({"a": "x", "net": 1234}) == "{%} 'x' +1,234"
+    for name, build in (("inline", _inline_roulette), ("templates", _template_roulette)):
+        start = time.perf_counter()
+        for i in range(responses):
+            build(people[i % users], i, 2, i * 3)
+        rate = responses / (time.perf_counter() - start)
+        print(f"{name:<10} {rate:>12,.0f} responses/sec")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
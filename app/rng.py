@@ -0,0 +1,223 @@
+import json
+import os
+import random
+import secrets
+import sys
+import time
+import zlib
+from collections import deque
+
+import numpy as np
+
+from cards import Shoe
+
+# ゲームの乱数
+# ゲームごとのストリーム（"roulette", "rob", "shoe"）に分け、各ストリームは POOL_SIZE 個ずつの乱数をNumPyでまとめて作り、
+# 1回の抽選はバッファの位置を1つ進めるだけにする
+# ブロックごとの乱数はマスターシード・ワーカー番号・ストリーム名・ブロック番号から導いたシードで作るため、
+# 抽選前の位置（"roulette/12/345" = ストリーム/ブロック/位置）を記録しておけば、後から同じ結果を再現できる
+RNG_SEED = os.getenv("RNG_SEED")                     # マスターシード（未設定なら起動ごとにランダム。記録に残る）
+RNG_LOG_PATH = os.getenv("RNG_LOG_PATH")             # ゲームごとの記録（JSON Lines）の保存先（未設定ならメモリ上の直近分のみ）
+POOL_SIZE = int(os.getenv("RNG_POOL_SIZE", "4096"))  # 1回の補充で作る乱数の数
+RECENT_RECORDS = 1000                                # メモリ上に残す直近の記録の数
+
+# ==============================================================================================
+
+# 1つのストリーム（random モジュールの random / randint / shuffle と同じ使い方ができる）
+class Stream:
+    __slots__ = ("name", "seed", "worker", "size", "block", "offset", "pool")
+
+    def __init__(self, name, seed, worker=0, size=POOL_SIZE, block=0, offset=0):
+        self.name = name
+        self.seed = seed
+        self.worker = worker
+        self.size = size
+        self.block = block
+        self.offset = offset
+        self.pool = self._generate(block)
+
+    def _generate(self, block):
+        sequence = np.random.SeedSequence(self.seed, spawn_key=(self.worker, zlib.crc32(self.name.encode()), block))
+        return np.random.Generator(np.random.PCG64(sequence)).random(self.size).tolist()
+
+    # [0, 1) の一様乱数
+    def random(self):
+        offset = self.offset
+        if offset >= self.size:
+            self.block += 1
+            self.pool = self._generate(self.block)
+            offset = 0
+        self.offset = offset + 1
+        return self.pool[offset]
+
+    # 0 ～ n-1 の整数（補充が要らない場合は random() を呼ばずにバッファから読む）
+    def below(self, n):
+        offset = self.offset
+        if offset >= self.size:
+            return int(self.random() * n)
+        self.offset = offset + 1
+        return int(self.pool[offset] * n)
+
+    # a ～ b の整数（両端を含む）
+    def randint(self, a, b):
+        return a + self.below(b - a + 1)
+
+    # Fisher-Yates（1要素につき1回の抽選）
+    def shuffle(self, items):
+        for i in range(len(items) - 1, 0, -1):
+            j = int(self.random() * (i + 1))
+            items[i], items[j] = items[j], items[i]
+
+    # 次の抽選の位置
+    def tell(self):
+        if self.offset >= self.size:
+            return f"{self.name}/{self.block + 1}/0"
+        return f"{self.name}/{self.block}/{self.offset}"
+
+# ----------------------------------------------------------------------------------------------
+
+class RngService:
+    def __init__(self, seed=None, worker=0, size=POOL_SIZE, log_path=None):
+        self.seed = secrets.randbits(64) if seed is None else seed
+        self.worker = worker
+        self.size = size
+        self.streams = {}  # 名前 -> Stream
+        self.recent = deque(maxlen=RECENT_RECORDS)
+        self._log = open(log_path, "a", buffering=1) if log_path else None
+
+    def stream(self, name):
+        stream = self.streams.get(name)
+        if stream is None:
+            stream = self.streams[name] = Stream(name, self.seed, self.worker, self.size)
+        return stream
+
+    # 記録した位置から抽選し直すための新しいストリーム（使用中のストリームには影響しない）
+    def at(self, key):
+        name, block, offset = key.rsplit("/", 2)
+        return Stream(name, self.seed, self.worker, self.size, int(block), int(offset))
+
+    # ゲームの結果を、再現に必要な位置と一緒に記録する
+    def record(self, game, key, **details):
+        entry = {"time": time.time(), "game": game, "seed": self.seed, "worker": self.worker, "pool": self.size, "key": key, **details}
+        self.recent.append(entry)
+        if self._log is not None:
+            self._log.write(json.dumps(entry) + "\n")
+        return entry
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+# 記録からその時点のストリームを作る（記録したプロセスでなくてもよい）
+def replay(entry):
+    return RngService(entry["seed"], entry["worker"], entry["pool"]).at(entry["key"])
+
+# ----------------------------------------------------------------------------------------------
+
+# シューの再現用の情報（最後にシャッフルした位置と、ゲーム中に捨て札を補充した位置）
+# Shoe の rng に Stream を渡しておくと、shuffle のたびに抽選前の位置を覚えておく
+# ゲームの途中の補充は記録（ゲームの開始時）の後に起きるため、共有のストリームの位置は記録に残せない
+# そこで補充には、シャッフルの位置と何回目の補充かから名前を決めたこのシュー専用のストリームを使い、
+# ゲームの開始時の記録だけで補充の抽選の位置が決まるようにする
+class ReplayableShoe(Shoe):
+    __slots__ = ("shuffle_key", "refills")
+
+    def shuffle(self):
+        self.shuffle_key = self.rng.tell()
+        self.refills = []
+        super().shuffle()
+
+    def _reshuffle_discards(self):
+        shared = self.rng
+        refill = Stream(f"refill:{self.shuffle_key}:{len(self.refills)}", shared.seed, shared.worker, shared.size)
+        self.refills.append((self.round_start, refill.tell()))
+        self.rng = refill
+        try:
+            super()._reshuffle_discards()
+        finally:
+            self.rng = shared
+
+    # このゲーム（start_round() 以降）の配札を再現するための情報
+    def replay_key(self):
+        return {"decks": len(self.cards) // 52, "shuffle": self.shuffle_key, "refills": list(self.refills), "round_start": self.round_start}
+
+    # 記録した時点のシューを作り直す（次に配るカードがゲームの最初のカード）
+    # （記録より後の、ゲームの途中の補充は _reshuffle_discards() がシャッフルの位置から同じストリームを作り直す）
+    @classmethod
+    def replay(cls, service, key):
+        shoe = cls(decks=key["decks"], rng=service.at(key["shuffle"]))
+        for round_start, refill_key in key["refills"]:
+            shoe.cursor = len(shoe.cards)
+            shoe.round_start = round_start
+            shoe._reshuffle_discards()
+        shoe.cursor = shoe.round_start = key["round_start"]
+        return shoe
+
+
+# ブラックジャックの記録（keyが replay_key() のもの）から、そのゲームの開始時点のシューを作る
+def replay_shoe(entry):
+    return ReplayableShoe.replay(RngService(entry["seed"], entry["worker"], entry["pool"]), entry["key"])
+
+# ==============================================================================================
+
+# セルフチェック: 記録した位置から再現した結果が元の結果と一致すること、と1回の抽選のコスト
+def benchmark(draws=1_000_000):
+    service = RngService(seed=12345, size=1024)
+
+    # ルーレット: ブロックをまたぐ回数を回し、記録から1回ずつ再現する
+    roulette = service.stream("roulette")
+    spins = []
+    for _ in range(5000):
+        key = roulette.tell()
+        spins.append(service.record("roulette", key, pocket=roulette.below(37)))
+    for entry in spins:
+        assert replay(entry).below(37) == entry["pocket"]
+
+    # 強奪: 額と成否の2回の抽選
+    rob = service.stream("rob")
+    for _ in range(1000):
+        key = rob.tell()
+        entry = service.record("rob", key, amount=rob.randint(100, 500), failed=rob.random() < 0.5)
+        stream = replay(entry)
+        assert (stream.randint(100, 500), stream.random() < 0.5) == (entry["amount"], entry["failed"])
+
+    # ブラックジャック: シャッフルと捨て札の補充を何度もまたいで配り、ゲームの開始時の記録から同じ順に配れること
+    # 他のチャンネルのシューも同じ "shoe" ストリームを使うため、記録の後・ゲームの途中の補充の前に
+    # 別のシューがシャッフルしてストリームを進めても、補充も含めて同じ順に配れること
+    shoe = ReplayableShoe(decks=1, penetration=0.95, rng=service.stream("shoe"))
+    other = ReplayableShoe(decks=1, rng=service.stream("shoe"))
+    refills = 0
+    for _ in range(2000):
+        shoe.start_round()
+        entry = service.record("blackjack", shoe.replay_key())
+        before = len(shoe.refills)
+        dealt = [shoe.deal() for _ in range(6)]
+        other.shuffle()
+        dealt += [shoe.deal() for _ in range(6)]
+        again = replay_shoe(entry)
+        assert [again.deal() for _ in range(12)] == dealt
+        refills += len(shoe.refills) > before
+    assert refills  # ゲームの途中での捨て札の補充も含めて再現できている
+
+    # 同じシードと位置からは、別のプロセス・別のサービスでも同じ乱数になる
+    assert RngService(seed=12345, size=1024).at("roulette/3/17").random() == service.at("roulette/3/17").random()
+
+    stream = RngService(seed=1).stream("bench")
+    start = time.perf_counter()
+    for _ in range(draws):
+        stream.below(37)
+    pooled = (time.perf_counter() - start) / draws
+    start = time.perf_counter()
+    for _ in range(draws):
+        random.randint(0, 36)
+    module = (time.perf_counter() - start) / draws
+
+    print("replay: 5,000 spins, 1,000 robberies, 2,000 blackjack rounds reproduced")
+    print(f"random.randint:     {module * 1e9:6.0f} ns/draw")
+    print(f"pooled stream draw: {pooled * 1e9:6.0f} ns/draw")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,239 @@
+import random
+import time
+
+# ==============================================================================================
+
+# 1つのサーバーの強奪対象（所持金が0より大きいボット以外のメンバー）
+# 配列と位置の辞書で一様抽選をO(1)、所持金を重みとしたFenwick木で重み付き抽選をO(log n)で行う
+class GuildRobIndex:
+    def __init__(self):
+        self._ids = []        # 対象のuser_id（削除時は末尾と入れ替える）
+        self._weights = []    # 各位置の重み（所持金）
+        self._positions = {}  # user_id -> 配列上の位置
+        self._tree = [0]      # Fenwick木（1始まり）
+        self._total = 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, user_id):
+        return user_id in self._positions
+
+    # 所持金を設定する（0以下になった場合は対象から外す）
+    def set(self, user_id, balance):
+        if balance <= 0:
+            self.remove(user_id)
+            return
+        position = self._positions.get(user_id)
+        if position is None:
+            position = len(self._ids)
+            self._positions[user_id] = position
+            self._ids.append(user_id)
+            self._weights.append(0)
+            if len(self._tree) <= len(self._ids):
+                self._grow()
+        self._add(position, balance - self._weights[position])
+        self._weights[position] = balance
+
+    def remove(self, user_id):
+        position = self._positions.pop(user_id, None)
+        if position is None:
+            return
+        last = len(self._ids) - 1
+        weight = self._weights[position]
+        if position != last:
+            # 末尾の要素を空いた位置に移す
+            last_id = self._ids[last]
+            last_weight = self._weights[last]
+            self._ids[position] = last_id
+            self._weights[position] = last_weight
+            self._positions[last_id] = position
+            self._add(position, last_weight - weight)
+            self._add(last, -last_weight)
+        else:
+            self._add(position, -weight)
+        self._ids.pop()
+        self._weights.pop()
+
+    # ----------------------------------------------------------------------------------------------
+
+    def _add(self, position, delta):
+        self._total += delta
+        i = position + 1
+        tree = self._tree
+        size = len(tree)
+        while i < size:
+            tree[i] += delta
+            i += i & -i
+
+    # 容量を倍にしてFenwick木を作り直す（O(n)、追加時に償却O(1)）
+    def _grow(self):
+        size = max(16, len(self._tree) * 2)
+        tree = [0] * size
+        for i, weight in enumerate(self._weights, 1):
+            tree[i] += weight
+            parent = i + (i & -i)
+            if parent < size:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    # position未満の位置の重みの合計
+    def _prefix(self, position):
+        total = 0
+        i = position
+        tree = self._tree
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    # 累積重みがtargetを超える最初の位置を探す
+    def _search(self, target):
+        tree = self._tree
+        position = 0
+        step = 1 << (len(tree).bit_length() - 1)
+        while step:
+            next_position = position + step
+            if next_position < len(tree) and tree[next_position] <= target:
+                position = next_position
+                target -= tree[next_position]
+            step >>= 1
+        return position
+
+    # ----------------------------------------------------------------------------------------------
+
+    # 除外するユーザー以外から一様に1人選ぶ（対象がいない場合はNone）
+    def pick(self, exclude=None, rng=random):
+        count = len(self._ids)
+        excluded = self._positions.get(exclude)
+        if excluded is not None:
+            count -= 1
+        if count <= 0:
+            return None
+        index = int(rng.random() * count)
+        if excluded is not None and index >= excluded:
+            index += 1
+        return self._ids[index]
+
+    # 除外するユーザー以外から所持金に比例した確率で1人選ぶ
+    def pick_weighted(self, exclude=None, rng=random):
+        total = self._total
+        excluded = self._positions.get(exclude)
+        if excluded is not None:
+            total -= self._weights[excluded]
+        if total <= 0:
+            return None
+        target = int(rng.random() * total)
+        # 除外するユーザーの区間を飛ばす
+        if excluded is not None and target >= self._prefix(excluded):
+            target += self._weights[excluded]
+        return self._ids[self._search(target)]
+
+# ----------------------------------------------------------------------------------------------
+
+# 全サーバーの強奪対象を管理する
+# 台帳の変更通知を受けて、そのユーザーが所属するサーバーの対象だけを更新する
+class RobIndex:
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.guilds = {}        # guild_id -> GuildRobIndex
+        self._members = {}      # guild_id -> ボット以外のメンバーIDの集合
+        self._user_guilds = {}  # user_id -> 所属しているサーバーIDの集合
+        ledger.add_listener(self._on_balance_change)
+
+    def get(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    # サーバーの対象一覧を作成する（初回の参照時のみ、メンバー一覧から1度だけ構築する）
+    def build(self, guild_id, member_ids):
+        self.drop_guild(guild_id)
+        index = GuildRobIndex()
+        members = set(member_ids)
+        # アカウント未作成のメンバーはサーバーの初期所持金を持っているものとして扱う
+        starting_balance = self.ledger.starting_balance(guild_id)
+        for user_id in members:
+            index.set(user_id, self.ledger.balance_or(user_id, starting_balance))
+            self._user_guilds.setdefault(user_id, set()).add(guild_id)
+        self.guilds[guild_id] = index
+        self._members[guild_id] = members
+        return index
+
+    def drop_guild(self, guild_id):
+        self.guilds.pop(guild_id, None)
+        for user_id in self._members.pop(guild_id, ()):
+            self._forget(user_id, guild_id)
+
+    def add_member(self, guild_id, user_id):
+        index = self.guilds.get(guild_id)
+        if index is not None:
+            self._members[guild_id].add(user_id)
+            self._user_guilds.setdefault(user_id, set()).add(guild_id)
+            index.set(user_id, self.ledger.balance_or(user_id, self.ledger.starting_balance(guild_id)))
+
+    def remove_member(self, guild_id, user_id):
+        index = self.guilds.get(guild_id)
+        if index is not None:
+            self._members[guild_id].discard(user_id)
+            index.remove(user_id)
+            self._forget(user_id, guild_id)
+
+    def _forget(self, user_id, guild_id):
+        guild_ids = self._user_guilds.get(user_id)
+        if guild_ids is not None:
+            guild_ids.discard(guild_id)
+            if not guild_ids:
+                del self._user_guilds[user_id]
+
+    def _on_balance_change(self, user_id, old, new):
+        for guild_id in self._user_guilds.get(user_id, ()):
+            self.guilds[guild_id].set(user_id, new)
+
+# ==============================================================================================
+
+# ベンチマーク: 毎回メンバー全員を走査するリスト内包表記と索引からの抽選を比較する
+class _FakeMember:
+    __slots__ = ("id", "bot")
+
+    def __init__(self, user_id, bot):
+        self.id = user_id
+        self.bot = bot
+
+
+def benchmark(sizes=(1_000, 10_000, 100_000), picks=2000):
+    for size in sizes:
+        members = [_FakeMember(i, i % 50 == 0) for i in range(size)]
+        balances = {i: random.randint(-100, 5000) for i in range(size)}
+        robber_id = 1
+
+        start = time.perf_counter()
+        for _ in range(picks):
+            eligible_users = [
+                member for member in members
+                if not member.bot and balances.get(member.id, 0) > 0 and member.id != robber_id
+            ]
+            random.choice(eligible_users)
+        scan_rate = picks / (time.perf_counter() - start)
+
+        index = GuildRobIndex()
+        for member in members:
+            if not member.bot:
+                index.set(member.id, balances[member.id])
+
+        start = time.perf_counter()
+        for _ in range(picks * 100):
+            index.pick(robber_id)
+        uniform_rate = picks * 100 / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(picks * 100):
+            index.pick_weighted(robber_id)
+        weighted_rate = picks * 100 / (time.perf_counter() - start)
+
+        print(
+            f"{size:>7,} members: scan={scan_rate:>10,.0f} picks/sec  "
+            f"uniform={uniform_rate:>12,.0f} picks/sec  weighted={weighted_rate:>12,.0f} picks/sec"
+        )
+
+
+if __name__ == "__main__":
+    benchmark()
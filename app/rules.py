@@ -0,0 +1,65 @@
+import os
+
+# ゲームのルールと配当表（ボットのコマンドとシミュレーターの両方から参照する）
+
+# ==============================================================================================
+
+# ルーレット: 賭け方ごとの配当倍率（賭け金を含む払い戻し額の倍率）
+ROULETTE_PAYOUTS = {
+    "even": 2,
+    "odd": 2,
+    "small": 3,
+    "medium": 3,
+    "large": 3,
+    "first": 2,
+    "second": 2,
+    "number": 36,
+}
+
+# ルーレット: 賭け方ごとの当たりのポケット（"number"は選んだ数字のみが当たり）
+# 偶数の判定は result % 2 == 0 なので、0は"even"の当たりになる
+ROULETTE_POCKETS = {
+    "even": frozenset(range(0, 37, 2)),
+    "odd": frozenset(range(1, 37, 2)),
+    "small": frozenset(range(1, 13)),
+    "medium": frozenset(range(13, 25)),
+    "large": frozenset(range(25, 37)),
+    "first": frozenset(range(1, 19)),
+    "second": frozenset(range(19, 37)),
+}
+
+ROULETTE_POCKET_COUNT = 37  # 0～36
+
+# ルーレット: 配当表の列（範囲の賭け方と、"number:7" のように数字ごとの列）
+ROULETTE_BETS = tuple(ROULETTE_POCKETS) + tuple(f"number:{n}" for n in range(ROULETTE_POCKET_COUNT))
+ROULETTE_COLUMNS = {bet: column for column, bet in enumerate(ROULETTE_BETS)}
+
+# ルーレット: ポケット × 列の払い戻し倍率（外れは0）
+# 1回のスピンはポケットの行を1度引くだけで、すべての賭けの払い戻しが決まる
+ROULETTE_TABLE = tuple(
+    tuple(
+        ROULETTE_PAYOUTS["number"] if bet == f"number:{pocket}"
+        else ROULETTE_PAYOUTS[bet] if pocket in ROULETTE_POCKETS.get(bet, ())
+        else 0
+        for bet in ROULETTE_BETS
+    )
+    for pocket in range(ROULETTE_POCKET_COUNT)
+)
+
+
+# 賭け方（と"number"の場合は数字）から配当表の列を求める
+def roulette_column(option, number=None):
+    return ROULETTE_COLUMNS[f"number:{number}" if option == "number" else option]
+
+# ----------------------------------------------------------------------------------------------
+
+# ブラックジャック: 配当倍率（賭け金は開始時に差し引き済みで、賭け金を含む払い戻し額の倍率）
+BLACKJACK_NATURAL_PAYOUT = 2.5  # 最初の2枚で21（ディーラーが21でない場合）
+BLACKJACK_WIN_PAYOUT = 2        # 通常の勝ち
+BLACKJACK_DRAW_PAYOUT = 1       # 引き分け（賭け金を払い戻す）
+
+DEALER_STAND_VALUE = 17  # ディーラーはこの点数未満の間カードを引く
+
+# シュー: チャンネルごとに使い回すデッキの組数と、シャッフルし直すまでに配る割合（ペネトレーション）
+SHOE_DECKS = int(os.getenv("SHOE_DECKS", "6"))
+SHOE_PENETRATION = float(os.getenv("SHOE_PENETRATION", "0.75"))
@@ -1,16 +1,128 @@
-from threading import Thread
-from fastapi import FastAPI
+import asyncio
+import contextlib
+import os
+import secrets
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
 import uvicorn
 
+from metrics import CONTENT_TYPE, REGISTRY, slow_commands
+
+PORT = int(os.getenv("PORT", "8080"))
+HEARTBEAT_INTERVAL = 1.0                              # イベントループの遅延を測る間隔（秒）
+READY_MAX_LAG = float(os.getenv("READY_MAX_LAG", "0.5"))  # これ以上遅れている間はリクエストを受けられない（/readyz が503）とみなす
+LIVE_MAX_LAG = float(os.getenv("LIVE_MAX_LAG", "10"))     # これ以上遅れたら止まっている（/livez が503）とみなす
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN")                    # /debug/ のページを見るためのトークン（未設定ならページ自体を公開しない）
+
+# ==============================================================================================
+
+# ボットの状態
+# イベントループの遅延は、一定間隔で眠るタスクが予定よりどれだけ遅れて起きたかで測る
+# /readyz はchecksに登録した確認（Gatewayへの接続・コマンドの同期など）がすべて通り、遅延が小さい場合だけ200を返す
+class Health:
+    def __init__(self, interval=HEARTBEAT_INTERVAL):
+        self.interval = interval
+        self.lag = 0.0          # 直近の遅延（秒）
+        self.last_beat = None   # 最後に測った時刻（time.monotonic()）
+        self.checks = {}        # 名前 -> 準備ができていればTrueを返す関数
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._heartbeat())
+
+    async def _heartbeat(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.last_beat = time.monotonic()
+            self.lag = max(0.0, self.last_beat - start - self.interval)
+
+    # 最後に測ってからの経過も遅延に含める（ループが止まっている間は測れないため）
+    def current_lag(self, now=None):
+        if self.last_beat is None:
+            return self.lag
+        now = time.monotonic() if now is None else now
+        return max(self.lag, now - self.last_beat - self.interval)
+
+    def live(self):
+        lag = self.current_lag()
+        return lag < LIVE_MAX_LAG, {"loop_lag": lag}
+
+    def ready(self):
+        lag = self.current_lag()
+        checks = {"heartbeat": self.last_beat is not None, "loop_lag": lag < READY_MAX_LAG}
+        for name, check in self.checks.items():
+            try:
+                checks[name] = bool(check())
+            except Exception as e:
+                print(f"Readiness check {name} failed: {e}")
+                checks[name] = False
+        return all(checks.values()), {"loop_lag": lag, "checks": checks}
+
+
+health = Health()
+REGISTRY.gauge("event_loop_lag_seconds", "Event loop lag measured by the heartbeat task.", health.current_lag)
+
+# ==============================================================================================
+
 app = FastAPI()
 
 @app.get("/")
 async def root():
     return {"message": "Server is running."}
 
-def start():
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+# イベントループが動いているか（止まっている場合はこのリクエスト自体に応答できない）
+@app.get("/livez")
+async def livez():
+    ok, details = health.live()
+    return JSONResponse({"live": ok, **details}, status_code=200 if ok else 503)
+
+# Discordからのイベントを処理できる状態か
+@app.get("/readyz")
+async def readyz():
+    ok, details = health.ready()
+    return JSONResponse({"ready": ok, **details}, status_code=200 if ok else 503)
+
+# Prometheus形式の計測値
+@app.get("/metrics")
+async def metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+# /debug/ のページはユーザーIDやコマンドの引数を含むため、DEBUG_TOKENを "Authorization: Bearer <トークン>" で
+# 渡したリクエストにだけ返す（トークンが未設定、または一致しない場合はページがないものとして404を返す）
+def debug_allowed(request):
+    if not DEBUG_TOKEN:
+        return False
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and secrets.compare_digest(token.encode(), DEBUG_TOKEN.encode())
+
+
+# 最近の遅いコマンド（引数・最初の応答までの時間・REST呼び出しの時間）
+@app.get("/debug/slow_commands")
+async def debug_slow_commands(request: Request):
+    if not debug_allowed(request):
+        return JSONResponse({"detail": "Not Found"}, status_code=404)
+    return list(slow_commands)
+
+# ----------------------------------------------------------------------------------------------
+
+# ボットのイベントループ上で動かすサーバー（別スレッドを立てない）
+# シグナルはdiscord.pyの終了処理に任せるため、uvicornのシグナルハンドラは登録しない
+class EmbeddedServer(uvicorn.Server):
+    def capture_signals(self):
+        return contextlib.nullcontext()
+
+
+async def serve(port=PORT):
+    server = EmbeddedServer(uvicorn.Config(app, host="0.0.0.0", port=port, lifespan="off", log_level="warning"))
+    try:
+        await server.serve()
+    except SystemExit:
+        # ポートが使用中などで起動できない場合、uvicornはsys.exit()するが、ボットは止めない
+        print(f"Failed to start the HTTP server on port {port}")
+
 
-def server_thread():
-    thread = Thread(target=start)
-    thread.start()
\ No newline at end of file
+def start_server(port=PORT):
+    return asyncio.create_task(serve(port))
@@ -0,0 +1,245 @@
+import asyncio
+import os
+import time
+
+IDLE_TIMEOUT = float(os.getenv("BLACKJACK_IDLE_TIMEOUT", "300"))   # 操作がないゲームを終了するまでの秒数
+TIMEOUT_POLICY = os.getenv("BLACKJACK_TIMEOUT_POLICY", "stand")    # 期限切れのゲームの扱い: "stand"（自動スタンド）/ "refund"（賭け金を返す）
+MAX_SESSIONS = int(os.getenv("MAX_BLACKJACK_SESSIONS", "10000"))   # 同時に保持するゲーム数の上限
+TICK = 1.0          # タイマーの刻み（秒）
+WHEEL_SLOTS = 64    # 1段あたりのスロット数
+WHEEL_LEVELS = 3    # 段数（64 * 64 * 64 刻みまでの期限を扱える）
+
+# ==============================================================================================
+
+# 階層型タイマーホイール
+# 期限までの刻み数に応じた段のスロットに入れ、1刻みごとに最下段の1スロットだけを処理する
+# 上の段のスロットは下の段が1周するたびに下の段へ振り分け直す（登録・取消・1刻みの処理がO(1)）
+class TimerWheel:
+    def __init__(self, slots=WHEEL_SLOTS, levels=WHEEL_LEVELS):
+        self.slots = slots
+        self.levels = levels
+        self.now = 0        # 現在の刻み
+        self._wheels = [[{} for _ in range(slots)] for _ in range(levels)]  # スロット: key -> 期限の刻み
+        self._timers = {}   # key -> (段, スロット)
+
+    def __len__(self):
+        return len(self._timers)
+
+    # ticks刻み後に期限を迎えるよう登録する（登録済みの場合は置き換える）
+    def schedule(self, key, ticks):
+        self.cancel(key)
+        self._insert(key, self.now + max(1, ticks))
+
+    def cancel(self, key):
+        position = self._timers.pop(key, None)
+        if position is not None:
+            level, slot = position
+            del self._wheels[level][slot][key]
+
+    def _insert(self, key, expiry):
+        distance = expiry - self.now
+        level = 0
+        span = self.slots
+        while distance >= span and level < self.levels - 1:
+            level += 1
+            span *= self.slots
+        # 範囲外の期限は最上段の最後のスロットに入れ、振り分け直す時に入れ直す
+        position = min(expiry, self.now + span - 1)
+        slot = (position // (span // self.slots)) % self.slots
+        self._wheels[level][slot][key] = expiry
+        self._timers[key] = (level, slot)
+
+    # 1刻み進め、期限を迎えたkeyのリストを返す
+    def advance(self):
+        self.now += 1
+        # 下の段が1周したら、上の段の該当スロットを振り分け直す
+        span = 1
+        for level in range(1, self.levels):
+            span *= self.slots
+            if self.now % span:
+                break
+            bucket = self._wheels[level][(self.now // span) % self.slots]
+            entries = list(bucket.items())
+            bucket.clear()
+            for key, expiry in entries:
+                del self._timers[key]
+                if expiry <= self.now:
+                    self._wheels[0][self.now % self.slots][key] = expiry
+                    self._timers[key] = (0, self.now % self.slots)
+                else:
+                    self._insert(key, expiry)
+        bucket = self._wheels[0][self.now % self.slots]
+        expired = list(bucket)
+        bucket.clear()
+        for key in expired:
+            del self._timers[key]
+        return expired
+
+# ----------------------------------------------------------------------------------------------
+
+# 放置されたゲームを自動で終了するセッションストア（チャンネルID -> ゲーム状態）
+# get() や [] で参照するたびに期限が延び、最後の操作からtimeout秒経つとon_expireが呼ばれる
+# 期限の確認はタイマーホイール1つと1つのタスクでまとめて行う（ゲームごとに待機タスクを作らない）
+class SessionStore:
+    def __init__(self, timeout=IDLE_TIMEOUT, capacity=MAX_SESSIONS, tick=TICK, on_expire=None):
+        self.timeout = timeout
+        self.capacity = capacity
+        self.tick = tick
+        self.on_expire = on_expire  # async def on_expire(key, game)
+        self.wheel = TimerWheel()
+        self._sessions = {}   # key -> ゲーム状態
+        self._deadlines = {}  # key -> 最終操作からの期限（time.monotonic()）
+        self._timeouts = {}   # key -> 操作がない場合に終了するまでの秒数
+        self._task = None
+        self.counters = {"created": 0, "finished": 0, "expired": 0, "rejected": 0}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, key):
+        return key in self._sessions
+
+    def __iter__(self):
+        return iter(self._sessions)
+
+    def values(self):
+        return self._sessions.values()
+
+    def __getitem__(self, key):
+        game = self._sessions[key]
+        self.touch(key)
+        return game
+
+    def get(self, key, default=None):
+        game = self._sessions.get(key)
+        if game is None:
+            return default
+        self.touch(key)
+        return game
+
+    def full(self):
+        return len(self._sessions) >= self.capacity
+
+    # ゲームを登録する（上限に達している場合は登録せずFalseを返す）
+    # 登録済みのkeyに対して呼ぶと、ゲームと待ち時間を置き換えて期限を延ばす
+    # timeout: このゲームだけ待ち時間を変える場合の秒数
+    def add(self, key, game, timeout=None):
+        if key not in self._sessions:
+            if len(self._sessions) >= self.capacity:
+                self.counters["rejected"] += 1
+                return False
+            self.counters["created"] += 1
+        timeout = timeout or self.timeout
+        self._sessions[key] = game
+        self._timeouts[key] = timeout
+        self._deadlines[key] = time.monotonic() + timeout
+        self.wheel.schedule(key, self._ticks(timeout))
+        return True
+
+    # 期限を延ばす（タイマーは動かさず、期限を迎えた時に残り時間で登録し直す）
+    def touch(self, key):
+        if key in self._deadlines:
+            self._deadlines[key] = time.monotonic() + self._timeouts[key]
+
+    # ゲームの終了時に呼ぶ
+    def pop(self, key, default=None):
+        game = self._sessions.pop(key, None)
+        if game is None:
+            return default
+        del self._deadlines[key]
+        del self._timeouts[key]
+        self.wheel.cancel(key)
+        self.counters["finished"] += 1
+        return game
+
+    def __delitem__(self, key):
+        if self.pop(key) is None:
+            raise KeyError(key)
+
+    def _ticks(self, seconds):
+        return max(1, -int(-seconds // self.tick))
+
+    # ----------------------------------------------------------------------------------------------
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._tick_loop())
+
+    async def _tick_loop(self):
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.tick
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            self.expire(time.monotonic())
+
+    # 期限を迎えたゲームを取り除いてon_expireを呼ぶ（取り除いたkeyを返す）
+    def expire(self, now):
+        expired = []
+        for key in self.wheel.advance():
+            remaining = self._deadlines[key] - now
+            if remaining > 0:
+                # 期限切れまでの間に操作があった場合は残り時間で登録し直す
+                self.wheel.schedule(key, self._ticks(remaining))
+                continue
+            game = self._sessions.pop(key)
+            del self._deadlines[key]
+            del self._timeouts[key]
+            self.counters["expired"] += 1
+            expired.append(key)
+            if self.on_expire is not None:
+                asyncio.create_task(self._run_expire(key, game))
+        return expired
+
+    async def _run_expire(self, key, game):
+        try:
+            await self.on_expire(key, game)
+        except Exception as e:
+            print(f"Failed to expire blackjack session {key}: {e}")
+
+    def stats(self):
+        return {"live": len(self._sessions), **self.counters}
+
+# ==============================================================================================
+
+# ベンチマーク: ゲームごとに待機タスクを作る方式とタイマーホイールのメモリ使用量・処理時間を比較する
+async def _benchmark(sessions=100_000):
+    import tracemalloc
+
+    async def idle_timeout():
+        await asyncio.sleep(IDLE_TIMEOUT)
+
+    tracemalloc.start()
+    tasks = [asyncio.create_task(idle_timeout()) for _ in range(sessions)]
+    await asyncio.sleep(0)
+    task_bytes = tracemalloc.get_traced_memory()[0]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    del tasks
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    store = SessionStore(timeout=IDLE_TIMEOUT, capacity=sessions)
+    for key in range(sessions):
+        store.add(key, None)
+    store_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # 全ゲームが期限切れになるまで刻みを進める（時刻は仮想的に進める）
+    now = time.monotonic()
+    start = time.perf_counter()
+    ticks = 0
+    while len(store):
+        now += store.tick
+        store.expire(now)
+        ticks += 1
+    elapsed = time.perf_counter() - start
+
+    print(f"{sessions:,} sessions")
+    print(f"  task per game: {task_bytes / sessions:8.0f} bytes/session")
+    print(f"  timer wheel:   {store_bytes / sessions:8.0f} bytes/session (including the store)")
+    print(f"  expired {store.counters['expired']:,} sessions over {ticks} ticks in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(_benchmark())
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+
+# シャード構成
+#   SHARD_COUNT: 全体のシャード数（未設定の場合、ランチャーはDiscordの推奨数を使う）
+#   SHARD_IDS:   このプロセスが受け持つシャード（"0-3" や "0,2,4" の形式。未設定なら全シャード）
+#   SHARD_WORKERS: ランチャーが起動するワーカープロセス数
+# どれも未設定の場合は、これまでどおり1つの接続で動かす
+SHARD_COUNT = os.getenv("SHARD_COUNT")
+SHARD_IDS = os.getenv("SHARD_IDS")
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", str(os.cpu_count() or 1)))
+RESTART_DELAY = 5.0  # 異常終了したワーカーを再起動するまでの待ち時間（秒）
+
+# ==============================================================================================
+
+# "0-3,6" -> [0, 1, 2, 3, 6]
+def parse_shard_ids(text):
+    shard_ids = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-")
+            shard_ids.extend(range(int(first), int(last) + 1))
+        else:
+            shard_ids.append(int(part))
+    return sorted(set(shard_ids))
+
+
+# シャード構成を指定していればAutoShardedBotに渡す引数を返す（指定がなければNone）
+def shard_options():
+    if SHARD_COUNT is None and SHARD_IDS is None:
+        return None
+    options = {}
+    if SHARD_COUNT is not None:
+        options["shard_count"] = int(SHARD_COUNT)
+    if SHARD_IDS is not None:
+        if SHARD_COUNT is None:
+            raise ValueError("SHARD_IDS requires SHARD_COUNT")
+        options["shard_ids"] = parse_shard_ids(SHARD_IDS)
+    return options
+
+
+# シャードをワーカーごとの連続した範囲に分ける（0-3, 4-7, ...）
+def split_shards(shard_count, workers):
+    workers = max(1, min(workers, shard_count))
+    ranges = []
+    start = 0
+    for i in range(workers):
+        size = shard_count // workers + (1 if i < shard_count % workers else 0)
+        ranges.append((start, start + size - 1))
+        start += size
+    return ranges
+
+# ----------------------------------------------------------------------------------------------
+
+# Discordが推奨するシャード数を取得する
+async def recommended_shards(token):
+    async with aiohttp.ClientSession() as session:
+        async with session.get("https://discord.com/api/v10/gateway/bot", headers={"Authorization": f"Bot {token}"}) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+# ==============================================================================================
+
+# ランチャー: シャードを分けてワーカー（main.py）を起動し、異常終了したワーカーは再起動する
+# すべてのワーカーは同じDB（LEDGER_PATH）を共有モードで使う
+# 使い方: python shards.py [ワーカー数]
+def launch(workers=SHARD_WORKERS):
+    load_dotenv()
+    shard_count = int(SHARD_COUNT) if SHARD_COUNT is not None else asyncio.run(recommended_shards(os.getenv("TOKEN")))
+    ranges = split_shards(shard_count, workers)
+    main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+    def spawn(first, last):
+        env = dict(os.environ, SHARD_COUNT=str(shard_count), SHARD_IDS=f"{first}-{last}", LEDGER_SHARED="1")
+        print(f"Starting worker for shards {first}-{last} of {shard_count}")
+        return subprocess.Popen([sys.executable, main_path], env=env)
+
+    processes = {shard_range: spawn(*shard_range) for shard_range in ranges}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            process.send_signal(signal.SIGINT)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while processes:
+        time.sleep(1.0)
+        for shard_range, process in list(processes.items()):
+            code = process.poll()
+            if code is None:
+                continue
+            if stopping or code == 0:
+                del processes[shard_range]
+                continue
+            print(f"Worker for shards {shard_range[0]}-{shard_range[1]} exited with {code}; restarting in {RESTART_DELAY:.0f} s")
+            time.sleep(RESTART_DELAY)
+            processes[shard_range] = spawn(*shard_range)
+
+
+if __name__ == "__main__":
+    launch(int(sys.argv[1]) if len(sys.argv) > 1 else SHARD_WORKERS)
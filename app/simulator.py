@@ -0,0 +1,194 @@
+import argparse
+import time
+
+import numpy as np
+
+from cards import CARD_VALUES
+from rules import (
+    BLACKJACK_DRAW_PAYOUT,
+    BLACKJACK_NATURAL_PAYOUT,
+    BLACKJACK_WIN_PAYOUT,
+    DEALER_STAND_VALUE,
+    ROULETTE_PAYOUTS,
+    ROULETTE_POCKET_COUNT,
+    ROULETTE_TABLE,
+    SHOE_DECKS,
+    SHOE_PENETRATION,
+    roulette_column,
+)
+
+# ゲームの配当が経済に与える影響を調べるモンテカルロシミュレーター
+# 結果は賭け金1あたりの純損益（期待値と分散）で表す
+# 使い方: python app/simulator.py --spins 10000000 --hands 1000000
+
+CARD_POINTS = np.array(CARD_VALUES, dtype=np.int8)
+DEALT_CARDS = 24           # 1ゲームで使う可能性のあるカードの最大枚数（シューの配る位置から使う）
+SHOES = 2_000              # 並べて進めるシューの数（1つのシューで多くのゲームを続けて配り、シューの序盤に偏らないようにする）
+NUMBER_BET = 17            # "number"で賭ける数字（どの数字でも確率は同じ）
+STAND_VALUES = range(12, 18)  # 比較するプレイヤーの戦略（この点数以上でスタンド）
+ROULETTE_BATCH = 5_000_000
+
+# ==============================================================================================
+
+# ルーレット: ポケット × 賭け方の純損益表（ボットと同じ配当表の払い戻し倍率から賭け金の1を引く）
+def roulette_table():
+    options = list(ROULETTE_PAYOUTS)
+    columns = [roulette_column(option, NUMBER_BET) for option in options]
+    table = np.array(ROULETTE_TABLE, dtype=np.float64)[:, columns] - 1
+    return options, table
+
+
+def simulate_roulette(spins, rng):
+    options, table = roulette_table()
+    counts = np.zeros(ROULETTE_POCKET_COUNT, dtype=np.int64)
+    remaining = spins
+    while remaining > 0:
+        size = min(remaining, ROULETTE_BATCH)
+        counts += np.bincount(rng.integers(0, ROULETTE_POCKET_COUNT, size), minlength=ROULETTE_POCKET_COUNT)
+        remaining -= size
+    # 各スピンの損益はポケットだけで決まるので、出現回数で重み付けして集計する
+    mean = counts @ table / spins
+    variance = counts @ (table ** 2) / spins - mean ** 2
+    return {option: (mean[i], variance[i]) for i, option in enumerate(options)}
+
+# ==============================================================================================
+
+# ボットと同じシュー（SHOE_DECKS組のデッキ）をn個並べ、行ごとにゲームを続けて配る
+# cards.Shoe と同じく、ペネトレーション（SHOE_PENETRATION）を超えた行だけ次のゲームの前にシャッフルし直す
+# （ゲームの途中で使い切る場合、ボットは捨て札だけをシャッフルして補充するが、ここではその行を先にシャッフルし直す。
+#   既定のデッキ数・ペネトレーションでは起こらない）
+class ShoeRows:
+    def __init__(self, rng, n, decks=SHOE_DECKS, penetration=SHOE_PENETRATION):
+        self.rng = rng
+        self.cards = rng.permuted(np.tile(np.arange(52, dtype=np.int8), (n, decks)), axis=1)
+        self.cursor = np.zeros(n, dtype=np.int64)
+        self.cut = int(self.cards.shape[1] * penetration)
+
+    # 各行の次のゲームで使うカード（配る位置からDEALT_CARDS枚）を返す
+    def next_round(self):
+        reshuffle = (self.cursor >= self.cut) | (self.cursor > self.cards.shape[1] - DEALT_CARDS)
+        if reshuffle.any():
+            self.cards[reshuffle] = self.rng.permuted(self.cards[reshuffle], axis=1)
+            self.cursor[reshuffle] = 0
+        return np.take_along_axis(self.cards, self.cursor[:, None] + np.arange(DEALT_CARDS), axis=1)
+
+    # ゲームで配った枚数だけ各行の位置を進める
+    def advance(self, used):
+        self.cursor += used
+
+
+# mask の行の手札に次のカードを加える（合計点と11として数えているAの枚数を更新）
+def _draw(deck, rows, position, total, soft_aces, mask):
+    points = np.where(mask, CARD_POINTS[deck[rows, np.minimum(position, DEALT_CARDS - 1)]], 0)
+    total += points
+    soft_aces += points == 11
+    position += mask
+    # Aを1として扱う場合の調整（1枚加えるごとに最大2回）
+    for _ in range(2):
+        adjust = (total > 21) & (soft_aces > 0)
+        total -= 10 * adjust
+        soft_aces -= adjust
+
+
+def _hand(deck, first, second):
+    points = CARD_POINTS[deck[:, first]].astype(np.int16) + CARD_POINTS[deck[:, second]]
+    soft_aces = (CARD_POINTS[deck[:, first]] == 11).astype(np.int16) + (CARD_POINTS[deck[:, second]] == 11)
+    adjust = (points > 21) & (soft_aces > 0)  # A, A
+    return points - 10 * adjust, soft_aces - adjust
+
+
+# シューの各行でブラックジャックを1回ずつまとめて行い、賭け金1あたりの純損益を返す
+# stand_value以上でスタンドする戦略、またはdouble_down=Trueの場合は最初に1枚だけ引いて賭け金を倍にする戦略
+def _blackjack_round(shoes, stand_value, double_down):
+    deck = shoes.next_round()
+    n = len(deck)
+    rows = np.arange(n)
+    player, player_soft = _hand(deck, 0, 1)
+    dealer, dealer_soft = _hand(deck, 2, 3)
+    position = np.full(n, 4)
+
+    natural = player == 21
+    playing = ~natural
+
+    # プレイヤーのターン
+    if double_down:
+        _draw(deck, rows, position, player, player_soft, playing)
+    else:
+        while True:
+            hit = playing & (player < stand_value)
+            if not hit.any():
+                break
+            _draw(deck, rows, position, player, player_soft, hit)
+    busted = playing & (player > 21)
+
+    # ディーラーのターン（バーストしていないプレイヤーがいる場合のみ）
+    dealer_turn = playing & ~busted
+    while True:
+        hit = dealer_turn & (dealer < DEALER_STAND_VALUE)
+        if not hit.any():
+            break
+        _draw(deck, rows, position, dealer, dealer_soft, hit)
+
+    # 勝敗判定（賭け金は開始時に差し引き済み）
+    win = dealer_turn & ((dealer > 21) | (player > dealer))
+    draw = dealer_turn & (player == dealer)
+    payout = np.zeros(n)
+    payout[win] = BLACKJACK_WIN_PAYOUT
+    payout[draw] = BLACKJACK_DRAW_PAYOUT
+    payout[natural] = np.where(dealer[natural] == 21, BLACKJACK_DRAW_PAYOUT, BLACKJACK_NATURAL_PAYOUT)
+
+    shoes.advance(position)
+    bet = np.where(playing, 2 if double_down else 1, 1)
+    return payout * bet - bet
+
+
+def simulate_blackjack(hands, rng):
+    strategies = [(f"stand on {value}", value, False) for value in STAND_VALUES]
+    strategies.append(("double down", 0, True))
+    results = {}
+    for name, stand_value, double_down in strategies:
+        shoes = ShoeRows(rng, min(hands, SHOES))
+        total = 0.0
+        total_squares = 0.0
+        remaining = hands
+        while remaining > 0:
+            outcome = _blackjack_round(shoes, stand_value, double_down)[:remaining]
+            size = len(outcome)
+            total += outcome.sum()
+            total_squares += (outcome ** 2).sum()
+            remaining -= size
+        mean = total / hands
+        results[name] = (mean, total_squares / hands - mean ** 2)
+    return results
+
+# ==============================================================================================
+
+# シミュレーションを実行して結果の行を返す（CLIと/oddsコマンドで共通）
+def run(spins, hands, seed=None):
+    rng = np.random.default_rng(seed)
+    lines = []
+
+    start = time.perf_counter()
+    roulette = simulate_roulette(spins, rng)
+    elapsed = time.perf_counter() - start
+    lines.append(f"Roulette ({spins:,} spins, {spins / elapsed:,.0f} spins/sec)")
+    for option, (mean, variance) in roulette.items():
+        lines.append(f"  {option:<14} EV {mean:+.4f}  variance {variance:10.4f}")
+
+    start = time.perf_counter()
+    blackjack = simulate_blackjack(hands, rng)
+    elapsed = time.perf_counter() - start
+    rate = hands * len(blackjack) / elapsed
+    lines.append(f"Blackjack ({hands:,} hands per strategy, {rate:,.0f} hands/sec)")
+    for strategy, (mean, variance) in blackjack.items():
+        lines.append(f"  {strategy:<14} EV {mean:+.4f}  variance {variance:10.4f}")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate the expected value of each roulette bet and blackjack strategy.")
+    parser.add_argument("--spins", type=int, default=10_000_000, help="number of roulette spins")
+    parser.add_argument("--hands", type=int, default=1_000_000, help="number of blackjack hands per strategy")
+    parser.add_argument("--seed", type=int, default=None, help="random seed")
+    args = parser.parse_args()
+    print("\n".join(run(args.spins, args.hands, args.seed)))
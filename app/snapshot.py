@@ -0,0 +1,163 @@
+import json
+import mmap
+import os
+import random
+import struct
+import tempfile
+import time
+
+# スナップショットの形式:
+#   ヘッダー (32バイト): マジック, バージョン, レコード長, レコード数, スナップショットID
+#   レコード (32バイト固定長, user_id昇順): user_id, 所持金, 日次報酬の受け取り回数, 最終受取日, 最終強奪日
+# 日付はJSTの日付序数で、未設定は0
+MAGIC = b"ECSN"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQ16s")
+RECORD = struct.Struct("<qqiii4x")
+NO_DAY = 0
+
+# ==============================================================================================
+
+# レコードをuser_id順に並べてスナップショットを書き出す（一時ファイルに書いてから置き換える）
+def write_snapshot(path, rows, snapshot_id):
+    rows = sorted(rows)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, len(rows), snapshot_id))
+        buffer = bytearray(RECORD.size * len(rows))
+        for i, (user_id, balance, daily_count, last_daily, last_rob) in enumerate(rows):
+            RECORD.pack_into(
+                buffer, i * RECORD.size,
+                user_id, balance, daily_count,
+                NO_DAY if last_daily is None else last_daily,
+                NO_DAY if last_rob is None else last_rob
+            )
+        f.write(buffer)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+# ----------------------------------------------------------------------------------------------
+
+def _decode(record):
+    user_id, balance, daily_count, last_daily, last_rob = record
+    return (
+        user_id, balance, daily_count,
+        None if last_daily == NO_DAY else last_daily,
+        None if last_rob == NO_DAY else last_rob
+    )
+
+# ----------------------------------------------------------------------------------------------
+
+# メモリマップしたスナップショット: 全件を読み込まずに1ユーザー分を二分探索で引ける
+class Snapshot:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError("Snapshot file is empty.")
+        magic, version, record_size, count, snapshot_id = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            self.close()
+            raise ValueError("Unsupported snapshot format.")
+        if len(self._mm) != HEADER.size + record_size * count:
+            self.close()
+            raise ValueError("Snapshot file is truncated.")
+        self.count = count
+        self.snapshot_id = snapshot_id
+        # レコードの先頭（user_id）をint64の配列として参照する
+        self._ids = memoryview(self._mm)[HEADER.size:].cast("q")
+        self._stride = RECORD.size // 8
+
+    def __len__(self):
+        return self.count
+
+    # user_idのレコードを二分探索で探す（見つからない場合はNone）
+    def lookup(self, user_id):
+        ids = self._ids
+        stride = self._stride
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ids[mid * stride] < user_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and ids[lo * stride] == user_id:
+            return _decode(RECORD.unpack_from(self._mm, HEADER.size + lo * RECORD.size))
+        return None
+
+    # start番目からstop番目までのレコードを順に返す
+    def records(self, start=0, stop=None):
+        stop = self.count if stop is None else min(stop, self.count)
+        begin = HEADER.size + start * RECORD.size
+        end = HEADER.size + stop * RECORD.size
+        for record in RECORD.iter_unpack(self._mm[begin:end]):
+            yield _decode(record)
+
+    def close(self):
+        if getattr(self, "_ids", None) is not None:
+            self._ids.release()
+            self._ids = None
+        self._mm.close()
+        self._file.close()
+
+# ==============================================================================================
+
+# ベンチマーク: JSONの読み込みとスナップショットの読み込み時間を比較する
+def _generate_rows(users):
+    rows = []
+    for i in range(users):
+        rows.append((
+            100000000000000000 + i * 7919,
+            random.randint(-500, 100000),
+            random.randint(0, 400),
+            random.choice((None, 739000 + random.randint(0, 30))),
+            random.choice((None, 739000 + random.randint(0, 30)))
+        ))
+    return rows
+
+
+def benchmark(sizes=(10_000, 100_000, 1_000_000)):
+    with tempfile.TemporaryDirectory() as tmp:
+        for users in sizes:
+            rows = _generate_rows(users)
+            json_path = os.path.join(tmp, "economy.json")
+            snap_path = os.path.join(tmp, "economy.snap")
+            with open(json_path, "w") as f:
+                json.dump({str(row[0]): row[1:] for row in rows}, f)
+            write_snapshot(snap_path, rows, os.urandom(16))
+            probe = rows[users // 2][0]
+
+            # JSON: 全件を解析して辞書を作るまで1件も引けない
+            start = time.perf_counter()
+            with open(json_path) as f:
+                data = {int(k): v for k, v in json.load(f).items()}
+            data[probe]
+            json_time = time.perf_counter() - start
+
+            # スナップショット: 開いてすぐに1件引ける
+            start = time.perf_counter()
+            snapshot = Snapshot(snap_path)
+            snapshot.lookup(probe)
+            first_time = time.perf_counter() - start
+
+            # スナップショット: 全件を辞書に読み込む
+            start = time.perf_counter()
+            balances = {record[0]: record[1] for record in snapshot.records()}
+            full_time = time.perf_counter() - start
+            snapshot.close()
+
+            print(
+                f"{users:>9,} users: json={json_time * 1000:8.1f} ms  "
+                f"snapshot first lookup={first_time * 1000:6.3f} ms  "
+                f"snapshot full load={full_time * 1000:8.1f} ms"
+            )
+            del data, balances
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,292 @@
+import json
+import os
+import sys
+import time
+from functools import lru_cache
+
+from cards import CARD_VALUES
+from rules import DEALER_STAND_VALUE, SHOE_DECKS
+
+# ブラックジャックの期待値ソルバー（/hint用）
+# 残りのカード構成から、スタンド・ヒット・ダブルダウンの期待値（賭け金1あたり）を正確に計算する
+# カード構成は点数ごと（2～10, A）の枚数を8ビットずつ詰めた整数のキーで表し、計算結果をメモ化する
+# （10点のカードはデッキ1組に16枚なので、15組までのシューに対応する）
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "strategy_table.json")
+RANK_POINTS = (2, 3, 4, 5, 6, 7, 8, 9, 10, 11)  # 点数ごとの区分（11はA）
+BITS = 8
+MASK = (1 << BITS) - 1
+CACHE_SIZE = 1 << 18
+
+_results = {}  # 状況 -> 期待値（起動時にシャッフル直後のシューの最初の2枚に対する表を読み込み、以降の計算結果も加える）
+# シューの途中の構成は approximate() で近似する（正確な計算は1秒以上かかることがある）
+
+# ==============================================================================================
+
+# カード（0～51）の並びからカード構成のキーを作る
+def composition_key(cards):
+    key = 0
+    for card in cards:
+        key += 1 << (BITS * (CARD_VALUES[card] - 2))
+    return key
+
+
+def _counts(key):
+    return [(key >> (BITS * i)) & MASK for i in range(len(RANK_POINTS))]
+
+
+def _add(total, soft_aces, points):
+    total += points
+    if points == 11:
+        soft_aces += 1
+    while total > 21 and soft_aces:
+        total -= 10
+        soft_aces -= 1
+    return total, soft_aces
+
+
+# (合計点, 11として数えているAの枚数) ごとに、各区分のカードを引いた後の状態を前計算しておく
+# （11として数えられるAは常に1枚以下）
+_STEPS = tuple(
+    tuple(tuple(_add(total, soft_aces, points) for points in RANK_POINTS) for soft_aces in range(2))
+    for total in range(22)
+)
+
+# ----------------------------------------------------------------------------------------------
+
+# ディーラーの最終的な点数の分布 (17, 18, 19, 20, 21, バースト) を返す
+# ディーラーは伏せ札も含めて残りのカード構成から引き、17未満の間引き続ける
+# 引き終わった状態は再帰せずにその場で加算し、メモには引き続ける状態だけを残す
+@lru_cache(maxsize=CACHE_SIZE)
+def dealer_distribution(total, soft_aces, key, remaining):
+    result = [0.0] * 6
+    for i, (next_total, next_soft) in enumerate(_STEPS[total][soft_aces]):
+        count = (key >> (BITS * i)) & MASK
+        if count:
+            probability = count / remaining
+            if next_total > 21:
+                result[5] += probability
+            elif next_total >= DEALER_STAND_VALUE:
+                result[next_total - 17] += probability
+            else:
+                distribution = dealer_distribution(next_total, next_soft, key - (1 << (BITS * i)), remaining - 1)
+                for j in range(6):
+                    result[j] += probability * distribution[j]
+    return tuple(result)
+
+
+# スタンドした場合の期待値
+def stand_ev(player_total, upcard_points, key):
+    if player_total > 21:
+        return -1.0
+    distribution = dealer_distribution(*_add(0, 0, upcard_points), key, sum(_counts(key)))
+    ev = distribution[5]
+    for i, p in enumerate(distribution[:5]):
+        dealer_total = 17 + i
+        if player_total > dealer_total:
+            ev += p
+        elif player_total < dealer_total:
+            ev -= p
+    return ev
+
+
+# 最善の行動（スタンドかヒット）を続けた場合の期待値
+@lru_cache(maxsize=CACHE_SIZE)
+def best_ev(player_total, soft_aces, upcard_points, key):
+    if player_total > 21:
+        return -1.0
+    return max(stand_ev(player_total, upcard_points, key), hit_ev(player_total, soft_aces, upcard_points, key))
+
+
+# 1枚引き、その後も最善の行動を続けた場合の期待値
+@lru_cache(maxsize=CACHE_SIZE)
+def hit_ev(player_total, soft_aces, upcard_points, key):
+    counts = _counts(key)
+    remaining = sum(counts)
+    ev = 0.0
+    for i, count in enumerate(counts):
+        if count:
+            next_total, next_soft = _add(player_total, soft_aces, RANK_POINTS[i])
+            ev += count / remaining * best_ev(next_total, next_soft, upcard_points, key - (1 << (BITS * i)))
+    return ev
+
+
+# 賭け金を倍にして1枚だけ引いた場合の期待値
+def double_ev(player_total, soft_aces, upcard_points, key):
+    counts = _counts(key)
+    remaining = sum(counts)
+    ev = 0.0
+    for i, count in enumerate(counts):
+        if count:
+            next_total, _ = _add(player_total, soft_aces, RANK_POINTS[i])
+            ev += count / remaining * stand_ev(next_total, upcard_points, key - (1 << (BITS * i)))
+    return 2 * ev
+
+# ==============================================================================================
+
+# 手札・ディーラーの表向きのカード・見えていないカード（シューの残りとディーラーの伏せ札）から
+# (スタンド, ヒット, ダブルダウン) の期待値を返す
+def evaluate(hand, upcard, unseen_cards):
+    return evaluate_key(hand.value, hand.soft_aces, CARD_VALUES[upcard], composition_key(unseen_cards))
+
+
+def evaluate_key(player_total, soft_aces, upcard_points, key):
+    situation = (player_total, soft_aces, upcard_points, key)
+    result = _results.get(situation)
+    if result is None:
+        result = (
+            stand_ev(player_total, upcard_points, key),
+            hit_ev(player_total, soft_aces, upcard_points, key),
+            double_ev(player_total, soft_aces, upcard_points, key),
+        )
+        if len(_results) < CACHE_SIZE:
+            _results[situation] = result
+    return result
+
+
+# 計算済みの結果があれば返す（なければNone）
+def cached(player_total, soft_aces, upcard_points, key):
+    return _results.get((player_total, soft_aces, upcard_points, key))
+
+# ----------------------------------------------------------------------------------------------
+
+# 見えていないカードの割合だけで近似した (スタンド, ヒット, ダブルダウン) の期待値
+# 引いたカードで構成が変わらない（引くたびに戻す）とみなすため、状態は (合計点, Aの数) だけになり、1ms未満で求まる
+# シューの途中の構成は計算済みの表にほぼ一致しないので、/hint ではこちらを使う
+# （ペネトレーションまで配っても残りは数十枚以上あり、引いた数枚の影響による誤差は小さい）
+def approximate(player_total, soft_aces, upcard_points, key):
+    counts = _counts(key)
+    remaining = sum(counts)
+    draws = [(count / remaining, i) for i, count in enumerate(counts) if count]
+
+    # ディーラーの (合計点, A) ごとの最終的な点数の分布
+    dealer = {}
+    def distribution(total, soft):
+        result = dealer.get((total, soft))
+        if result is None:
+            result = [0.0] * 6
+            steps = _STEPS[total][soft]
+            for probability, i in draws:
+                next_total, next_soft = steps[i]
+                if next_total > 21:
+                    result[5] += probability
+                elif next_total >= DEALER_STAND_VALUE:
+                    result[next_total - 17] += probability
+                else:
+                    for j, p in enumerate(distribution(next_total, next_soft)):
+                        result[j] += probability * p
+            dealer[(total, soft)] = result
+        return result
+
+    final = distribution(*_add(0, 0, upcard_points))
+    stands = {}
+    def stand(total):
+        if total > 21:
+            return -1.0
+        ev = stands.get(total)
+        if ev is None:
+            ev = final[5]
+            for j, p in enumerate(final[:5]):
+                if total > 17 + j:
+                    ev += p
+                elif total < 17 + j:
+                    ev -= p
+            stands[total] = ev
+        return ev
+
+    bests = {}
+    def hit(total, soft):
+        ev = 0.0
+        for probability, i in draws:
+            ev += probability * best(*_STEPS[total][soft][i])
+        return ev
+    def best(total, soft):
+        if total > 21:
+            return -1.0
+        ev = bests.get((total, soft))
+        if ev is None:
+            ev = bests[(total, soft)] = max(stand(total), hit(total, soft))
+        return ev
+
+    double = 2 * sum(probability * stand(_STEPS[player_total][soft_aces][i][0]) for probability, i in draws)
+    return stand(player_total), hit(player_total, soft_aces), double
+
+# ----------------------------------------------------------------------------------------------
+
+# シャッフル直後のシューから配られた最初の2枚とディーラーの表向きのカードの全組み合わせ
+def _initial_situations(decks=SHOE_DECKS):
+    full = [4 * decks] * 8 + [16 * decks, 4 * decks]
+    for first in range(10):
+        for second in range(first, 10):
+            for up in range(10):
+                counts = list(full)
+                for i in (first, second, up):
+                    counts[i] -= 1
+                if min(counts) < 0:
+                    continue
+                total, soft_aces = _add(0, 0, RANK_POINTS[first])
+                total, soft_aces = _add(total, soft_aces, RANK_POINTS[second])
+                key = sum(count << (BITS * i) for i, count in enumerate(counts))
+                yield total, soft_aces, RANK_POINTS[up], key
+
+
+# 計算済みの期待値表を作って保存する（python app/strategy.py build）
+def build_table(path=TABLE_PATH, decks=SHOE_DECKS):
+    rows = []
+    for situation in _initial_situations(decks):
+        rows.append(list(situation) + [round(ev, 6) for ev in evaluate_key(*situation)])
+    with open(path, "w") as f:
+        json.dump(rows, f, separators=(",", ":"))
+    return len(rows)
+
+
+# 起動時に計算済みの期待値表を読み込む
+def load_table(path=TABLE_PATH):
+    try:
+        with open(path) as f:
+            rows = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Failed to load strategy table: {e}")
+        return 0
+    for total, soft_aces, upcard_points, key, stand, hit, double in rows:
+        _results[(total, soft_aces, upcard_points, key)] = (stand, hit, double)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        start = time.perf_counter()
+        count = build_table()
+        print(f"Built {count} entries in {time.perf_counter() - start:.1f} s")
+    else:
+        # ベンチマーク: 計算済みの表・メモ化済み・初回計算の応答時間
+        load_table()
+        situation = next(_initial_situations())
+        start = time.perf_counter()
+        for _ in range(100_000):
+            evaluate_key(*situation)
+        print(f"cached lookup: {(time.perf_counter() - start) * 10:.2f} us/query")
+        total, soft_aces, upcard_points, key = situation
+        key -= 1 << (BITS * 8)  # 10を1枚減らした（他のプレイヤーが引いた）構成
+        start = time.perf_counter()
+        evaluate_key(total, soft_aces, upcard_points, key)
+        print(f"cold solve: {(time.perf_counter() - start) * 1000:.1f} ms/query")
+
+        # シューの途中の構成（数ラウンド分を配った後）での近似と正確な計算の差
+        from cards import Shoe
+        import random
+        shoe = Shoe(rng=random.Random(1))
+        for _ in range(60):
+            shoe.deal()
+        unseen = shoe.remaining()
+        key = composition_key(unseen[3:] + unseen[1:2])  # 先頭の2枚を手札、3枚目を表向きのカードとする
+        hand_total, hand_soft = _add(*_add(0, 0, CARD_VALUES[unseen[0]]), CARD_VALUES[unseen[2]])
+        situation = (hand_total, hand_soft, CARD_VALUES[unseen[1]], key)
+        start = time.perf_counter()
+        for _ in range(100):
+            approximation = approximate(*situation)
+        print(f"approximation: {(time.perf_counter() - start) * 10:.2f} ms/query")
+        start = time.perf_counter()
+        exact = evaluate_key(*situation)
+        print(f"exact solve of the same composition: {(time.perf_counter() - start) * 1000:.1f} ms/query")
+        print("max EV difference: " + f"{max(abs(a - b) for a, b in zip(approximation, exact)):.4f}")